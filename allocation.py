@@ -0,0 +1,74 @@
+import sqlite3
+from datetime import datetime
+
+import reservations
+
+# First spot in the lot with no live booking overlapping the requested
+# window. A booking starting now also needs the spot to be physically free.
+FIND_SPOT_SQL = f'''
+    SELECT id FROM spots
+    WHERE parking_id = :parking_id
+      AND (:immediate = 0 OR status = 'available')
+      AND id NOT IN ({reservations.BUSY_SPOTS_SQL})
+    LIMIT 1
+'''
+
+
+def claim_spot(conn, parking_id, user_id, vehicle_number, start_time, end_time, now=None):
+    """Atomically allocate a spot in ``parking_id`` for [start_time, end_time).
+
+    Runs under ``BEGIN IMMEDIATE`` so the write lock is taken up front and two
+    bookings can't race for the same spot. Bookings that start now (or in the
+    past) mark the spot occupied straight away; future reservations only
+    hold the time window and the spot is occupied when parking starts.
+    Returns ``(booking_id, spot_id)``, or ``None`` when nothing is free.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        claimed = allocate(conn, parking_id, user_id, vehicle_number, start_time, end_time, now)
+        if claimed:
+            conn.commit()
+        else:
+            conn.rollback()
+        return claimed
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def allocate(conn, parking_id, user_id, vehicle_number, start_time, end_time, now=None):
+    """claim_spot() without the transaction, for callers that already hold the write lock."""
+    now = now or datetime.now().strftime("%Y-%m-%d %H:%M")
+    immediate = start_time <= now
+
+    spot = conn.execute(FIND_SPOT_SQL, {'parking_id': int(parking_id), 'immediate': int(immediate),
+                                        'start': start_time, 'end': end_time}).fetchone()
+    if spot is None:
+        return None
+
+    spot_id = spot[0]
+    if immediate:
+        conn.execute("UPDATE spots SET status = 'occupied' WHERE id = ?", (spot_id,))
+    cursor = conn.execute('''
+        INSERT INTO bookings (user_id, parking_id, spot_id, vehicle_number, start_time, end_time, status)
+        VALUES (?, ?, ?, ?, ?, ?, 'booked')
+    ''', (user_id, parking_id, spot_id, vehicle_number, start_time, end_time))
+    return cursor.lastrowid, spot_id
+
+
+def find_collisions(conn):
+    """Live bookings that overlap an earlier live booking on the same spot.
+
+    Should always be empty. One sorted pass per spot rather than a pairwise
+    self-join, so it stays usable with millions of reservations.
+    """
+    return conn.execute('''
+        SELECT id, spot_id, start_time, prev_end FROM (
+            SELECT id, spot_id, start_time,
+                   MAX(end_time) OVER (PARTITION BY spot_id ORDER BY start_time, id
+                                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS prev_end
+            FROM bookings
+            WHERE status IN ('booked', 'ongoing')
+        )
+        WHERE start_time < prev_end
+    ''').fetchall()
@@ -0,0 +1,209 @@
+"""Versioned JSON API for the mobile app, mounted at /api/v1.
+
+Same session cookie and the same data-access functions as the HTML
+routes, but every action answers in one round trip with a compact JSON
+body instead of a redirect. Lists take ?limit= and a keyset cursor
+(?after= for lots, ?before= for history, returned as "next"); any
+endpoint takes ?fields=a,b,c to trim each object to those keys.
+"""
+import json
+from functools import wraps
+
+from flask import Blueprint, Response, request, session
+
+import archive
+import bookings
+import cache
+import db
+import events
+import passwords
+import reservations
+import search
+import shards
+import user_summary
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MAX_LIMIT = 100
+
+
+def _json(payload, status=200):
+    return Response(json.dumps(payload, separators=(',', ':')), status=status, mimetype='application/json')
+
+
+def _error(message, status):
+    return _json({'error': message}, status)
+
+
+def _fields():
+    fields = request.args.get('fields')
+    return {field.strip() for field in fields.split(',') if field.strip()} if fields else None
+
+
+def _item(row, fields=None):
+    item = dict(row)
+    return {key: value for key, value in item.items() if key in fields} if fields else item
+
+
+def _page(rows, next_cursor=None):
+    fields = _fields()
+    return _json({'items': [_item(row, fields) for row in rows], 'next': next_cursor})
+
+
+def _limit(default=search.DEFAULT_LIMIT):
+    return max(1, min(MAX_LIMIT, request.args.get('limit', default, type=int)))
+
+
+def _live(conn, rows):
+    # Sharded, the catalogue's counters don't move; the shards' do
+    return cache.with_live_counts(conn, rows) if shards.enabled() else rows
+
+
+def _input():
+    return request.get_json(silent=True) or request.form
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if 'user_id' not in session:
+            return _error('Unauthorized', 401)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@bp.route('/login', methods=['POST'])
+def login():
+    data = _input()
+    try:
+        user = passwords.authenticate(db.get_db(), data.get('email'), data.get('password', ''))
+    except passwords.Busy:
+        response = _error('Too many sign-ins right now; try again shortly.', 503)
+        response.headers['Retry-After'] = '1'
+        return response
+    if not user:
+        return _error('Invalid email or password.', 401)
+    session['user_id'] = user['id']
+    session['full_name'] = user['full_name']
+    session['is_admin'] = bool(user['is_admin'])
+    return _json({'id': user['id'], 'full_name': user['full_name'], 'is_admin': bool(user['is_admin'])})
+
+
+@bp.route('/lots')
+@login_required
+def lots():
+    conn = db.get_db()
+    limit = _limit()
+    query = request.args.get('q', '').strip()
+    lat, lng = request.args.get('lat', type=float), request.args.get('lng', type=float)
+    if query:
+        return _page(_live(conn, search.search_parkings(conn, query, limit)))
+    if lat is not None and lng is not None:
+        fields = _fields()
+        nearest = search.nearest_parkings(conn, lat, lng, limit)
+        rows = _live(conn, [row for _, row in nearest])
+        return _json({'items': [dict(_item(row, fields), distance_km=round(distance, 3))
+                                for (distance, _), row in zip(nearest, rows)],
+                      'next': None})
+
+    rows = _live(conn, search.list_parkings(conn, request.args.get('after', 0, type=int), limit))
+    return _page(rows, rows[-1]['id'] if len(rows) == limit else None)
+
+
+@bp.route('/lots/<int:parking_id>')
+@login_required
+def lot(parking_id):
+    conn = db.get_db()
+    parking = cache.get_lot(conn, parking_id)
+    if not parking:
+        return _error('Parking lot not found.', 404)
+    return _json(_item(cache.with_live_counts(conn, [parking])[0], _fields()))
+
+
+@bp.route('/lots/<int:parking_id>/availability')
+@login_required
+def availability(parking_id):
+    try:
+        start, end = bookings.window(request.args['start_time'], request.args.get('duration', 1))
+    except (KeyError, ValueError):
+        return _error('start_time (YYYY-MM-DDTHH:MM) and duration (hours) are required', 400)
+
+    spots = reservations.free_spots(shards.lot_db(parking_id), parking_id, start, end)
+    payload = {'parking_id': parking_id, 'start_time': start, 'end_time': end, 'free_slots': len(spots)}
+    if request.args.get('spots'):
+        payload['spots'] = [{'spot_id': row['id'], 'spot_uid': row['spot_uid']} for row in spots]
+    return _json(payload)
+
+
+@bp.route('/bookings', methods=['POST'])
+@login_required
+def create_booking():
+    data = _input()
+    try:
+        conn = shards.lot_db(int(data['parking_id']))
+        booking = bookings.create(conn, session['user_id'], int(data['parking_id']), data['vehicle_number'],
+                                  data['start_time'], data.get('duration', 1))
+    except (KeyError, ValueError, TypeError):
+        return _error('parking_id, vehicle_number, start_time (YYYY-MM-DDTHH:MM) and duration (hours) are required', 400)
+    if not booking:
+        return _error('No available spots in this parking lot for that time.', 409)
+
+    if booking.pop('immediate'):
+        events.spot_changed(conn, booking['parking_id'], booking['spot_id'], 'occupied')
+    return _json(_item(booking, _fields()), 201)
+
+
+@bp.route('/bookings')
+@login_required
+def booking_history():
+    if request.args.get('status') == 'active':
+        return _page(shards.merged(shards.fan_out(bookings.active, session['user_id']), 'start_time'))
+    rows, next_before = user_summary.history(session['user_id'], request.args.get('before', type=int),
+                                             _limit(user_summary.PAGE_SIZE))
+    return _page(rows, next_before)
+
+
+@bp.route('/bookings/<int:booking_id>')
+@login_required
+def booking(booking_id):
+    conn = shards.id_db(booking_id)
+    row = bookings.get(conn, booking_id, session['user_id']) or archive.get(conn, booking_id, session['user_id'])
+    if not row:
+        return _error('Booking not found.', 404)
+    return _json(_item(row, _fields()))
+
+
+@bp.route('/bookings/<int:booking_id>/<action>', methods=['POST'])
+@login_required
+def update_booking(booking_id, action):
+    if action not in ('start', 'complete'):
+        return _error(f"Unknown action '{action}'.", 404)
+    conn = shards.id_db(booking_id)
+    row = bookings.get(conn, booking_id, session['user_id'])
+    if not row:
+        return _error('Booking not found.', 404)
+
+    try:
+        if action == 'start':
+            bookings.start(row)
+            status = 'occupied'
+        else:
+            bookings.complete(row)
+            status = 'available'
+    except bookings.InvalidTransition as e:
+        return _error(str(e), 409)
+
+    events.spot_changed(conn, row['parking_id'], row['spot_id'], status)
+    return _json(_item(bookings.get(conn, booking_id, session['user_id']), _fields()))
+
+
+@bp.route('/summary')
+@login_required
+def summary():
+    totals, daily = user_summary.overall(session['user_id'])
+    return _json({
+        'total_duration': totals['total_duration'] or 0,
+        'total_cost': totals['total_cost'] or 0,
+        'daily': [{'date': row['date'], 'cost': row['daily_cost'], 'duration': row['daily_duration']}
+                  for row in daily],
+    })
@@ -1,18 +1,43 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context
 import sqlite3
-import os
-from datetime import datetime, timedelta
+import hashlib
+import json
+from datetime import datetime
 import re
 
+import api
+import archive
+import billing
+import bookings
+import cache
+import compression
+import db
+import events
+import export
+import fragments
+import journal
+import occupancy
+import passwords
+import profiling
+import provisioning
+import reservations
+import search
+import shards
+import sweeper
+import rollups
+import user_summary
+
 app = Flask(__name__)
 app.secret_key = 'a_very_bad_secret_key'
-DATABASE = os.path.join('data', 'user.db')
+DATABASE = db.DATABASE
+db.init_app(app)
+profiling.init_app(app)
+compression.init_app(app)
+app.register_blueprint(api.bp)
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Request-scoped connection from the shared pool, released on teardown
+    return db.get_db()
 
 @app.context_processor
 def utility_processor():
@@ -59,7 +84,11 @@ def register():
                 flash(error, 'danger')
             return redirect(url_for('register'))
 
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = passwords.hash_password(password)
+        except passwords.Busy:
+            flash('Too many sign-ups right now, please try again in a moment.', 'warning')
+            return redirect(url_for('register'))
         conn = get_db_connection()
         try:
             conn.execute('INSERT INTO users (email, password, full_name, pincode, address) VALUES (?, ?, ?, ?, ?)',
@@ -69,8 +98,6 @@ def register():
             
         except sqlite3.IntegrityError:
             flash('Email already exists.', 'warning')
-        finally:
-            conn.close()
         return redirect(url_for('login'))
     return render_template('register.html')
 
@@ -81,10 +108,12 @@ def register():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE email = ?', (request.form['email'],)).fetchone()
-        conn.close()
-        if user and check_password_hash(user['password'], request.form['password']):
+        try:
+            user = passwords.authenticate(get_db_connection(), request.form['email'], request.form['password'])
+        except passwords.Busy:
+            flash('Too many sign-ins right now, please try again in a moment.', 'warning')
+            return redirect(url_for('login'))
+        if user:
             session['user_id'] = user['id']
             session['full_name'] = user['full_name']
             session['is_admin'] = bool(user['is_admin'])
@@ -103,26 +132,34 @@ def dashboard():
     if 'user_id' not in session: return redirect(url_for('login'))
 
     conn = get_db_connection()
-    
-    parkings = conn.execute('''
-        SELECT p.id, p.name, p.address, p.pincode, p.price_per_hour,
-               (SELECT COUNT(id) FROM spots WHERE parking_id = p.id AND status = 'available') AS available_slots,
-               p.total_slots
-        FROM parkings p
-    ''').fetchall()
-    
-    recent_bookings = conn.execute('''
-        SELECT b.id, b.status, b.start_time, b.end_time, s.spot_uid, p.name as parking_name
-        FROM bookings b
-        JOIN spots s ON b.spot_id = s.id
-        JOIN parkings p ON b.parking_id = p.id
-        WHERE b.user_id = ? ORDER BY b.id DESC LIMIT 5
-    ''', (session['user_id'],)).fetchall()
-    conn.close()
+
+    # ?q= searches name/address/pincode, ?lat=&lng= finds the nearest lots,
+    # otherwise show lots in the user's own pincode
+    query = request.args.get('q', '').strip()
+    lat, lng = request.args.get('lat', type=float), request.args.get('lng', type=float)
+    if query:
+        parkings = search.search_parkings(conn, query)
+    elif lat is not None and lng is not None:
+        parkings = [row for _, row in search.nearest_parkings(conn, lat, lng)]
+    else:
+        user = cache.get_user(conn, session['user_id'])
+        parkings = cache.with_live_counts(conn, cache.get_lots_in_pincode(conn, user['pincode'])) if user else []
+        if not parkings:
+            parkings = search.search_parkings(conn, '')
+    if shards.enabled():
+        # The catalogue's own counters don't move; the shards' do
+        parkings = cache.with_live_counts(conn, parkings)
+
+    recent_bookings = shards.merged(shards.fan_out(bookings.recent, session['user_id']), 'id', reverse=True, limit=5)
+    # The rows are in hand already (live counts included), so they key their own table
+    lot_table = fragments.render(f'lots:{fragments.digest(parkings)}', 'fragments/lot_table.html',
+                                 lambda: {'lots': parkings, 'admin': False})
 
     return render_template('user_dashboard.html',
                            user_name=session.get('full_name'),
                            available_parkings=parkings,
+                           lot_table=lot_table,
+                           search_query=query,
                            parking_history=recent_bookings)
 
 
@@ -133,94 +170,98 @@ def dashboard():
 def book():
     if 'user_id' not in session: return redirect(url_for('login'))
 
-    parking_id = request.form['parking_id']
-    start_time_str = request.form['start_time']
-    duration = int(request.form['duration'])
-    start_time_dt = datetime.strptime(start_time_str, "%Y-%m-%dT%H:%M")
-    end_time_dt = start_time_dt + timedelta(hours=duration)
-
-    conn = get_db_connection()
-    available_spot = conn.execute("SELECT id FROM spots WHERE parking_id = ? AND status = 'available' LIMIT 1", (parking_id,)).fetchone()
+    conn = shards.lot_db(request.form['parking_id'])
+    try:
+        booking = bookings.create(conn, session['user_id'], request.form['parking_id'], request.form['vehicle_number'],
+                                  request.form['start_time'], request.form['duration'])
+    except ValueError:
+        flash('Choose a start time and a duration of at least one hour.', 'danger')
+        return redirect(url_for('dashboard'))
 
-    if not available_spot:
-        flash('No available spots in this parking lot.', 'danger')
+    if not booking:
+        flash('No available spots in this parking lot for that time.', 'danger')
         return redirect(url_for('dashboard'))
 
-    spot_id = available_spot['id']
-    
-    # Create booking
-    conn.execute('''
-        INSERT INTO bookings (user_id, parking_id, spot_id, vehicle_number, start_time, end_time, status)
-        VALUES (?, ?, ?, ?, ?, ?, 'booked')
-    ''', (session['user_id'], parking_id, spot_id, request.form['vehicle_number'],
-          start_time_dt.strftime("%Y-%m-%d %H:%M"), end_time_dt.strftime("%Y-%m-%d %H:%M")))
-    
-    
-    # Mark    occupied
-    conn.execute("UPDATE spots SET status = 'occupied' WHERE id = ?", (spot_id,))
-    conn.commit()
-    conn.close()
-    
+    # Future reservations only hold the window; the spot fills when parking starts
+    if booking['immediate']:
+        events.spot_changed(conn, booking['parking_id'], booking['spot_id'], 'occupied')
     flash('Booking successful!', 'success')
     return redirect(url_for('dashboard'))
 
 
 
+@app.route('/parking/<int:parking_id>/availability')
+def parking_availability(parking_id):
+    if 'user_id' not in session: return jsonify({'error': 'Unauthorized'}), 403
+
+    # Same inputs as the booking form: ?start_time=YYYY-MM-DDTHH:MM&duration=<hours>
+    try:
+        start, end = bookings.window(request.args['start_time'], request.args.get('duration', 1))
+    except (KeyError, ValueError):
+        return jsonify({'error': 'start_time (YYYY-MM-DDTHH:MM) and duration (hours) are required'}), 400
+
+    spots = reservations.free_spots(shards.lot_db(parking_id), parking_id, start, end)
+    return jsonify({
+        'parking_id': parking_id,
+        'start_time': start,
+        'end_time': end,
+        'free_slots': len(spots),
+        'spots': [{'spot_id': row['id'], 'spot_uid': row['spot_uid']} for row in spots],
+    })
+
+
+
 @app.route('/update_booking_status/<int:booking_id>/<new_status>', methods=['POST'])
 def update_booking_status(booking_id, new_status):
     if 'user_id' not in session: return redirect(url_for('login'))
     
-    conn = get_db_connection()
+    conn = shards.id_db(booking_id)
     booking = conn.execute("SELECT * FROM bookings WHERE id = ? AND user_id = ?", (booking_id, session['user_id'])).fetchone()
 
     if not booking:
         flash("Booking not found.", "danger")
         return redirect(url_for('dashboard'))
 
-    if new_status == 'ongoing':
-        conn.execute("UPDATE bookings SET status = 'ongoing', start_time = ? WHERE id = ?", (datetime.now().strftime("%Y-%m-%d %H:%M"), booking_id))
-        flash("Parking started!", "info")
-
-    elif new_status == 'completed':
-        details = conn.execute('''
-            SELECT b.start_time, p.price_per_hour FROM bookings b
-            JOIN parkings p ON b.parking_id = p.id
-            WHERE b.id = ?
-        ''', (booking_id,)).fetchone()
-
-        end_time = datetime.now()
-        start_time = datetime.strptime(details['start_time'], "%Y-%m-%d %H:%M")
-        
-        duration_hours = (end_time - start_time).total_seconds() / 3600
-        cost = duration_hours * details['price_per_hour']
-
-        conn.execute("UPDATE bookings SET status = 'completed', end_time = ?, duration = ?, cost = ? WHERE id = ?",
-                     (end_time.strftime("%Y-%m-%d %H:%M"), duration_hours, cost, booking_id))
-        
-        conn.execute("UPDATE spots SET status = 'available' WHERE id = ?", (booking['spot_id'],))
-        flash("Parking completed. Hope to see you again!", "success")
+    try:
+        if new_status == 'ongoing':
+            bookings.start(booking)
+            flash("Parking started!", "info")
 
-    conn.commit()
-    conn.close()
+        elif new_status == 'completed':
+            bookings.complete(booking)
+            flash("Parking completed. Hope to see you again!", "success")
+    except bookings.InvalidTransition as e:
+        flash(str(e), "danger")
+        return redirect(url_for('dashboard'))
+
+    if new_status == 'completed':
+        events.spot_changed(conn, booking['parking_id'], booking['spot_id'], 'available')
+    elif new_status == 'ongoing':
+        events.spot_changed(conn, booking['parking_id'], booking['spot_id'], 'occupied')
     return redirect(url_for('dashboard'))
 
 
 
 
 # ADMIN ROUTES
+def admin_lots(conn):
+    # Each shard's copy of its lots carries the live counters
+    return conn.execute('''
+        SELECT p.id, p.name, p.total_slots, p.available_slots
+        FROM parkings p
+    ''').fetchall()
+
+
 @app.route('/admin')
 def admin_dashboard():
     if not session.get('is_admin'): return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    parkings = conn.execute('''
-        SELECT p.id, p.name, p.total_slots,
-               (SELECT COUNT(id) FROM spots WHERE parking_id = p.id AND status = 'available') as available_slots
-        FROM parkings p
-    ''').fetchall()
-    conn.close()
-    
-    return render_template('admin_dashboard.html', parkings=parkings)
+    parkings = shards.merged(shards.fan_out(admin_lots), 'id')
+    lot_table = fragments.render(f'admin-lots:{fragments.digest(parkings)}',
+                                 'fragments/lot_table.html',
+                                 lambda: {'admin': True, 'lots': parkings})
+
+    return render_template('admin_dashboard.html', parkings=parkings, lot_table=lot_table)
 
 
 
@@ -230,23 +271,41 @@ def admin_add_parking():
     if not session.get('is_admin'): return redirect(url_for('login'))
     
     conn = get_db_connection()
-    cursor = conn.cursor()
+    layout = {key: request.form[key] for key in ('latitude', 'longitude', 'scheme', 'levels', 'rows') if request.form.get(key)}
+    try:
+        provisioning.create_lots(conn, [dict(name=request.form['name'], address=request.form['address'],
+                                             pincode=request.form['pincode'], price=request.form['price'],
+                                             slots=request.form['slots'], **layout)])
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('admin_dashboard'))
+
+    cache.invalidate_lot()
+    flash(f"Parking lot '{request.form['name']}' added successfully!", "success")
+    return redirect(url_for('admin_dashboard'))
 
-    cursor.execute('''
-        INSERT INTO parkings (name, address, pincode, price_per_hour, total_slots)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (request.form['name'], request.form['address'], request.form['pincode'], request.form['price'], request.form['slots']))
-    
-    parking_id = cursor.lastrowid
-    
 
-    total_slots = int(request.form['slots'])
-    for i in range(1, total_slots + 1):
-        cursor.execute("INSERT INTO spots (parking_id, spot_uid) VALUES (?, ?)", (parking_id, f"A-{i}"))
 
-    conn.commit()
-    conn.close()
-    flash(f"Parking lot '{request.form['name']}' added successfully!", "success")
+
+@app.route('/admin/import_parkings', methods=['POST'])
+def admin_import_parkings():
+    if not session.get('is_admin'): return redirect(url_for('login'))
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash("Choose a CSV or JSON file to import.", "danger")
+        return redirect(url_for('admin_dashboard'))
+
+    conn = get_db_connection()
+    try:
+        lots = provisioning.parse_lots(upload.read(), upload.filename)
+        provisioning.create_lots(conn, lots)
+    except (ValueError, KeyError, sqlite3.Error) as e:
+        flash(f"Import failed, nothing was added: {e}", "danger")
+        return redirect(url_for('admin_dashboard'))
+
+    cache.invalidate_lot()
+    flash(f"Imported {len(lots)} parking lots with {sum(int(lot['slots']) for lot in lots)} spots.", "success")
     return redirect(url_for('admin_dashboard'))
 
 
@@ -257,12 +316,16 @@ def admin_edit_parking(parking_id):
     if not session.get('is_admin'): return redirect(url_for('login'))
     
     conn = get_db_connection()
-    conn.execute('''
-        UPDATE parkings SET name = ?, address = ?, pincode = ?, price_per_hour = ?
-        WHERE id = ?
-    ''', (request.form['name'], request.form['address'], request.form['pincode'], request.form['price'], parking_id))
-    conn.commit()
-    conn.close()
+    # The shard's copy too: bookings there are priced and reported from it
+    for target in {conn, shards.lot_db(parking_id)}:
+        target.execute('''
+            UPDATE parkings SET name = ?, address = ?, pincode = ?, price_per_hour = ?,
+                                latitude = COALESCE(?, latitude), longitude = COALESCE(?, longitude)
+            WHERE id = ?
+        ''', (request.form['name'], request.form['address'], request.form['pincode'], request.form['price'],
+              request.form.get('latitude') or None, request.form.get('longitude') or None, parking_id))
+        target.commit()
+    cache.invalidate_lot(parking_id)
     
     flash("Parking lot details updated.", "success")
     return redirect(url_for('admin_dashboard'))
@@ -270,12 +333,37 @@ def admin_edit_parking(parking_id):
 
 
 
+@app.route('/admin/tariff/<int:parking_id>', methods=['POST'])
+def admin_set_tariff(parking_id):
+    if not session.get('is_admin'): return redirect(url_for('login'))
+
+    # Blank fields drop that rule; night_start/night_end are HH:MM
+    try:
+        rules = {key: float(request.form[key]) for key in ('first_hour_rate', 'night_rate', 'daily_cap')
+                 if request.form.get(key)}
+        for key in ('night_start', 'night_end'):
+            if request.form.get(key):
+                hours, minutes = request.form[key].split(':')
+                rules[key] = int(hours) * 60 + int(minutes)
+        rules['grace_minutes'] = int(request.form.get('grace_minutes') or 0)
+    except ValueError:
+        flash("Tariff rates must be numbers and night hours HH:MM.", "danger")
+        return redirect(url_for('admin_dashboard'))
+
+    conn = shards.lot_db(parking_id)
+    billing.set_tariff(conn, parking_id, **rules)
+    conn.commit()
+    flash("Tariff updated.", "success")
+    return redirect(url_for('admin_dashboard'))
+
+
+
+
 @app.route('/admin/users')
 def admin_users():
     if not session.get('is_admin'): return redirect(url_for('login'))
     conn = get_db_connection()
     users = conn.execute("SELECT id, email, full_name, address, pincode FROM users WHERE is_admin = 0").fetchall()
-    conn.close()
     return render_template('admin_users.html', users=users)
 
 
@@ -283,29 +371,10 @@ def admin_users():
 @app.route('/admin/stats')
 def admin_stats():
     if not session.get('is_admin'): return redirect(url_for('login'))
-    conn = get_db_connection()
-    
-  
-    revenue_by_lot = conn.execute('''
-        SELECT p.name, SUM(b.cost) as total_revenue
-        FROM bookings b
-        JOIN parkings p ON b.parking_id = p.id
-        WHERE b.status = 'completed'
-        GROUP BY p.name
-    ''').fetchall()
-
-
-
-
-    revenue_by_day = conn.execute('''
-        SELECT DATE(end_time) as date, SUM(cost) as daily_revenue
-        FROM bookings
-        WHERE status = 'completed'
-        GROUP BY date
-        ORDER BY date ASC
-    ''').fetchall()
-    
-    conn.close()
+    # Optional ?from=YYYY-MM-DD&to=YYYY-MM-DD; both read the rollup tables only
+    date_from = request.args.get('from') or None
+    date_to = request.args.get('to') or None
+    revenue_by_lot, revenue_by_day = rollups.revenue(date_from, date_to)
 
     lot_labels = [row['name'] for row in revenue_by_lot]
     lot_data = [row['total_revenue'] for row in revenue_by_lot]
@@ -315,7 +384,46 @@ def admin_stats():
 
     return render_template('admin_stats.html',
                            lot_labels=lot_labels, lot_data=lot_data,
-                           day_labels=day_labels, day_data=day_data)
+                           day_labels=day_labels, day_data=day_data,
+                           date_from=date_from, date_to=date_to)
+
+
+@app.route('/admin/occupancy')
+def admin_occupancy():
+    if not session.get('is_admin'): return jsonify({'error': 'forbidden'}), 403
+    # Same optional ?from=&to= as admin_stats; the last 30 days by default
+    return jsonify({'lots': occupancy.by_lot(request.args.get('from') or None, request.args.get('to') or None)})
+
+
+@app.route('/admin/occupancy/<int:parking_id>')
+def admin_lot_occupancy(parking_id):
+    if not session.get('is_admin'): return jsonify({'error': 'forbidden'}), 403
+    report = occupancy.report(parking_id, request.args.get('from') or None, request.args.get('to') or None,
+                              request.args.get('limit', 5, type=int))
+    if report is None:
+        return jsonify({'error': 'Parking lot not found.'}), 404
+    return jsonify(report)
+
+
+
+
+@app.route('/admin/export/<dataset>')
+def admin_export(dataset):
+    if not session.get('is_admin'): return redirect(url_for('login'))
+
+    # ?format=csv|parquet plus the same optional ?from=&to= as admin_stats
+    fmt = request.args.get('format', 'csv')
+    date_from = request.args.get('from') or None
+    date_to = request.args.get('to') or None
+    try:
+        data = export.stream(dataset, fmt, date_from, date_to)
+    except (ValueError, ImportError) as e:
+        flash(f"Export failed: {e}", "danger")
+        return redirect(url_for('admin_stats'))
+
+    mimetype, extension = export.FORMATS[fmt]
+    return Response(stream_with_context(data), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{dataset}.{extension}"'})
 
 
 
@@ -324,32 +432,13 @@ def admin_stats():
 def profile():
     if 'user_id' not in session: return redirect(url_for('login'))
 
-    conn = get_db_connection()
     user_id = session['user_id']
-    
-    # Sloppy, but it's what the customer wants
-    all_bookings = conn.execute('''
-        SELECT b.id, b.start_time, b.end_time, b.duration, b.cost, p.name as parking_name, s.spot_uid
-        FROM bookings b
-        JOIN parkings p ON b.parking_id = p.id
-        JOIN spots s ON b.spot_id = s.id
-        WHERE b.user_id = ? AND b.status = 'completed'
-        ORDER BY b.id DESC
-    ''', (user_id,)).fetchall()
-
-    summary = conn.execute("SELECT SUM(duration) as total_duration, SUM(cost) as total_cost FROM bookings WHERE user_id = ? AND status = 'completed'", (user_id,)).fetchone()
-    
-
-    graph_data = conn.execute('''
-        SELECT DATE(start_time) as date, SUM(cost) as daily_cost, SUM(duration) as daily_duration
-        FROM bookings
-        WHERE user_id = ? AND status = 'completed'
-        GROUP BY DATE(start_time)
-        ORDER BY date ASC
-    ''', (user_id,)).fetchall()
-    
-    conn.close()
 
+    # History is paged newest-first with ?before=<booking id>; totals and the
+    # daily graph come from the per-user summary instead of rescanning bookings
+    before = request.args.get('before', type=int)
+    all_bookings, next_before = user_summary.history(user_id, before)
+    summary, graph_data = user_summary.overall(user_id)
 
     labels = [row['date'] for row in graph_data]
     cost_data = [row['daily_cost'] for row in graph_data]
@@ -357,6 +446,7 @@ def profile():
 
     return render_template('profile.html',
                            bookings=all_bookings,
+                           next_before=next_before,
                            total_duration=summary['total_duration'] or 0,
                            total_cost=summary['total_cost'] or 0,
                            labels=labels,
@@ -366,64 +456,184 @@ def profile():
 
 
 
+@app.route('/admin/cache_stats')
+def admin_cache_stats():
+    if not session.get('is_admin'): return jsonify({'error': 'forbidden'}), 403
+    return jsonify(dict(cache.cache.stats(), fragments=fragments.stats()))
+
+
+@app.route('/admin/sql_profile')
+def admin_sql_profile():
+    if not session.get('is_admin'): return jsonify({'error': 'forbidden'}), 403
+    return jsonify({'enabled': profiling.ENABLED, 'statements': profiling.top(request.args.get('limit', 20, type=int))})
+
+
+@app.route('/metrics')
+def metrics():
+    cache_stats, journal_stats, sweeper_stats = cache.cache.stats(), journal.stats(), sweeper.stats()
+    fragment_stats = fragments.stats()
+    hash_stats, archive_stats, occupancy_stats = passwords.hasher.stats(), archive.stats(), occupancy.stats()
+    text = profiling.metrics(gauges={
+        'app_cache_entries': ('Entries in the cache', cache_stats['entries']),
+        'app_journal_pending': ('Booking journal events waiting to commit', journal_stats['pending']),
+    }, counters={
+        'app_cache_hits_total': ('Cache hits', cache_stats['hits']),
+        'app_cache_misses_total': ('Cache misses', cache_stats['misses']),
+        'app_fragment_cache_hits_total': ('Rendered fragments served from the cache', fragment_stats['hits']),
+        'app_fragment_cache_misses_total': ('Rendered fragments rendered afresh', fragment_stats['misses']),
+        'app_journal_commits_total': ('Booking journal commits', journal_stats['commits']),
+        'app_journal_events_total': ('Booking journal events committed', journal_stats['events']),
+        'app_sweeper_runs_total': ('Expiry sweeper runs', sweeper_stats['runs']),
+        'app_sweeper_expired_total': ('Bookings expired by the sweeper', sweeper_stats['expired']),
+        'app_sweeper_spots_reclaimed_total': ('Spots freed by the sweeper', sweeper_stats['spots_reclaimed']),
+        'app_archive_runs_total': ('Booking archiver runs', archive_stats['runs']),
+        'app_archive_moved_total': ('Bookings moved to archive partitions', archive_stats['moved']),
+        'app_archive_compactions_total': ('Archive partitions compacted', archive_stats['compacted']),
+        'app_occupancy_changes_applied_total': ('Booking changes folded into hourly occupancy',
+                                                occupancy_stats['applied']),
+        'app_password_hashes_total': ('Password hashes computed', hash_stats['hashed']),
+        'app_password_hashes_rejected_total': ('Password hashes refused with the queue full', hash_stats['rejected']),
+        'app_password_verified_hits_total': ('Logins that skipped the KDF', hash_stats['verified_hits']),
+    })
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/sweeper_stats')
+def admin_sweeper_stats():
+    if not session.get('is_admin'): return jsonify({'error': 'forbidden'}), 403
+    return jsonify(sweeper.stats())
+
+
+@app.route('/admin/archive_stats')
+def admin_archive_stats():
+    if not session.get('is_admin'): return jsonify({'error': 'forbidden'}), 403
+    # Each shard archives its own bookings into its own partitions
+    partitions = [row for rows in shards.fan_out(archive.partitions) for row in rows]
+    return jsonify(dict(archive.stats(), partitions=partitions))
+
+
+
+
 @app.route('/admin/parking/<int:parking_id>')
 def admin_parking_details(parking_id):
     if not session.get('is_admin'): return redirect(url_for('login'))
     
-    conn = get_db_connection()
+    conn = shards.lot_db(parking_id)
     parking = conn.execute("SELECT * FROM parkings WHERE id = ?", (parking_id,)).fetchone()
-    spots = conn.execute("SELECT * FROM spots WHERE parking_id = ? ORDER BY spot_uid", (parking_id,)).fetchall()
-    conn.close()
-    
     if not parking: return "Parking not found", 404
-    
-    return render_template('admin_parking_details.html', parking=parking, spots=spots)
 
+    spots = conn.execute("SELECT * FROM spots WHERE parking_id = ? ORDER BY spot_uid", (parking_id,)).fetchall()
+    # Every spot or booking change bumps the lot version, so the grid is rebuilt only then
+    spot_grid = fragments.render(f"spots:{parking_id}:{parking['version']}", 'fragments/spot_grid.html',
+                                 lambda: {'parking': parking, 'spots': spots})
+
+    return render_template('admin_parking_details.html', parking=parking, spots=spots, spot_grid=spot_grid)
+
+
+
+def customer_name(details):
+    # On a shard the users join finds nobody; the catalogue has the name
+    if details['full_name'] or not details['user_id']:
+        return details['full_name']
+    user = cache.get_user(get_db_connection(), details['user_id'])
+    return user['full_name'] if user else None
+
+
+def spot_details_json(details, tariff, now):
+    cost = "N/A"
+    if details['start_time']:
+        cost = f"₹{billing.cost(details['start_time'], now.strftime('%Y-%m-%d %H:%M'), tariff):.2f} (est.)"
+
+    return {
+        'spot_id': details['spot_id'],
+        'spot_uid': details['spot_uid'],
+        'status': details['status'],
+        'customer_name': customer_name(details) or 'N/A',
+        'vehicle_number': details['vehicle_number'] or 'N/A',
+        'start_time': details['start_time'] or 'N/A',
+        'est_cost': cost,
+    }
 
 
 @app.route('/admin/spot_details/<int:spot_id>')
 def admin_spot_details(spot_id):
     if not session.get('is_admin'): return jsonify({'error': 'Unauthorized'}), 403
     
-    conn = get_db_connection()
+    conn = shards.id_db(spot_id)
     details = conn.execute('''
         SELECT
             s.id as spot_id,
             s.spot_uid,
             s.status,
-            u.id as user_id,
+            b.user_id,
             u.full_name,
             b.vehicle_number,
             b.start_time,
             b.end_time,
-            p.price_per_hour
+            s.parking_id
         FROM spots s
-        LEFT JOIN bookings b ON b.spot_id = s.id AND b.status IN ('booked', 'ongoing')
+        LEFT JOIN bookings b ON b.spot_id = s.id AND b.status IN ('booked', 'ongoing') AND b.start_time <= ?
         LEFT JOIN users u ON b.user_id = u.id
-        LEFT JOIN parkings p ON s.parking_id = p.id
         WHERE s.id = ?
-    ''', (spot_id,)).fetchone()
-    conn.close()
+    ''', (datetime.now().strftime("%Y-%m-%d %H:%M"), spot_id)).fetchone()
 
     if not details: return jsonify({'error': 'Spot not found'}), 404
 
+    return jsonify(spot_details_json(details, billing.load_tariff(conn, details['parking_id']), datetime.now()))
 
 
-    cost = "N/A"
-    if details['start_time']:
-        start = datetime.strptime(details['start_time'], "%Y-%m-%d %H:%M")
-        duration = (datetime.now() - start).total_seconds() / 3600
-        cost = f"₹{duration * (details['price_per_hour'] or 10):.2f} (est.)"
 
-    return jsonify({
-        'spot_id': details['spot_id'],
-        'spot_uid': details['spot_uid'],
-        'status': details['status'],
-        'customer_name': details['full_name'] or 'N/A',
-        'vehicle_number': details['vehicle_number'] or 'N/A',
-        'start_time': details['start_time'] or 'N/A',
-        'est_cost': cost,
+
+@app.route('/admin/parking/<int:parking_id>/spot_details')
+def admin_lot_spot_details(parking_id):
+    if not session.get('is_admin'): return jsonify({'error': 'Unauthorized'}), 403
+
+    conn = shards.lot_db(parking_id)
+    parking = conn.execute("SELECT price_per_hour, total_slots, available_slots, version FROM parkings WHERE id = ?",
+                           (parking_id,)).fetchone()
+    if not parking: return jsonify({'error': 'Parking not found'}), 404
+
+    # The lot version changes with every spot, booking or price edit. While
+    # any spot is occupied the cost estimates also move, and a reservation
+    # shows up once its start passes, so then add the minute.
+    now = datetime.now()
+    etag = f"lot-{parking_id}-v{parking['version']}"
+    reserved = conn.execute("SELECT 1 FROM bookings WHERE status = 'booked' AND parking_id = ? LIMIT 1",
+                            (parking_id,)).fetchone()
+    if parking['available_slots'] < parking['total_slots'] or reserved:
+        etag += now.strftime("-%Y%m%d%H%M")
+    ids = request.args.get('ids')
+    if ids:
+        etag += '-' + hashlib.sha1(ids.encode()).hexdigest()[:12]
+    # Weak comparison: compression.py weakens the tag of a compressed response
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, {'ETag': f'W/"{etag}"'}
+
+    query = '''
+        SELECT s.id as spot_id, s.spot_uid, s.status, b.user_id, u.full_name, b.vehicle_number, b.start_time
+        FROM spots s
+        LEFT JOIN bookings b ON b.spot_id = s.id AND b.status IN ('booked', 'ongoing') AND b.start_time <= ?
+        LEFT JOIN users u ON b.user_id = u.id
+        WHERE s.parking_id = ?
+    '''
+    params = [now.strftime("%Y-%m-%d %H:%M"), parking_id]
+    if ids:
+        try:
+            id_list = [int(spot_id) for spot_id in ids.split(',') if spot_id.strip()]
+        except ValueError:
+            return jsonify({'error': 'ids must be a comma-separated list of spot ids'}), 400
+        query += " AND s.id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(id_list))
+    rows = conn.execute(query + " ORDER BY s.spot_uid", params).fetchall()
+    tariff = billing.load_tariff(conn, parking_id, parking['price_per_hour'])
+
+    response = jsonify({
+        'parking_id': parking_id,
+        'spots': [spot_details_json(row, tariff, now) for row in rows],
     })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 
@@ -432,21 +642,58 @@ def admin_spot_details(spot_id):
 def admin_delete_spot(spot_id):
     if not session.get('is_admin'): return redirect(url_for('login'))
     
-    conn = get_db_connection()
+    conn = shards.id_db(spot_id)
     spot = conn.execute("SELECT status, parking_id FROM spots WHERE id = ?", (spot_id,)).fetchone()
-    if spot and spot['status'] == 'available':
+    # A spot held for a future reservation is still 'available' until parking starts
+    reserved = spot and conn.execute(
+        "SELECT 1 FROM bookings WHERE spot_id = ? AND status IN ('booked', 'ongoing') LIMIT 1", (spot_id,)).fetchone()
+    if spot and spot['status'] == 'available' and not reserved:
         parking_id = spot['parking_id']
         conn.execute("DELETE FROM spots WHERE id = ?", (spot_id,))
         conn.execute("UPDATE parkings SET total_slots = total_slots - 1 WHERE id = ?", (parking_id,))
         conn.commit()
+        # Then the catalogue's copy of the lot, which keeps its own slot count
+        catalogue = get_db_connection()
+        if catalogue is not conn:
+            catalogue.execute("UPDATE parkings SET total_slots = total_slots - 1 WHERE id = ?", (parking_id,))
+            catalogue.commit()
+        cache.invalidate_lot(parking_id)
+        events.spot_changed(conn, parking_id, spot_id, 'deleted')
         flash('Spot deleted successfully.', 'success')
     else:
-        flash('Cannot delete an occupied or non-existent spot.', 'danger')
-    conn.close()
+        flash('Cannot delete an occupied, reserved or non-existent spot.', 'danger')
+    if not spot:
+        return redirect(url_for('admin_dashboard'))
     return redirect(url_for('admin_parking_details', parking_id=spot['parking_id']))
 
 
 
+@app.route('/events')
+@app.route('/parking/<int:parking_id>/events')
+def spot_events(parking_id=None):
+    if 'user_id' not in session: return jsonify({'error': 'Unauthorized'}), 403
+
+    # Initial state comes from the DB once, read after the stream subscribes
+    # so nothing published in between is lost; everything after is pushed
+    def snapshot():
+        if parking_id is None:
+            rows = shards.merged(shards.fan_out(lambda conn: conn.execute(
+                "SELECT id, available_slots, total_slots FROM parkings").fetchall()), 'id')
+        else:
+            rows = shards.lot_db(parking_id).execute(
+                "SELECT id, spot_uid, status FROM spots WHERE parking_id = ? ORDER BY spot_uid",
+                (parking_id,)).fetchall()
+        items = [dict(row) for row in rows]
+        # Hand the connection back now rather than holding it for the life of the stream
+        db.close_db()
+        return {'parking_id': parking_id, 'items': items}
+
+    return Response(stream_with_context(events.stream(parking_id, snapshot)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -456,4 +703,7 @@ def logout():
 
 
 if __name__ == '__main__':
+    sweeper.start()
+    archive.start()
+    occupancy.start()
     app.run(debug=True, port=5001)
@@ -0,0 +1,358 @@
+"""Monthly archive partitions for completed bookings.
+
+bookings is the hot table: live bookings plus those completed in the last
+ARCHIVE_AFTER_DAYS days. Every ARCHIVE_INTERVAL seconds the archiver
+moves older completed bookings into one database per month of end_time,
+data/archive/<db>-YYYY-MM.db. It attaches the partition and copies a
+batch of rows across, with the lot name and spot UID written into each
+row. Then it deletes them from bookings. The copy commits first, so a
+crash can leave a row in both places but never in neither; readers
+dedupe by id, skipping a partition's rows that are still in bookings.
+archive_partitions, in the hot database, lists the partitions with their
+booking id ranges.
+
+Revenue rollups and user summaries are maintained by triggers that don't
+fire on delete, so they keep counting archived bookings. Profile history,
+the dashboard's recent bookings and exports read the partitions next to
+the hot table. Summaries and rollups rebuilt from scratch read them too.
+billing.rebill() re-prices hot bookings only.
+
+Once a month is closed (nothing left in it to archive), its partition is
+VACUUMed after its last write, at most every ARCHIVE_COMPACT_INTERVAL
+seconds. With sharding on, each shard has its own partitions.
+
+    python archive.py                # one pass: move, then compact
+    python archive.py --every 3600   # run as a separate worker
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import db
+import shards
+
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 3600))
+AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 30))
+BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 5000))
+COMPACT_INTERVAL = float(os.environ.get('ARCHIVE_COMPACT_INTERVAL', 86400))
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+# Created in each partition; {schema} is where it is attached
+PARTITION_TABLES = (
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.bookings (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        parking_id INTEGER NOT NULL,
+        parking_name TEXT,
+        spot_id INTEGER,
+        spot_uid TEXT,
+        vehicle_number TEXT,
+        start_time TEXT,
+        end_time TEXT,
+        duration REAL,
+        cost REAL,
+        status TEXT
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_archive_user ON bookings(user_id, id)",
+)
+
+DUE_SQL = '''
+    SELECT id, strftime('%Y-%m', end_time) AS month FROM bookings
+    WHERE status = 'completed' AND DATE(end_time) < ?
+    ORDER BY DATE(end_time)
+    LIMIT ?
+'''
+
+COPY_SQL = '''
+    INSERT OR IGNORE INTO cold.bookings
+        (id, user_id, parking_id, parking_name, spot_id, spot_uid, vehicle_number,
+         start_time, end_time, duration, cost, status)
+    SELECT b.id, b.user_id, b.parking_id, p.name, b.spot_id, s.spot_uid, b.vehicle_number,
+           b.start_time, b.end_time, b.duration, b.cost, b.status
+    FROM main.bookings b
+    LEFT JOIN main.parkings p ON p.id = b.parking_id
+    LEFT JOIN main.spots s ON s.id = b.spot_id
+    WHERE b.id IN (SELECT value FROM json_each(?))
+'''
+
+
+def _now():
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+def _main_file(conn):
+    return conn.execute("PRAGMA database_list").fetchone()['file']
+
+
+def _directory(conn):
+    return os.path.dirname(_main_file(conn))
+
+
+def partitions(conn):
+    """The hot database's partitions, newest booking ids first, each with its file's full ``path``."""
+    rows = conn.execute("SELECT * FROM archive_partitions ORDER BY max_id DESC").fetchall()
+    directory = _directory(conn)
+    return [dict(row, path=os.path.join(directory, row['file'])) for row in rows]
+
+
+def cutoff(now=None):
+    """Bookings that ended before this day are archived."""
+    now = datetime.strptime(now, TIME_FORMAT) if now else datetime.now()
+    return (now - timedelta(days=AFTER_DAYS)).strftime('%Y-%m-%d')
+
+
+def _move_month(conn, month, ids, now):
+    directory = _directory(conn)
+    stem = os.path.splitext(os.path.basename(_main_file(conn)))[0]
+    file = os.path.join('archive', f'{stem}-{month}.db')
+    os.makedirs(os.path.join(directory, 'archive'), exist_ok=True)
+    conn.execute("ATTACH DATABASE ? AS cold", (os.path.join(directory, file),))
+    try:
+        for sql in PARTITION_TABLES:
+            conn.execute(sql.format(schema='cold'))
+        ids_json = json.dumps(ids)
+        conn.execute("BEGIN IMMEDIATE")
+        copied = conn.execute(COPY_SQL, (ids_json,)).rowcount
+        conn.commit()
+
+        conn.execute("BEGIN IMMEDIATE")
+        moved = conn.execute("DELETE FROM main.bookings WHERE id IN (SELECT value FROM json_each(?))",
+                             (ids_json,)).rowcount
+        conn.execute('''
+            INSERT INTO archive_partitions (month, file, rows, min_id, max_id, changed_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(month) DO UPDATE SET rows = rows + excluded.rows,
+                                             min_id = MIN(min_id, excluded.min_id),
+                                             max_id = MAX(max_id, excluded.max_id),
+                                             changed_at = excluded.changed_at
+        ''', (month, file, copied, min(ids), max(ids), now))
+        conn.commit()
+        return moved
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE cold")
+
+
+def move(conn, now=None, batch=BATCH_SIZE):
+    """Archive completed bookings that ended before cutoff(now); returns how many moved."""
+    now = now or _now()
+    day = cutoff(now)
+    moved = 0
+    while True:
+        rows = conn.execute(DUE_SQL, (day, batch)).fetchall()
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row['month'], []).append(row['id'])
+        for month, ids in sorted(by_month.items()):
+            moved += _move_month(conn, month, ids, now)
+        if len(rows) < batch:
+            return moved
+
+
+def compact(conn, now=None):
+    """VACUUM closed partitions written since their last compaction; returns the months done."""
+    now = now or _now()
+    done = []
+    for partition in partitions(conn):
+        if partition['month'] >= cutoff(now)[:7]:
+            continue
+        if partition['compacted_at'] and partition['compacted_at'] >= partition['changed_at']:
+            continue
+        archived = db.connect(partition['path'])
+        try:
+            archived.execute("VACUUM")
+        finally:
+            archived.close()
+        conn.execute("UPDATE archive_partitions SET compacted_at = ? WHERE month = ?", (now, partition['month']))
+        conn.commit()
+        done.append(partition['month'])
+    return done
+
+
+def merge_history(conn, rows, user_id, columns, limit, before=None):
+    """``rows`` (a user's hot bookings, newest id first) topped up from the partitions.
+
+    Returns the first ``limit`` rows with id below ``before`` across the
+    hot table and every partition, reading ``columns`` from the partitions.
+    """
+    before = before if before is not None else 2 ** 63 - 1
+    found = {row['id']: row for row in rows}
+    for partition in partitions(conn):
+        if partition['min_id'] >= before:
+            continue
+        ordered = sorted(found, reverse=True)
+        # Partitions come newest id first; once one can't beat the rows we have, none can
+        if len(ordered) >= limit and partition['max_id'] < ordered[limit - 1]:
+            break
+        for row in db.get_db(partition['path']).execute(f'''
+            SELECT {', '.join(columns)} FROM bookings
+            WHERE user_id = ? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (user_id, before, limit)):
+            found.setdefault(row['id'], row)
+    return [found[booking_id] for booking_id in sorted(found, reverse=True)[:limit]]
+
+
+def get(conn, booking_id, user_id):
+    """An archived booking in the shape of bookings.get(), or None."""
+    for partition in partitions(conn):
+        if partition['min_id'] <= booking_id <= partition['max_id']:
+            row = db.get_db(partition['path']).execute('''
+                SELECT id, parking_id, spot_id, spot_uid, parking_name, vehicle_number,
+                       start_time, end_time, duration, cost, status
+                FROM bookings WHERE id = ? AND user_id = ?
+            ''', (booking_id, user_id)).fetchone()
+            if row:
+                return row
+    return None
+
+
+def leftovers(conn, partition, user_id=None):
+    """JSON list of the ids in ``partition``'s range still in the hot table (optionally one user's).
+
+    These are the rows a crash between copy and delete left in both
+    places. Readers adding a partition to the hot table skip them there.
+    """
+    if user_id is None:
+        rows = conn.execute("SELECT id FROM bookings WHERE id BETWEEN ? AND ?",
+                            (partition['min_id'], partition['max_id']))
+    else:
+        rows = conn.execute("SELECT id FROM bookings WHERE user_id = ? AND id BETWEEN ? AND ?",
+                            (user_id, partition['min_id'], partition['max_id']))
+    return json.dumps([row[0] for row in rows])
+
+
+def user_days(conn, user_id):
+    """A user's archived completed bookings summed per start day: (day, cost, duration, bookings) rows.
+
+    Bookings still in the hot table are left out, so the caller can add these to its own.
+    """
+    days = []
+    for partition in partitions(conn):
+        days += db.get_db(partition['path']).execute('''
+            SELECT DATE(start_time) AS day, SUM(cost) AS cost, SUM(duration) AS duration, COUNT(*) AS bookings
+            FROM bookings
+            WHERE user_id = ? AND status = 'completed' AND id NOT IN (SELECT value FROM json_each(?))
+            GROUP BY DATE(start_time)
+        ''', (user_id, leftovers(conn, partition, user_id))).fetchall()
+    return days
+
+
+def revenue(conn):
+    """Archived revenue per (end day, lot): (day, parking_id, revenue, bookings) rows.
+
+    Bookings still in the hot table are left out, as in user_days().
+    """
+    totals = []
+    for partition in partitions(conn):
+        archived = db.connect(partition['path'])
+        try:
+            totals += archived.execute('''
+                SELECT DATE(end_time), parking_id, SUM(IFNULL(cost, 0)), COUNT(*)
+                FROM bookings
+                WHERE status = 'completed' AND end_time IS NOT NULL AND id NOT IN (SELECT value FROM json_each(?))
+                GROUP BY DATE(end_time), parking_id
+            ''', (leftovers(conn, partition),)).fetchall()
+        finally:
+            archived.close()
+    return totals
+
+
+class Archiver:
+    def __init__(self, interval=ARCHIVE_INTERVAL, compact_interval=COMPACT_INTERVAL, path=None):
+        self.interval = interval
+        self.compact_interval = compact_interval
+        self.path = path
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.moved = 0
+        self.compacted = 0
+        self.last_run = None
+        self._last_compact = 0.0
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='booking-archiver', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self, conn, now=None, compact_now=False):
+        started = time.perf_counter()
+        moved = move(conn, now)
+        months = compact(conn, now) if compact_now else []
+        self.runs += 1
+        self.moved += moved
+        self.compacted += len(months)
+        self.last_run = {'at': now or _now(), 'moved': moved, 'compacted': months,
+                         'ms': round((time.perf_counter() - started) * 1000, 1)}
+        return self.last_run
+
+    def stats(self):
+        return {'interval': self.interval, 'after_days': AFTER_DAYS, 'runs': self.runs, 'moved': self.moved,
+                'compacted': self.compacted, 'last_run': self.last_run}
+
+    def _run(self):
+        conns = {path: db.connect(path) for path in ([self.path] if self.path else shards.paths())}
+        try:
+            while not self._stop.wait(self.interval):
+                compact_now = time.monotonic() - self._last_compact >= self.compact_interval
+                for path, conn in conns.items():
+                    try:
+                        self.run_once(conn, compact_now=compact_now)
+                    except Exception as e:
+                        print(f"❌ Archiving {path} failed: {e}")
+                if compact_now:
+                    self._last_compact = time.monotonic()
+        finally:
+            for conn in conns.values():
+                conn.close()
+
+
+_archiver = Archiver()
+
+
+def start():
+    return _archiver.start()
+
+
+def stop():
+    _archiver.stop()
+
+
+def stats():
+    return _archiver.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old completed bookings into monthly archive partitions")
+    parser.add_argument('--every', type=float, help='keep archiving every this many seconds')
+    args = parser.parse_args(argv)
+
+    while True:
+        for path in shards.paths():
+            run = _archiver.run_once(db.get_db(path), compact_now=True)
+            print(f"✅ {path}: archived {run['moved']} booking(s), compacted {len(run['compacted'])} partition(s) "
+                  f"in {run['ms']} ms")
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
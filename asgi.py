@@ -0,0 +1,167 @@
+"""ASGI entry point.
+
+Runs the Flask views on a bounded pool of DB threads (DB_THREADS, by
+default one per pooled SQLite connection) from an asyncio event loop.
+Thousands of idle or slow clients cost a coroutine each, not a thread;
+only requests that are actually running hold a thread and a connection.
+Everything else waits on the event loop.
+
+Streaming responses (the SSE /events routes) finish their view on a DB
+thread, then iterate on a separate stream pool. A long-lived stream
+never pins one of the DB threads.
+
+    uvicorn asgi:application --workers 4
+    python serve.py --workers 4
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import archive
+import db
+import occupancy
+import passwords
+import sweeper
+
+DB_THREADS = int(os.environ.get('DB_THREADS', db.POOL_SIZE))
+STREAM_THREADS = int(os.environ.get('STREAM_THREADS', 512))
+
+_DONE = object()
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _next_chunk(iterator):
+    return next(iterator, _DONE)
+
+
+class ASGIBridge:
+    """Serve a WSGI app over ASGI with a bounded pool of worker threads."""
+
+    def __init__(self, wsgi_app, db_threads=DB_THREADS, stream_threads=STREAM_THREADS):
+        self.wsgi_app = wsgi_app
+        self.db_executor = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix='db')
+        self.stream_executor = ThreadPoolExecutor(max_workers=stream_threads, thread_name_prefix='stream')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                sweeper.start()
+                archive.start()
+                occupancy.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                sweeper.stop()
+                archive.stop()
+                occupancy.stop()
+                passwords.close()
+                self.db_executor.shutdown(wait=False)
+                self.stream_executor.shutdown(wait=False)
+                db.get_pool().close_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def run_view(self, environ):
+        """Run the view and fetch the first body chunk, all on a DB thread.
+
+        Ordinary responses are a single chunk, so they complete in one hop
+        and the request's connection is back in the pool before returning.
+        """
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+
+        body = self.wsgi_app(environ, start_response)
+        iterator = iter(body)
+        first = _next_chunk(iterator)
+        return started, body, iterator, first
+
+    async def http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, b''.join(chunks))
+        started, body, iterator, chunk = await loop.run_in_executor(self.db_executor, self.run_view, environ)
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({'type': 'http.response.start', 'status': started['status'],
+                        'headers': started['headers']})
+            while chunk is not _DONE and not disconnected.is_set():
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.stream_executor, _next_chunk, iterator)
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            watcher.cancel()
+            if hasattr(body, 'close'):
+                await loop.run_in_executor(self.stream_executor, body.close)
+
+
+def make_asgi(wsgi_app, **options):
+    return ASGIBridge(wsgi_app, **options)
+
+
+def create_app():
+    from app import app
+    return make_asgi(app)
+
+
+application = create_app()
@@ -0,0 +1,202 @@
+"""Throughput benchmarks for the parking app.
+
+Runs against a throwaway copy of the database built by init_db.py in a temp
+directory, so data/user.db is never touched.
+
+    python -m bench                 # pooled WAL connections
+    python -m bench --baseline      # old connect-per-call behaviour
+    python -m bench book_race --processes 4
+    python -m bench serve --clients 1000 --workers 4
+    python -m bench routes http --scale medium --save before.json
+    python -m bench routes http --data data/synthetic.db --compare before.json
+    python -m bench shards --threads 16
+
+`routes` drives every route in app.py and the JSON API through the Flask
+test client; `http` does the same over real HTTP against serve.py's ASGI
+workers. --scale builds a synthetic database with datagen.py first (or
+--data copies one made earlier). --save writes each result as JSON and
+--compare exits non-zero if any throughput fell by more than --tolerance.
+
+This package holds the shared harness: the throwaway database, the app
+with stand-in page templates, the threaded request driver and the
+allocation checks. Each job lives in its own module (bench/pages.py,
+bench/shards.py, ...) and is registered in bench/__main__.py.
+"""
+import multiprocessing
+import os
+import runpy
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from jinja2 import ChoiceLoader, DictLoader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Stand-ins for the page templates; the cached fragments (templates/fragments) are real
+TEMPLATES = {name: '' for name in ('admin_stats.html', 'admin_users.html', 'profile.html', 'login.html',
+                                   'register.html')}
+TEMPLATES.update({'user_dashboard.html': '{{ lot_table }}', 'admin_dashboard.html': '{{ lot_table }}',
+                  'admin_parking_details.html': '{{ spot_grid }}'})
+
+
+def setup_database(workdir, extra_spots=5000, history=0, scale=None, data=None):
+    os.chdir(workdir)
+    import db
+    if data:
+        os.makedirs(os.path.dirname(db.DATABASE), exist_ok=True)
+        shutil.copyfile(data, db.DATABASE)
+    elif scale:
+        import datagen
+        datagen.generate(db.DATABASE, *datagen.SCALES[scale])
+    else:
+        runpy.run_path(os.path.join(ROOT, 'init_db.py'))
+    conn = db.connect(db.DATABASE)
+    conn.executemany("INSERT INTO spots (parking_id, spot_uid) VALUES (1, ?)",
+                     ((f"B-{i}",) for i in range(1, extra_spots + 1)))
+    conn.execute("UPDATE parkings SET total_slots = total_slots + ? WHERE id = 1", (extra_spots,))
+    # A frequent commuter: `history` completed bookings for user 1
+    conn.executemany('''
+        INSERT INTO bookings (user_id, parking_id, spot_id, vehicle_number, start_time, end_time, duration, cost, status)
+        VALUES (1, 3, 31 + ? % 30, 'DL-HIST', ?, ?, 2, 40, 'completed')
+    ''', ((i, f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} 09:00", f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} 11:00")
+          for i in range(history)))
+    conn.commit()
+    conn.close()
+
+
+def use_baseline_connections():
+    # What every module did before the shared pool: a fresh default-journal
+    # connection per call, closed straight after.
+    import db
+
+    def connect(path=None):
+        conn = sqlite3.connect(path or db.DATABASE, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    db.connect = connect
+    db.get_pool().size = 0
+
+
+def make_app():
+    from app import app
+    app.config['TESTING'] = True
+    # Page templates aren't needed to measure the data layer; pages render
+    # just their cached fragments.
+    app.jinja_loader = ChoiceLoader([app.jinja_loader, DictLoader(TEMPLATES)])
+    return app
+
+
+def logged_in_client(app, user_id=1, is_admin=False):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['full_name'] = 'Bench User'
+        sess['is_admin'] = is_admin
+    return client
+
+
+def run(name, app, request_fn, threads, per_thread, user_id=1, is_admin=False):
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def worker(n):
+        client = logged_in_client(app, user_id, is_admin)
+        mine = []
+        try:
+            for i in range(per_thread):
+                t0 = time.perf_counter()
+                resp = request_fn(client, n, i)
+                mine.append(time.perf_counter() - t0)
+                if resp.status_code >= 500:
+                    raise AssertionError(f"request {i} returned {resp.status_code}")
+        except Exception as e:
+            # An exception here would die with the thread; the caller re-raises it
+            with lock:
+                failures.append(f"thread {n}: {e!r}")
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    assert not failures, f"{name}: {len(failures)} thread(s) failed, first: {failures[0]}"
+    report(name, latencies, elapsed)
+    return latencies, elapsed
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[k]
+
+
+RESULTS = {}
+_RUN = {}
+
+
+def report(name, latencies, elapsed):
+    RESULTS[name] = {'requests': len(latencies), 'req_s': round(len(latencies) / elapsed, 1),
+                     'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                     'p99_ms': round(percentile(latencies, 99) * 1000, 3)}
+    print(f"{name:<14} {len(latencies) / elapsed:>9.1f} req/s  "
+          f"p50 {percentile(latencies, 50) * 1000:6.2f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:6.2f} ms")
+
+
+def check_allocations():
+    import allocation
+    import counters
+    import db
+    conn = db.connect(db.DATABASE)
+    collisions = allocation.find_collisions(conn)
+    drift = counters.find_drift(conn)
+    # Future reservations hold a window but don't occupy their spot yet
+    live = conn.execute("SELECT COUNT(*) FROM bookings WHERE status IN ('booked', 'ongoing') AND start_time <= ?",
+                        (datetime.now().strftime("%Y-%m-%d %H:%M"),)).fetchone()[0]
+    occupied = conn.execute("SELECT COUNT(*) FROM spots WHERE status = 'occupied'").fetchone()[0]
+    conn.close()
+    assert not collisions, f"{len(collisions)} spots double-allocated"
+    assert live == occupied, f"{live} live bookings but {occupied} occupied spots"
+    assert not drift, f"available_slots drifted on {len(drift)} lot(s)"
+    print(f"{'':<14} ok: {live} live bookings, no collisions")
+
+
+def _claim_worker(args):
+    import allocation
+    import db
+    workdir, parking_id, worker, attempts = args
+    os.chdir(workdir)
+    conn = db.connect(db.DATABASE)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(attempts):
+        t0 = time.perf_counter()
+        allocation.claim_spot(conn, parking_id, 1, f"KA-{worker}-{i}",
+                              '2025-01-01 09:00', '2025-01-01 10:00')
+        latencies.append(time.perf_counter() - t0)
+    finished = time.perf_counter()
+    conn.close()
+    return latencies, started, finished
+
+
+def run_processes(workdir, processes, per_process, parking_id=2):
+    jobs = [(workdir, parking_id, n, per_process) for n in range(processes)]
+    # Spawned, not forked: a forked worker would inherit this process's open
+    # connections. Timed inside the workers, so start-up isn't counted.
+    with multiprocessing.get_context('spawn').Pool(processes) as pool:
+        results = pool.map(_claim_worker, jobs)
+    report(f"claim x{processes}p", [t for r in results for t in r[0]],
+           max(r[2] for r in results) - min(r[1] for r in results))
@@ -0,0 +1,143 @@
+"""python -m bench: run the benchmark jobs and scenarios named on the command line."""
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+from datetime import datetime
+
+import bench
+from bench import (ROOT, RESULTS, _RUN, check_allocations, make_app, run, run_processes, setup_database,
+                   use_baseline_connections)
+from bench.billing import bench_billing
+from bench.export import bench_export
+from bench.journal import bench_journal
+from bench.login import bench_login
+from bench.occupancy import bench_occupancy
+from bench.pages import bench_pages
+from bench.provision import bench_provision, bench_spot_details
+from bench.reservations import bench_reservations
+from bench.routes import SCENARIOS, bench_routes
+from bench.server import bench_http, bench_serve
+from bench.shards import bench_shards
+from bench.sweeper import bench_sweeper
+
+JOBS = {
+    'provision': bench_provision,
+    'reservations': bench_reservations,
+    'spot_details': bench_spot_details,
+    'serve': bench_serve,
+    'journal': bench_journal,
+    'export': bench_export,
+    'billing': bench_billing,
+    'occupancy': bench_occupancy,
+    'pages': bench_pages,
+    'sweeper': bench_sweeper,
+    'routes': bench_routes,
+    'http': bench_http,
+    'login': bench_login,
+    'shards': bench_shards,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=bench.__doc__.splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS))
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=250, help='requests per thread')
+    parser.add_argument('--history', type=int, default=50000,
+                        help='completed bookings seeded for the benchmark user')
+    parser.add_argument('--reservations', type=int, default=1_000_000,
+                        help='reservations loaded by the reservations job, rows for export and billing')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='also race claim_spot() from this many processes')
+    parser.add_argument('--logins', type=int, default=80,
+                        help='logins in the login job\'s storm')
+    parser.add_argument('--route-requests', type=int, default=200,
+                        help='requests per route for the routes job')
+    parser.add_argument('--clients', type=int, default=1000,
+                        help='concurrent HTTP clients for the serve and http jobs')
+    parser.add_argument('--client-requests', type=int, default=5,
+                        help='requests per client for the serve and http jobs')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='uvicorn workers for the serve and http jobs')
+    parser.add_argument('--scale', help='generate a synthetic database first: ' + ', '.join(_scales()))
+    parser.add_argument('--data', help='copy of this database to run against instead')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='throughput drop that counts as a regression (default 15%%)')
+    parser.add_argument('--baseline', action='store_true',
+                        help='connect per call without pooling or pragmas')
+    args = parser.parse_args(argv)
+    data, save, compare = (os.path.abspath(path) if path else None for path in (args.data, args.save, args.compare))
+    _RUN.update(scale=args.scale, data=args.data)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        setup_database(workdir, history=args.history, scale=args.scale, data=data)
+        if args.baseline:
+            use_baseline_connections()
+        app = make_app()
+        for name in args.scenarios:
+            if name in JOBS:
+                JOBS[name](args)
+            else:
+                run(name, app, SCENARIOS[name], args.threads, args.requests)
+        if args.processes:
+            run_processes(workdir, args.processes, args.requests)
+        if not args.baseline:
+            check_allocations()
+        os.chdir(ROOT)
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump({'meta': _meta(args), 'results': RESULTS}, f, indent=2)
+        print(f"✅ Results saved to {args.save}")
+    if compare:
+        return compare_results(compare, args.tolerance)
+    return 0
+
+
+def _scales():
+    import datagen
+    return sorted(datagen.SCALES)
+
+
+def _meta(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'at': datetime.now().strftime("%Y-%m-%d %H:%M"), 'cpus': os.cpu_count(),
+            'scale': args.scale, 'data': args.data, 'baseline': args.baseline, 'threads': args.threads}
+
+
+def compare_results(path, tolerance):
+    """Print each result against ``path``; 1 if any throughput fell by more than ``tolerance``."""
+    with open(path) as f:
+        saved = json.load(f)
+    before = saved['results']
+    meta = saved.get('meta', {})
+    if (meta.get('scale'), meta.get('data')) != (_RUN.get('scale'), _RUN.get('data')):
+        print(f"⚠️  {path} was run against different data (scale {meta.get('scale')}, data {meta.get('data')})")
+    regressions = 0
+    print(f"{'':<14} {'before':>9} {'now':>9} {'change':>8}   p99 before/now (ms)")
+    for name, now in RESULTS.items():
+        old = before.get(name)
+        if not old or not old['req_s']:
+            continue
+        change = now['req_s'] / old['req_s'] - 1
+        regressed = change < -tolerance
+        regressions += regressed
+        print(f"{name:<14} {old['req_s']:>9.1f} {now['req_s']:>9.1f} {change:>+7.1%}   "
+              f"{old['p99_ms']:.2f} / {now['p99_ms']:.2f}{'  ❌ regression' if regressed else ''}")
+    if regressions:
+        print(f"❌ {regressions} result(s) fell by more than {tolerance:.0%}")
+        return 1
+    print(f"✅ No throughput regressions beyond {tolerance:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,52 @@
+"""Re-pricing completed bookings under a tariff."""
+import time
+from datetime import datetime
+
+
+def bench_billing(args):
+    # Re-price `--reservations` completed bookings on one lot: the old
+    # per-row strptime loop, the tariff formulas one booking at a time, and
+    # price_batch() over whole chunks (NumPy, when installed).
+    import billing
+    import db
+    total = args.reservations
+    conn = db.connect(db.DATABASE)
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < :total)
+        INSERT INTO bookings (user_id, parking_id, spot_id, vehicle_number, start_time, end_time, duration, cost, status)
+        SELECT 1, 3, 31 + i % 30, 'BIL',
+               strftime('%Y-%m-%d %H:%M', '2020-01-01', '+' || (i * 7) || ' minutes'),
+               strftime('%Y-%m-%d %H:%M', '2020-01-01', '+' || (i * 7 + 15 + i % 1500) || ' minutes'),
+               1, 20, 'completed'
+        FROM n
+    ''', {'total': total})
+    conn.commit()
+    rows = conn.execute('''
+        SELECT start_time, end_time FROM bookings WHERE parking_id = 3 AND status = 'completed'
+    ''').fetchall()
+
+    started = time.perf_counter()
+    for start_time, end_time in rows:
+        duration = datetime.strptime(end_time, "%Y-%m-%d %H:%M") - datetime.strptime(start_time, "%Y-%m-%d %H:%M")
+        duration.total_seconds() / 3600 * 20
+    print(f"{'strptime loop':<14} {len(rows):,} bookings in {time.perf_counter() - started:.2f} s (flat rate only)")
+
+    billing.set_tariff(conn, 3, first_hour_rate=30, night_rate=10, night_start=22 * 60, night_end=6 * 60,
+                       daily_cap=250, grace_minutes=15)
+    conn.commit()
+    tariff = billing.load_tariff(conn, 3)
+    starts, ends = zip(*conn.execute(f'''
+        SELECT {billing.MINUTES_SQL.format('start_time')}, {billing.MINUTES_SQL.format('end_time')}
+        FROM bookings WHERE parking_id = 3 AND status = 'completed'
+    '''))
+    started = time.perf_counter()
+    [billing._cost(billing._Scalars, start, end, tariff) for start, end in zip(starts, ends)]
+    print(f"{'tariff scalar':<14} {len(starts):,} bookings in {time.perf_counter() - started:.2f} s")
+    started = time.perf_counter()
+    billing.price_batch(starts, ends, tariff)
+    print(f"{'tariff batch':<14} {len(starts):,} bookings in {time.perf_counter() - started:.2f} s")
+
+    started = time.perf_counter()
+    changed = billing.rebill(conn, parking_id=3)
+    print(f"{'rebill':<14} {changed:,} bookings re-priced and written in {time.perf_counter() - started:.2f} s")
+    conn.close()
@@ -0,0 +1,64 @@
+"""Streaming bookings exports while bookings keep coming in."""
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+def bench_export(args):
+    # Export `--reservations` completed bookings as CSV (and Parquet, if
+    # pyarrow is installed) while another thread keeps booking; reports how
+    # much the process's peak RSS grew and the worst booking latency.
+    import resource
+    import allocation
+    import db
+    import export
+    total = args.reservations
+    conn = db.connect(db.DATABASE)
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < :total)
+        INSERT INTO bookings (user_id, parking_id, spot_id, vehicle_number, start_time, end_time, duration, cost, status)
+        SELECT 1, 3, 31 + i % 30, 'EXP',
+               strftime('%Y-%m-%d %H:%M', '2020-01-01', '+' || (i / 30) || ' hours'),
+               strftime('%Y-%m-%d %H:%M', '2020-01-01', '+' || (i / 30 + 1) || ' hours'),
+               1, 20, 'completed'
+        FROM n
+    ''', {'total': total})
+    conn.commit()
+    conn.close()
+
+    formats = ['csv']
+    try:
+        import pyarrow  # noqa: F401
+        formats.append('parquet')
+    except ImportError:
+        pass
+
+    for fmt in formats:
+        done = threading.Event()
+        writes = []
+
+        def keep_booking():
+            writer = db.connect(db.DATABASE)
+            i = 0
+            while not done.is_set():
+                t0 = time.perf_counter()
+                start = datetime(2032, 1, 1) + timedelta(hours=i)
+                allocation.claim_spot(writer, 1, 1, f"EXP-{fmt}-{i}", start.strftime("%Y-%m-%d %H:%M"),
+                                      (start + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M"))
+                writes.append(time.perf_counter() - t0)
+                i += 1
+                time.sleep(0.005)
+            writer.close()
+
+        booker = threading.Thread(target=keep_booking)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        booker.start()
+        started = time.perf_counter()
+        size = sum(len(piece) for piece in export.stream('bookings', fmt))
+        elapsed = time.perf_counter() - started
+        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+        done.set()
+        booker.join()
+        print(f"{'export ' + fmt:<14} {total:,} rows in {elapsed:.1f} s ({total / elapsed:,.0f} rows/s), "
+              f"{size / 2 ** 20:.0f} MiB, peak RSS +{growth / 1024:.1f} MiB; "
+              f"{len(writes)} bookings meanwhile, worst {max(writes) * 1000:.1f} ms")
@@ -0,0 +1,80 @@
+"""Booking state changes: commit per change against the journal's group commit."""
+import threading
+import time
+
+from bench import report
+
+
+def bench_journal(args):
+    # Start then complete `--requests` bookings from each of `--threads`
+    # threads: one commit per state change (what the routes used to do)
+    # against the journal's group commit, under both fsync settings.
+    import bookings
+    import db
+    import journal
+    total = args.threads * args.requests
+
+    def seed(conn):
+        first = conn.execute("SELECT COALESCE(MAX(id), 0) FROM bookings").fetchone()[0]
+        spots = [row[0] for row in conn.execute("SELECT id FROM spots WHERE parking_id = 1")]
+        conn.executemany('''
+            INSERT INTO bookings (user_id, parking_id, spot_id, vehicle_number, start_time, end_time, status)
+            VALUES (1, 1, ?, 'DL-JRNL', '2031-01-01 09:00', '2031-01-01 11:00', 'booked')
+        ''', ((spots[i % len(spots)],) for i in range(total)))
+        conn.commit()
+        return [{'id': first + 1 + i, 'spot_id': spots[i % len(spots)]} for i in range(total)]
+
+    def drive(name, change):
+        conn = db.connect(db.DATABASE)
+        seeded = seed(conn)
+        conn.close()
+        chunks = [seeded[n::args.threads] for n in range(args.threads)]
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(chunk):
+            mine = []
+            for booking in chunk:
+                for step in ('start', 'complete'):
+                    t0 = time.perf_counter()
+                    change(step, booking)
+                    mine.append(time.perf_counter() - t0)
+            with lock:
+                latencies.extend(mine)
+
+        threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        journal.flush()
+        report(name, latencies, time.perf_counter() - started)
+
+    at = '2031-01-01 10:00'
+    for synchronous in ('FULL', 'NORMAL'):
+        local = threading.local()
+
+        def direct(step, booking):
+            conn = getattr(local, 'conn', None)
+            if conn is None:
+                conn = local.conn = db.connect(db.DATABASE)
+                conn.execute(f"PRAGMA synchronous = {synchronous}")
+            project = bookings._project_start if step == 'start' else bookings._project_complete
+            project(conn, {'booking_id': booking['id'], 'spot_id': booking['spot_id'], 'at': at})
+            conn.commit()
+
+        drive(f"commit {synchronous.lower()}", direct)
+
+        durability = 'full' if synchronous == 'FULL' else 'normal'
+        journal._writer = journal.Writer(durability=durability)
+        drive(f"journal {durability}", lambda step, booking: getattr(bookings, step)(booking, at))
+        stats = journal._writer.stats()
+        journal._writer.close()
+        print(f"{'':<14} {stats['commits']} commits for {stats['events']} events "
+              f"({stats['events_per_commit']} per commit)")
+
+    journal._writer = journal.Writer(durability='async')
+    drive('journal async', lambda step, booking: getattr(bookings, step)(booking, at))
+    journal._writer.close()
+    journal._writer = None
@@ -0,0 +1,59 @@
+"""A login storm next to dashboard traffic, with and without the hashing pool."""
+import os
+import threading
+import time
+
+from bench import logged_in_client, make_app, report, run
+from bench.routes import get_dashboard
+
+
+def bench_login(args):
+    # --logins logins split over --threads threads, while two more threads
+    # load /dashboard for as long as the storm lasts: hashing inline, in the
+    # process pool, and in the pool with repeat logins taking the verified
+    # fast path.
+    import passwords
+    app = make_app()
+    run('dashboard', app, get_dashboard, 2, args.requests)
+    workers = max(1, os.cpu_count() or 1)
+    for name, hash_workers, ttl in (('inline', 0, 0), (f"pool x{workers}", workers, 0),
+                                    ('pool+fast', workers, 300)):
+        passwords.hasher.close()
+        passwords.hasher = passwords.Hasher(workers=hash_workers)
+        passwords.VERIFIED_TTL = ttl
+        passwords._verified.clear()
+        if hash_workers:
+            passwords.hasher.run(abs, 0)  # start the workers outside the timings
+        done = threading.Event()
+        logins, pages = [], []
+
+        def storm(count):
+            client = app.test_client()
+            for _ in range(count):
+                t0 = time.perf_counter()
+                response = client.post('/login', data={'email': 'test@test.com', 'password': 'Test@1234'})
+                assert response.location.endswith('/dashboard'), response.location
+                logins.append(time.perf_counter() - t0)
+
+        def browse():
+            client = logged_in_client(app)
+            while not done.is_set():
+                t0 = time.perf_counter()
+                client.get('/dashboard')
+                pages.append(time.perf_counter() - t0)
+
+        stormers = [threading.Thread(target=storm, args=(max(1, args.logins // args.threads),))
+                    for _ in range(args.threads)]
+        browsers = [threading.Thread(target=browse) for _ in range(2)]
+        started = time.perf_counter()
+        for thread in stormers + browsers:
+            thread.start()
+        for thread in stormers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        for thread in browsers:
+            thread.join()
+        report(f"login {name}", logins, elapsed)
+        report(f"dash {name}", pages, elapsed)
+    passwords.hasher.close()
@@ -0,0 +1,70 @@
+"""Hourly occupancy: spreading bookings over lot-hours, refreshes and reports."""
+import os
+import time
+from datetime import datetime, timedelta
+
+
+def bench_occupancy(args, lots=1000, days=365):
+    # A year of `--reservations` completed bookings over 1,000 lots, made by
+    # datagen.py. Spreads them over lot-hours with the old per-row strptime
+    # loop and with occupancy.hourly(), then times a full rebuild, folding
+    # in 10,000 new bookings, and the admin reports.
+    import billing
+    import datagen
+    import db
+    import occupancy
+    path = os.path.join('data', 'occupancy.db')
+    datagen.generate(path, lots, 20, 1000, args.reservations, days=days)
+    conn = db.connect(path)
+    rows = conn.execute("SELECT parking_id, start_time, end_time FROM bookings").fetchall()
+
+    started = time.perf_counter()
+    totals = {}
+    for parking_id, start_time, end_time in rows:
+        start, end = datetime.strptime(start_time, "%Y-%m-%d %H:%M"), datetime.strptime(end_time, "%Y-%m-%d %H:%M")
+        hour = start.replace(minute=0)
+        while hour < end:
+            following = hour + timedelta(hours=1)
+            totals[parking_id, hour] = (totals.get((parking_id, hour), 0)
+                                        + (min(end, following) - max(start, hour)).total_seconds() / 60)
+            hour = following
+    print(f"{'strptime loop':<14} {len(rows):,} bookings -> {len(totals):,} lot-hours "
+          f"in {time.perf_counter() - started:.2f} s")
+
+    lot_ids, starts, ends = zip(*conn.execute(f'''
+        SELECT parking_id, {billing.MINUTES_SQL.format('start_time')}, {billing.MINUTES_SQL.format('end_time')}
+        FROM bookings
+    '''))
+    started = time.perf_counter()
+    hours = occupancy.hourly(lot_ids, starts, ends, [1] * len(starts))
+    print(f"{'hourly()':<14} {len(starts):,} bookings -> {len(hours):,} lot-hours "
+          f"in {time.perf_counter() - started:.2f} s")
+
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    occupancy.rebuild(conn)
+    conn.commit()
+    print(f"{'rebuild':<14} read, spread and written in {time.perf_counter() - started:.2f} s")
+
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < 10000)
+        INSERT INTO bookings (user_id, parking_id, spot_id, vehicle_number, start_time, end_time, duration, cost, status)
+        SELECT 1, 1 + i % :lots, (i % :lots) * 20 + 1, 'OCC',
+               strftime('%Y-%m-%d %H:%M', 'now', '-' || (i % 720) || ' hours'),
+               strftime('%Y-%m-%d %H:%M', 'now', '-' || (i % 720) || ' hours', '+90 minutes'), 1.5, 15, 'completed'
+        FROM n
+    ''', {'lots': lots})
+    conn.commit()
+    started = time.perf_counter()
+    applied = occupancy.refresh(conn)
+    print(f"{'refresh':<14} {applied:,} queued changes folded in in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    first, last = occupancy._hours()
+    for name, report in (('lot report', lambda: (occupancy.heatmap(conn, 1, 20), occupancy.busiest(conn, 1, 20))),
+                         ('all lots', lambda: occupancy._by_lot(conn, first, last))):
+        started = time.perf_counter()
+        for _ in range(20):
+            report()
+        print(f"{name:<14} {(time.perf_counter() - started) / 20 * 1000:.1f} ms over the last "
+              f"{occupancy.REPORT_DAYS} days")
+    conn.close()
@@ -0,0 +1,39 @@
+"""Cached page fragments, compression and conditional GETs."""
+import time
+
+from bench import logged_in_client, make_app
+
+
+def bench_pages(args, requests=50):
+    # The lot tables and lot 1's spot grid (setup_database's extra spots):
+    # time per request with every fragment rendered afresh and with the
+    # fragment cache warm, then bytes on the wire plain, compressed, and
+    # as a 304 for a client that already has the page.
+    import compression
+    import fragments
+    app = make_app()
+    clients = {'user': logged_in_client(app), 'admin': logged_in_client(app, user_id=2, is_admin=True)}
+    encodings = ['identity', 'gzip'] + (['br'] if compression.brotli is not None else [])
+    for name, who, path in (('dashboard', 'user', '/dashboard'), ('admin', 'admin', '/admin'),
+                            ('admin_parking', 'admin', '/admin/parking/1')):
+        client = clients[who]
+        timings = {}
+        for label, cached in (('uncached', False), ('cached', True)):
+            fragments.enable(cached)
+            client.get(path)
+            started = time.perf_counter()
+            for _ in range(requests):
+                client.get(path, headers={'Accept-Encoding': 'identity'})
+            timings[label] = (time.perf_counter() - started) / requests * 1000
+        sizes = {}
+        for encoding in encodings:
+            started = time.perf_counter()
+            response = client.get(path, headers={'Accept-Encoding': encoding})
+            sizes[encoding] = (len(response.data), (time.perf_counter() - started) * 1000)
+        etag = response.headers['ETag']
+        not_modified = client.get(path, headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+        assert not_modified.status_code == 304, not_modified.status_code
+        print(f"{name:<14} {timings['uncached']:.2f} -> {timings['cached']:.2f} ms/request cached; "
+              + ', '.join(f"{encoding} {size:,} B ({ms:.1f} ms)" for encoding, (size, ms) in sizes.items())
+              + f", 304 {len(not_modified.data)} B")
+    fragments.enable(True)
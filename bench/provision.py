@@ -0,0 +1,64 @@
+"""Bulk lot provisioning and the batched admin spot-details view."""
+import time
+
+from bench import logged_in_client, make_app
+
+
+def bench_provision(args, lots=100, spots=2000):
+    # Old path (one INSERT per spot, as admin_add_parking used to do) against
+    # provisioning.create_lots(), each on an empty lot table.
+    import db
+    import provisioning
+    conn = db.connect(db.DATABASE)
+    batch = [dict(name=f"Garage {n}", address=f"{n} Ring Road", pincode=f"{110000 + n}",
+                  price=20, slots=spots, scheme='level', levels=4, rows=10) for n in range(lots)]
+
+    started = time.perf_counter()
+    for lot in batch:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO parkings (name, address, pincode, price_per_hour, total_slots) VALUES (?, ?, ?, ?, ?)",
+                       (lot['name'], lot['address'], lot['pincode'], lot['price'], lot['slots']))
+        parking_id = cursor.lastrowid
+        for i in range(1, spots + 1):
+            cursor.execute("INSERT INTO spots (parking_id, spot_uid) VALUES (?, ?)", (parking_id, f"A-{i}"))
+        conn.commit()
+    looped = time.perf_counter() - started
+    conn.execute("DELETE FROM spots WHERE parking_id > 3")
+    conn.execute("DELETE FROM parkings WHERE id > 3")
+    conn.commit()
+
+    started = time.perf_counter()
+    provisioning.create_lots(conn, batch)
+    bulk = time.perf_counter() - started
+    conn.close()
+    print(f"{'provision':<14} {lots} lots x {spots} spots: per-row {looped:.2f} s, bulk {bulk:.2f} s "
+          f"({lots * spots / bulk:,.0f} spots/s)")
+
+
+def bench_spot_details(args, spots=500):
+    # Admin lot view: one request per spot vs one batched request (+ a 304 revisit)
+    import db
+    import provisioning
+    conn = db.connect(db.DATABASE)
+    parking_id = provisioning.create_lots(conn, [dict(name='Details Lot', address='x', pincode='1',
+                                                      price=10, slots=spots)])[0]
+    spot_ids = [row[0] for row in conn.execute("SELECT id FROM spots WHERE parking_id = ?", (parking_id,))]
+    conn.close()
+    app = make_app()
+    admin = logged_in_client(app, user_id=2, is_admin=True)
+
+    started = time.perf_counter()
+    per_spot_bytes = sum(len(admin.get(f'/admin/spot_details/{spot_id}').data) for spot_id in spot_ids)
+    per_spot = time.perf_counter() - started
+
+    started = time.perf_counter()
+    resp = admin.get(f'/admin/parking/{parking_id}/spot_details')
+    batched = time.perf_counter() - started
+
+    started = time.perf_counter()
+    revisit = admin.get(f'/admin/parking/{parking_id}/spot_details', headers={'If-None-Match': resp.headers['ETag']})
+    unchanged = time.perf_counter() - started
+    assert revisit.status_code == 304, revisit.status_code
+
+    print(f"{'spot_details':<14} {spots} spots: per-spot {per_spot * 1000:.1f} ms / {per_spot_bytes} B, "
+          f"batched {batched * 1000:.1f} ms / {len(resp.data)} B, 304 {unchanged * 1000:.2f} ms")
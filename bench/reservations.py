@@ -0,0 +1,62 @@
+"""Free-spot lookups over a lot packed with future reservations."""
+import time
+from datetime import datetime, timedelta
+
+
+def bench_reservations(args, spots=2000, queries=200):
+    # `total` future reservations packed back to back over `spots` spots of
+    # one lot, then random "free spots between T1 and T2" lookups: R*Tree
+    # interval index vs filtering the lot's bookings.
+    import random
+    import allocation
+    import db
+    import provisioning
+    import reservations
+    total = args.reservations
+    conn = db.connect(db.DATABASE)
+    parking_id = provisioning.create_lots(conn, [dict(name='Reservation Lot', address='x', pincode='1',
+                                                      price=10, slots=spots)])[0]
+    first_spot = conn.execute("SELECT MIN(id) FROM spots WHERE parking_id = ?", (parking_id,)).fetchone()[0]
+    per_spot = -(-total // spots)
+
+    started = time.perf_counter()
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < :total)
+        INSERT INTO bookings (user_id, parking_id, spot_id, vehicle_number, start_time, end_time, status)
+        SELECT 1, :parking_id, :first_spot + i % :spots, 'RSV',
+               strftime('%Y-%m-%d %H:%M', '2030-01-01', '+' || ((i / :spots) * 3) || ' hours'),
+               strftime('%Y-%m-%d %H:%M', '2030-01-01', '+' || ((i / :spots) * 3 + 2) || ' hours'),
+               'booked'
+        FROM n
+    ''', {'total': total, 'parking_id': parking_id, 'first_spot': first_spot, 'spots': spots})
+    conn.commit()
+    loaded = time.perf_counter() - started
+
+    rng = random.Random(42)
+    base = datetime(2030, 1, 1)
+    windows = []
+    for _ in range(queries):
+        # Overlaps one of the back-to-back [3k, 3k + 2) hour blocks on every spot
+        start = base + timedelta(hours=3 * rng.randrange(per_spot - 1) + rng.choice((0, 1)))
+        end = start + timedelta(hours=rng.choice((1, 2, 3)))
+        windows.append((start.strftime("%Y-%m-%d %H:%M"), end.strftime("%Y-%m-%d %H:%M")))
+
+    started = time.perf_counter()
+    for start, end in windows:
+        reservations.free_spots(conn, parking_id, start, end)
+    indexed = (time.perf_counter() - started) / queries
+
+    started = time.perf_counter()
+    for start, end in windows[:20]:
+        conn.execute('''
+            SELECT id FROM spots WHERE parking_id = ? AND id NOT IN (
+                SELECT spot_id FROM bookings
+                WHERE parking_id = ? AND status IN ('booked', 'ongoing') AND start_time < ? AND end_time > ?)
+        ''', (parking_id, parking_id, end, start)).fetchall()
+    filtered = (time.perf_counter() - started) / 20
+
+    # Every window above is fully booked, so a claim must find nothing
+    assert allocation.claim_spot(conn, parking_id, 1, 'RSV-X', *windows[0]) is None
+    conn.close()
+    print(f"{'reservations':<14} {total:,} loaded in {loaded:.1f} s; free-spot lookup "
+          f"{indexed * 1000:.2f} ms indexed vs {filtered * 1000:.1f} ms filtering bookings")
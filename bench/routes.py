@@ -0,0 +1,97 @@
+"""Request scenarios for the threaded driver, and the every-route job."""
+from bench import make_app, run
+
+
+def get_dashboard(client, n, i):
+    return client.get('/dashboard')
+
+
+def get_profile(client, n, i):
+    return client.get('/profile')
+
+
+def post_book(client, n, i):
+    return client.post('/book', data={
+        'parking_id': 1,
+        'start_time': '2025-01-01T09:00',
+        'duration': 2,
+        'vehicle_number': f"DL-{n}-{i}",
+    })
+
+
+def post_book_race(client, n, i):
+    # Everyone fights over the 20 spots of lot 2
+    return client.post('/book', data={
+        'parking_id': 2,
+        'start_time': '2025-01-01T09:00',
+        'duration': 1,
+        'vehicle_number': f"MH-{n}-{i}",
+    })
+
+
+SCENARIOS = {
+    'dashboard': get_dashboard,
+    'profile': get_profile,
+    'book': post_book,
+    'book_race': post_book_race,
+}
+
+
+# (name, who, method, path, form data or None, requests or None for --route-requests).
+# Every route in app.py and api.py except the admin edits, whose effects
+# would skew the runs after them, and the endless /events streams.
+# Logging in and registering are mostly password hashing, so fewer of those.
+ROUTES = [
+    ('index', None, 'GET', '/', None, None),
+    ('login_page', None, 'GET', '/login', None, None),
+    ('login', None, 'POST', '/login', {'email': 'test@test.com', 'password': 'Test@1234'}, 20),
+    ('register', None, 'POST', '/register', {'email': 'new-{n}-{i}@example.com', 'password': 'Bench@1234',
+                                             'full_name': 'New User', 'address': 'Somewhere',
+                                             'pin_code': '110011'}, 20),
+    ('dashboard', 'user', 'GET', '/dashboard', None, None),
+    ('dashboard_q', 'user', 'GET', '/dashboard?q=Road', None, None),
+    ('dashboard_near', 'user', 'GET', '/dashboard?lat=12.97&lng=77.59', None, None),
+    ('availability', 'user', 'GET', '/parking/1/availability?start_time=2030-01-01T09:00&duration=2', None, None),
+    ('book', 'user', 'POST', '/book', {'parking_id': 1, 'start_time': '2030-01-01T09:00', 'duration': 1,
+                                       'vehicle_number': 'RT-{n}-{i}'}, None),
+    ('profile', 'user', 'GET', '/profile', None, None),
+    ('admin', 'admin', 'GET', '/admin', None, None),
+    ('admin_users', 'admin', 'GET', '/admin/users', None, None),
+    ('admin_stats', 'admin', 'GET', '/admin/stats', None, None),
+    ('admin_parking', 'admin', 'GET', '/admin/parking/1', None, None),
+    ('admin_spot', 'admin', 'GET', '/admin/spot_details/1', None, None),
+    ('admin_spots', 'admin', 'GET', '/admin/parking/1/spot_details?ids=' + ','.join(map(str, range(1, 51))),
+     None, None),
+    ('admin_export', 'admin', 'GET', '/admin/export/revenue_by_day', None, None),
+    ('admin_occupancy', 'admin', 'GET', '/admin/occupancy/1', None, None),
+    ('metrics', None, 'GET', '/metrics', None, None),
+    ('api_lots', 'user', 'GET', '/api/v1/lots?limit=20', None, None),
+    ('api_lots_q', 'user', 'GET', '/api/v1/lots?q=Road&limit=20', None, None),
+    ('api_lot', 'user', 'GET', '/api/v1/lots/1', None, None),
+    ('api_avail', 'user', 'GET', '/api/v1/lots/1/availability?start_time=2030-01-01T09:00&duration=2', None, None),
+    ('api_history', 'user', 'GET', '/api/v1/bookings?limit=20', None, None),
+    ('api_active', 'user', 'GET', '/api/v1/bookings?status=active', None, None),
+    ('api_summary', 'user', 'GET', '/api/v1/summary', None, None),
+]
+
+
+def _route_request(method, path, data):
+    def request_fn(client, n, i):
+        if method == 'GET':
+            response = client.get(path)
+        else:
+            response = client.post(path, data={key: str(value).format(n=n, i=i) for key, value in data.items()})
+        # Streamed responses (exports) only do their work as the body is read
+        response.get_data()
+        return response
+    return request_fn
+
+
+def bench_routes(args):
+    # Every route in ROUTES through the test client, --route-requests each
+    # split over --threads threads.
+    app = make_app()
+    for name, who, method, path, data, requests in ROUTES:
+        per_thread = max(1, (requests or args.route_requests) // args.threads)
+        run(name, app, _route_request(method, path, data), args.threads, per_thread,
+            user_id=2 if who == 'admin' else 1, is_admin=who == 'admin')
@@ -0,0 +1,140 @@
+"""The app over real HTTP: serve.py's workers against the Flask dev server."""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+from bench import ROOT, make_app, report
+from bench.routes import ROUTES
+
+
+def stub_wsgi():
+    return make_app()
+
+
+def stub_asgi():
+    import asgi
+    return asgi.make_asgi(make_app())
+
+
+def _session_cookie(app, user_id, is_admin=False):
+    return app.session_interface.get_signing_serializer(app).dumps(
+        {'user_id': user_id, 'full_name': 'Bench User', 'is_admin': is_admin})
+
+
+async def _http(host, port, method, path, cookie, body=b''):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nCookie: session={cookie}\r\n"
+                f"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n")
+        writer.write(head.encode() + body)
+        await writer.drain()
+        response = await reader.read()
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def _load(host, port, requests, clients, per_client, timeout=30):
+    latencies, errors = [], 0
+
+    async def client(n):
+        nonlocal errors
+        for i in range(per_client):
+            method, path, cookie, body = requests[(n + i) % len(requests)]
+            t0 = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(_http(host, port, method, path, cookie, body), timeout)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+            if status >= 500:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def _wait_for_port(host, port, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server didn't start on port {port}")
+
+
+class _Server:
+    """serve.py in a subprocess on a free port, for as long as the with block runs."""
+
+    def __init__(self, options, host='127.0.0.1'):
+        self.options = options
+        self.host = host
+
+    def __enter__(self):
+        with socket.socket() as sock:
+            sock.bind((self.host, 0))
+            self.port = sock.getsockname()[1]
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        self.proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'serve.py'), '--host', self.host,
+                                      '--port', str(self.port), '--factory', *self.options],
+                                     env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_port(self.host, self.port, self.proc)
+        except Exception:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        self.proc.wait(timeout=30)
+
+
+def bench_http(args, host='127.0.0.1'):
+    # ROUTES over HTTP against --workers ASGI workers, --clients concurrent
+    # clients doing --client-requests requests each per route.
+    app = make_app()
+    cookies = {None: '', 'user': _session_cookie(app, 1), 'admin': _session_cookie(app, 2, is_admin=True)}
+    with _Server(['--workers', str(args.workers), '--app', 'bench.server:stub_asgi'], host) as server:
+        for name, who, method, path, data, requests in ROUTES:
+            clients = min(args.clients, requests or args.clients)
+            bodies = [urlencode({key: str(value).format(n=n, i=0) for key, value in data.items()}).encode()
+                      if data else b'' for n in range(clients)]
+            latencies, errors, elapsed = asyncio.run(
+                _load(host, server.port, [(method, path, cookies[who], body) for body in bodies],
+                      clients, 1 if requests else args.client_requests))
+            report(f"http {name}", latencies, elapsed)
+            if errors:
+                print(f"{'':<14} {errors} errors/timeouts")
+
+
+def bench_serve(args, host='127.0.0.1'):
+    # The Flask dev server against serve.py's uvicorn workers, each hit by
+    # --clients concurrent clients mixing /dashboard, /book and the batched
+    # /admin spot_details. Each client opens a connection per request.
+    app = make_app()
+    user, admin = _session_cookie(app, 1), _session_cookie(app, 2, is_admin=True)
+    book = b'parking_id=1&start_time=2025-01-01T09:00&duration=2&vehicle_number=DL-LOAD'
+    requests = [('GET', '/dashboard', user, b''),
+                ('POST', '/book', user, book),
+                ('GET', '/admin/parking/1/spot_details?ids=' + ','.join(map(str, range(1, 51))), admin, b'')]
+    servers = [('dev server', ['--dev', '--app', 'bench.server:stub_wsgi']),
+               (f"asgi x{args.workers}w", ['--workers', str(args.workers), '--app', 'bench.server:stub_asgi'])]
+
+    for name, options in servers:
+        with _Server(options, host) as server:
+            latencies, errors, elapsed = asyncio.run(
+                _load(host, server.port, requests, args.clients, args.client_requests))
+            report(name, latencies, elapsed)
+            print(f"{'':<14} {args.clients} clients, {errors} errors/timeouts")
@@ -0,0 +1,110 @@
+"""Bookings across regions: one database against 1, 2 and 4 shards."""
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bench import report
+
+
+def _book_in_regions(parking_ids, first, step, count, year=2031):
+    # Booking number k takes lot k % len(parking_ids) for hour k // len(parking_ids),
+    # so no two bookings want the same lot and hour
+    import bookings
+    import shards
+    latencies = []
+    for k in range(first, first + step * count, step):
+        parking_id = parking_ids[k % len(parking_ids)]
+        start = (datetime(year, 1, 1) + timedelta(hours=k // len(parking_ids))).strftime("%Y-%m-%dT%H:%M")
+        t0 = time.perf_counter()
+        booked = bookings.create(shards.lot_db(parking_id), 1, parking_id, f"SH-{k}", start, 1)
+        latencies.append(time.perf_counter() - t0)
+        assert booked, (parking_id, start)
+    return latencies
+
+
+def _shard_worker(job):
+    # One process standing in for one server worker, with its own journal writers
+    import db
+    import journal
+    import shards
+    workdir, database, count, n, processes, per_process, parking_ids = job
+    os.chdir(workdir)
+    db.DATABASE = database
+    shards.configure(count)
+    journal._writer = journal.Writer(durability='full')
+    journal._shard_writers.update({path: journal.Writer(path, durability='full') for path in shards.paths()})
+    started = time.perf_counter()
+    latencies = _book_in_regions(parking_ids, n, processes, per_process, year=2032)
+    finished = time.perf_counter()
+    for w in journal.writers():
+        w.close()
+    return latencies, started, finished
+
+
+def bench_shards(args, lots=8):
+    # Bookings spread over `lots` lots in eight postal regions, with
+    # everything in one database and then with the lots on 1, 2 and 4
+    # shards. Every database gets its own fully durable journal writer.
+    # First --threads threads in this process, where the journal already
+    # group-commits one database's writes; then --processes (default 4)
+    # processes, one writer each per database, as with several server
+    # workers contending for the write lock.
+    import db
+    import journal
+    import migrations
+    import provisioning
+    import shards
+    catalogue, configured = db.DATABASE, shards.SHARDS
+    processes = args.processes or 4
+    try:
+        for count in (0, 1, 2, 4):
+            name = f"shards {count}" if count else 'single db'
+            os.makedirs(f'shards-{count}')
+            db.DATABASE = os.path.join(f'shards-{count}', 'user.db')
+            shards.configure(count)
+            conn = db.connect(db.DATABASE)
+            migrations.upgrade(conn)
+            migrations.upgrade_shards()
+            conn.execute("INSERT INTO users (email, password, full_name, pincode, address) VALUES ('s@s', '-', 'S', '110001', 'x')")
+            conn.commit()
+            parking_ids = provisioning.create_lots(conn, [dict(name=f"Region {n}", address='x', pincode=f"{n}10001",
+                                                               price=10, slots=4) for n in range(1, lots + 1)])
+            conn.close()
+
+            journal._writer = journal.Writer(durability='full')
+            journal._shard_writers.update({path: journal.Writer(path, durability='full') for path in shards.paths()})
+            latencies = []
+            lock = threading.Lock()
+
+            def worker(n):
+                mine = _book_in_regions(parking_ids, n, args.threads, args.requests)
+                with lock:
+                    latencies.extend(mine)
+
+            threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+            started = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            report(name, latencies, time.perf_counter() - started)
+            stats = journal.stats()
+            print(f"{'':<14} {stats['commits']} commits for {stats['events']} bookings "
+                  f"({stats['events_per_commit']} per commit)")
+            for w in journal.writers():
+                w.close()
+            journal._writer = None
+            journal._shard_writers.clear()
+
+            jobs = [(os.getcwd(), db.DATABASE, count, n, processes, args.requests, parking_ids)
+                    for n in range(processes)]
+            # Spawned, not forked: a forked worker would inherit this process's open connections
+            with multiprocessing.get_context('spawn').Pool(processes) as pool:
+                results = pool.map(_shard_worker, jobs)
+            report(f"{name} x{processes}p", [t for r in results for t in r[0]],
+                   max(r[2] for r in results) - min(r[1] for r in results))
+    finally:
+        db.DATABASE = catalogue
+        shards.configure(configured)
@@ -0,0 +1,28 @@
+"""One expiry pass over a lot full of overdue bookings."""
+from datetime import datetime, timedelta
+
+
+def bench_sweeper(args):
+    # Leave every spot in lot 1 occupied by a booking that ended yesterday
+    # (half never started, half overran), then time one expiry pass.
+    import counters
+    import db
+    import sweeper
+    conn = db.connect(db.DATABASE)
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    conn.execute('''
+        INSERT INTO bookings (user_id, parking_id, spot_id, vehicle_number, start_time, end_time, status)
+        SELECT 1, 1, id, 'SWP', :day || ' 08:00', :day || ' 10:00', CASE id % 2 WHEN 0 THEN 'booked' ELSE 'ongoing' END
+        FROM spots WHERE parking_id = 1 AND status = 'available'
+    ''', {'day': yesterday})
+    conn.execute("UPDATE spots SET status = 'occupied' WHERE parking_id = 1")
+    conn.commit()
+    free_before = conn.execute("SELECT available_slots FROM parkings WHERE id = 1").fetchone()[0]
+
+    run = sweeper.Sweeper().run_once(conn)
+    free_after = conn.execute("SELECT available_slots FROM parkings WHERE id = 1").fetchone()[0]
+    assert not counters.find_drift(conn), "available_slots drifted"
+    conn.close()
+    print(f"{'sweep':<14} {run['expired']:,} bookings expired, {run['spots_reclaimed']:,} spots reclaimed "
+          f"in {run['ms']:.0f} ms ({run['expired'] / run['ms'] * 1000:,.0f}/s); "
+          f"lot 1 free {free_before} -> {free_after}")
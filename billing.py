@@ -0,0 +1,185 @@
+"""Tariff evaluation for single bookings and whole batches.
+
+A lot's tariff is its price_per_hour plus optional rules from the
+tariffs table:
+  grace_minutes    stays this short are free
+  first_hour_rate  flat charge covering the first hour
+  night_rate       hourly rate between night_start and night_end
+                   (minutes after midnight; the window may wrap midnight)
+  daily_cap        most any 24 hours from arrival can cost
+A lot without a tariffs row is billed as before: duration x price_per_hour.
+
+Times are whole minutes since the epoch (SQLite's strftime('%s') / 60 on
+the stored "YYYY-MM-DD HH:MM" strings, read as wall-clock time). The
+formulas below use only arithmetic, minimum, maximum and where, so the
+same code prices one booking with Python numbers or a million at once
+with NumPy arrays. NumPy is optional; without it, batches fall back to a
+plain loop over the same formulas.
+
+    python billing.py --day 2024-06-01     # re-price that day's completed bookings
+"""
+import argparse
+from collections import namedtuple
+from datetime import datetime
+
+import db
+import shards
+
+DAY = 1440
+EPOCH = datetime(1970, 1, 1)
+CHUNK_ROWS = 50000
+
+Tariff = namedtuple('Tariff', 'rate first_hour_rate night_rate night_start night_end daily_cap grace_minutes')
+
+MINUTES_SQL = "CAST(strftime('%s', {}) AS INTEGER) / 60"
+
+
+class _Scalars:
+    minimum = staticmethod(min)
+    maximum = staticmethod(max)
+
+    @staticmethod
+    def where(condition, if_true, if_false):
+        return if_true if condition else if_false
+
+
+def load_tariff(conn, parking_id, price_per_hour=None):
+    """The lot's Tariff; plain price_per_hour billing when it has no rules."""
+    row = conn.execute('''
+        SELECT p.price_per_hour, t.first_hour_rate, t.night_rate, t.night_start, t.night_end,
+               t.daily_cap, t.grace_minutes
+        FROM parkings p LEFT JOIN tariffs t ON t.parking_id = p.id
+        WHERE p.id = ?
+    ''', (parking_id,)).fetchone()
+    if row is None:
+        return flat(price_per_hour or 0)
+    rate = price_per_hour if price_per_hour is not None else row['price_per_hour']
+    return Tariff(rate or 0, row['first_hour_rate'], row['night_rate'], row['night_start'],
+                  row['night_end'], row['daily_cap'], row['grace_minutes'] or 0)
+
+
+def flat(price_per_hour):
+    return Tariff(price_per_hour, None, None, None, None, None, 0)
+
+
+def minutes(timestamp):
+    """Epoch minutes for a stored "YYYY-MM-DD HH:MM" string."""
+    return int((datetime.fromisoformat(timestamp) - EPOCH).total_seconds()) // 60
+
+
+def _night_before(xp, t, tariff):
+    """Night-rate minutes between the epoch and ``t``."""
+    start, end = tariff.night_start, tariff.night_end
+    day, minute = t // DAY, t % DAY
+    if start < end:
+        return day * (end - start) + xp.maximum(0, xp.minimum(minute, end) - start)
+    return day * (DAY - start + end) + xp.minimum(minute, end) + xp.maximum(0, minute - start)
+
+
+def _linear(xp, a, b, tariff):
+    """Cost of [a, b) at the hourly and night rates, no caps or first hour."""
+    if None in (tariff.night_rate, tariff.night_start, tariff.night_end) or tariff.night_start == tariff.night_end:
+        return (b - a) * tariff.rate / 60
+    night = _night_before(xp, b, tariff) - _night_before(xp, a, tariff)
+    return (b - a - night) * tariff.rate / 60 + night * tariff.night_rate / 60
+
+
+def _cost(xp, start, end, tariff):
+    end = xp.maximum(start, end)
+    duration = end - start
+    cap = tariff.daily_cap if tariff.daily_cap is not None else float('inf')
+
+    # The first 24 hours, opening with the flat first-hour charge if any
+    first_end = xp.minimum(end, start + DAY)
+    if tariff.first_hour_rate is None:
+        first = _linear(xp, start, first_end, tariff)
+    else:
+        first = tariff.first_hour_rate + _linear(xp, xp.minimum(start + 60, first_end), first_end, tariff)
+
+    # Every later full day has the same mix of day and night minutes
+    full_days = xp.maximum(duration // DAY - 1, 0)
+    rest_start = xp.minimum(end, start + DAY + full_days * DAY)
+    one_day = _linear(xp, 0, DAY, tariff)
+    total = (xp.minimum(first, cap)
+             + full_days * min(one_day, cap)
+             + xp.minimum(_linear(xp, rest_start, end, tariff), cap))
+    return xp.where(duration <= tariff.grace_minutes, 0.0, total)
+
+
+def cost(start_time, end_time, tariff):
+    """Price of one stay between two "YYYY-MM-DD HH:MM" strings."""
+    return float(_cost(_Scalars, minutes(start_time), minutes(end_time), tariff))
+
+
+def price_batch(starts, ends, tariff):
+    """Prices for parallel sequences of start/end epoch minutes under one tariff."""
+    try:
+        import numpy as np
+    except ImportError:
+        return [_cost(_Scalars, start, end, tariff) for start, end in zip(starts, ends)]
+    return _cost(np, np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64), tariff).tolist()
+
+
+def rebill(conn, day=None, parking_id=None, chunk=CHUNK_ROWS):
+    """Re-price completed bookings that ended on ``day`` (default: all of them).
+
+    Works lot by lot and CHUNK_ROWS bookings at a time; the rollup and
+    summary triggers move revenue by the difference. Returns how many
+    bookings changed price.
+    """
+    where, params = ["status = 'completed'", "start_time IS NOT NULL", "end_time IS NOT NULL"], []
+    if day:
+        where.append("DATE(end_time) = ?")
+        params.append(day)
+    lots = [parking_id] if parking_id else [row[0] for row in conn.execute(
+        f"SELECT DISTINCT parking_id FROM bookings WHERE {' AND '.join(where)}", params)]
+
+    changed = 0
+    for lot in lots:
+        tariff = load_tariff(conn, lot)
+        last_id = 0
+        while True:
+            rows = conn.execute(f'''
+                SELECT id, {MINUTES_SQL.format('start_time')}, {MINUTES_SQL.format('end_time')}, cost
+                FROM bookings
+                WHERE {' AND '.join(where)} AND parking_id = ? AND id > ?
+                ORDER BY id LIMIT ?
+            ''', (*params, lot, last_id, chunk)).fetchall()
+            if not rows:
+                break
+            ids, starts, ends, old = zip(*rows)
+            prices = price_batch(starts, ends, tariff)
+            updates = [(price, booking_id) for booking_id, price, was in zip(ids, prices, old)
+                       if was is None or abs(price - was) >= 0.005]
+            conn.executemany("UPDATE bookings SET cost = ? WHERE id = ?", updates)
+            conn.commit()
+            changed += len(updates)
+            last_id = ids[-1]
+    return changed
+
+
+def set_tariff(conn, parking_id, **rules):
+    """Insert or replace a lot's tariff rules. Does not commit."""
+    conn.execute('''
+        INSERT OR REPLACE INTO tariffs
+            (parking_id, first_hour_rate, night_rate, night_start, night_end, daily_cap, grace_minutes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (parking_id, rules.get('first_hour_rate'), rules.get('night_rate'), rules.get('night_start'),
+          rules.get('night_end'), rules.get('daily_cap'), rules.get('grace_minutes') or 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-price completed bookings under the current tariffs")
+    parser.add_argument('--day', help='YYYY-MM-DD of the bookings to re-price (default: all)')
+    parser.add_argument('--lot', type=int, help='only this parking lot')
+    args = parser.parse_args(argv)
+
+    # A lot's bookings all live on its shard
+    paths = [shards.lot_path(args.lot)] if args.lot else shards.paths()
+    changed = sum(rebill(db.get_db(path), args.day, args.lot) for path in paths)
+    print(f"✅ Re-priced {changed} booking(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
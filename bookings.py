@@ -0,0 +1,202 @@
+"""Booking lifecycle shared by the HTML routes and the JSON API.
+
+State changes go through the booking journal: create/start/complete
+record an event, and the journal's writer projects it into bookings and
+spots as part of a group commit. They return once it is committed (see
+journal.DURABILITY). Callers then publish events.spot_changed as before.
+
+With sharding on, each event goes to the journal of the shard holding
+the lot or booking, and ``conn`` arguments are connections to that shard
+(shards.lot_db / shards.id_db).
+"""
+from datetime import datetime, timedelta
+
+import allocation
+import archive
+import billing
+import journal
+import shards
+
+FORM_TIME_FORMAT = "%Y-%m-%dT%H:%M"
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def window(start_time, duration):
+    """(start, end) strings for a booking form's start_time and duration in hours.
+
+    Raises ValueError on a malformed time or a duration under an hour.
+    """
+    start = datetime.strptime(start_time, FORM_TIME_FORMAT)
+    duration = int(duration)
+    if duration < 1:
+        raise ValueError(f"Duration must be at least 1 hour, not {duration}")
+    end = start + timedelta(hours=duration)
+    return start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT)
+
+
+def now_str():
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+class NoSpotAvailable(Exception):
+    pass
+
+
+class InvalidTransition(Exception):
+    """Starting or completing a booking whose status doesn't allow it."""
+
+    def __init__(self, action, status):
+        super().__init__(f"Can't {action} a {status} booking.")
+        self.action, self.status = action, status
+
+
+# Statuses each action may move a booking out of
+TRANSITIONS = {'start': ('booked',), 'complete': ('booked', 'ongoing')}
+
+
+def _check(action, status):
+    if status not in TRANSITIONS[action]:
+        raise InvalidTransition(action, status)
+
+
+def create(conn, user_id, parking_id, vehicle_number, start_time, duration, now=None):
+    """Claim a spot for the window; returns the new booking row, or None if the lot is full.
+
+    ``immediate`` on the result tells callers whether the spot is occupied
+    straight away (and so whether to publish a spot event).
+    """
+    now = now or now_str()
+    start, end = window(start_time, duration)
+    try:
+        booking_id, _ = journal.writer(shards.lot_path(parking_id)).record(
+            'create', wait=True, user_id=user_id, parking_id=int(parking_id),
+            vehicle_number=vehicle_number, start_time=start, end_time=end, now=now)
+    except NoSpotAvailable:
+        return None
+    booking = dict(get(conn, booking_id, user_id))
+    booking['immediate'] = start <= now
+    return booking
+
+
+def get(conn, booking_id, user_id):
+    return conn.execute('''
+        SELECT b.id, b.parking_id, b.spot_id, s.spot_uid, p.name AS parking_name, b.vehicle_number,
+               b.start_time, b.end_time, b.duration, b.cost, b.status
+        FROM bookings b
+        JOIN spots s ON b.spot_id = s.id
+        JOIN parkings p ON b.parking_id = p.id
+        WHERE b.id = ? AND b.user_id = ?
+    ''', (booking_id, user_id)).fetchone()
+
+
+def start(booking, now=None):
+    """Mark a reserved booking ongoing and occupy its spot.
+
+    Raises InvalidTransition unless the booking is still booked.
+    """
+    _check('start', booking['status'])
+    return journal.writer(shards.id_path(booking['id'])).record('start', booking_id=booking['id'],
+                                                                spot_id=booking['spot_id'], at=now or now_str())
+
+
+def complete(booking, now=None):
+    """Close a booking, charge for the time parked and free its spot.
+
+    Raises InvalidTransition unless the booking is booked or ongoing.
+    """
+    _check('complete', booking['status'])
+    return journal.writer(shards.id_path(booking['id'])).record('complete', booking_id=booking['id'],
+                                                                spot_id=booking['spot_id'], at=now or now_str())
+
+
+def _project_create(conn, event):
+    claimed = allocation.allocate(conn, event['parking_id'], event['user_id'], event['vehicle_number'],
+                                  event['start_time'], event['end_time'], event['now'])
+    if not claimed:
+        raise NoSpotAvailable(event['parking_id'])
+    event['booking_id'], event['spot_id'] = claimed
+    return claimed
+
+
+def _project_start(conn, event):
+    # Re-checked here too: another request may have moved it since the caller read it
+    _check('start', conn.execute("SELECT status FROM bookings WHERE id = ?", (event['booking_id'],)).fetchone()[0])
+    conn.execute("UPDATE bookings SET status = 'ongoing', start_time = ? WHERE id = ?", (event['at'], event['booking_id']))
+    # Reserved ahead of time, so the spot only becomes occupied now
+    conn.execute("UPDATE spots SET status = 'occupied' WHERE id = ? AND status = 'available'", (event['spot_id'],))
+
+
+def _project_complete(conn, event):
+    details = conn.execute("SELECT start_time, parking_id, status FROM bookings WHERE id = ?",
+                           (event['booking_id'],)).fetchone()
+    _check('complete', details['status'])
+
+    duration_hours = (billing.minutes(event['at']) - billing.minutes(details['start_time'])) / 60
+    cost = billing.cost(details['start_time'], event['at'], billing.load_tariff(conn, details['parking_id']))
+
+    conn.execute("UPDATE bookings SET status = 'completed', end_time = ?, duration = ?, cost = ? WHERE id = ?",
+                 (event['at'], duration_hours, cost, event['booking_id']))
+    # Keep the spot occupied if another live booking on it has already begun
+    conn.execute('''
+        UPDATE spots SET status = 'available'
+        WHERE id = :spot_id AND status = 'occupied'
+          AND NOT EXISTS (SELECT 1 FROM bookings
+                          WHERE spot_id = :spot_id AND status IN ('booked', 'ongoing') AND start_time <= :now)
+    ''', {'spot_id': event['spot_id'], 'now': event['at']})
+
+
+def _project_expire(conn, event):
+    """Close a booking left live past its end time; True if its spot was freed.
+
+    Billed for the booked window, start to scheduled end. A booking that
+    was completed or extended since the sweep picked it is left alone.
+    """
+    booking = conn.execute("SELECT parking_id, spot_id, start_time, end_time, status FROM bookings WHERE id = ?",
+                           (event['booking_id'],)).fetchone()
+    if booking is None or booking['status'] not in ('booked', 'ongoing') or booking['end_time'] >= event['cutoff']:
+        return False
+
+    duration_hours = max(0, billing.minutes(booking['end_time']) - billing.minutes(booking['start_time'])) / 60
+    cost = billing.cost(booking['start_time'], booking['end_time'], billing.load_tariff(conn, booking['parking_id']))
+    conn.execute("UPDATE bookings SET status = 'completed', duration = ?, cost = ? WHERE id = ?",
+                 (duration_hours, cost, event['booking_id']))
+    # Keep the spot occupied if another live booking on it has already begun
+    freed = conn.execute('''
+        UPDATE spots SET status = 'available'
+        WHERE id = :spot_id AND status = 'occupied'
+          AND NOT EXISTS (SELECT 1 FROM bookings
+                          WHERE spot_id = :spot_id AND status IN ('booked', 'ongoing') AND start_time <= :now)
+    ''', {'spot_id': booking['spot_id'], 'now': event['now']})
+    return freed.rowcount == 1
+
+
+def recent(conn, user_id, limit=5):
+    """A user's latest bookings of any status, newest first, archived ones included."""
+    rows = conn.execute('''
+        SELECT b.id, b.status, b.start_time, b.end_time, s.spot_uid, p.name as parking_name
+        FROM bookings b
+        JOIN spots s ON b.spot_id = s.id
+        JOIN parkings p ON b.parking_id = p.id
+        WHERE b.user_id = ? ORDER BY b.id DESC LIMIT ?
+    ''', (user_id, limit)).fetchall()
+    return archive.merge_history(conn, rows, user_id,
+                                 ('id', 'status', 'start_time', 'end_time', 'spot_uid', 'parking_name'), limit)
+
+
+def active(conn, user_id):
+    """A user's booked and ongoing bookings, soonest first."""
+    return conn.execute('''
+        SELECT b.id, b.parking_id, b.spot_id, s.spot_uid, p.name AS parking_name, b.vehicle_number,
+               b.start_time, b.end_time, b.duration, b.cost, b.status
+        FROM bookings b
+        JOIN spots s ON b.spot_id = s.id
+        JOIN parkings p ON b.parking_id = p.id
+        WHERE b.user_id = ? AND b.status IN ('booked', 'ongoing')
+        ORDER BY b.start_time
+    ''', (user_id,)).fetchall()
+
+
+journal.register('create', _project_create)
+journal.register('start', _project_start)
+journal.register('complete', _project_complete)
+journal.register('expire', _project_expire)
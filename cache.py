@@ -0,0 +1,233 @@
+"""Read-through cache for lot catalogue and user lookups.
+
+Entries are plain dicts/lists (never sqlite3.Row) so any backend can hold
+them. The default backend is an in-process LRU with a TTL; set CACHE_URL
+to a redis:// URL to share one cache between workers instead. Without
+the redis package installed the local LRU stands in for it.
+
+Admin routes invalidate the keys they touch. With the local backend that
+only reaches the current process, so the TTL bounds how stale another
+worker can be.
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import db
+import shards
+
+MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+TTL_SECONDS = float(os.environ.get('CACHE_TTL', 60))
+CACHE_URL = os.environ.get('CACHE_URL')
+
+_MISSING = object()
+
+
+class LocalBackend:
+    """Thread-safe LRU with a per-entry expiry."""
+
+    def __init__(self, maxsize=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared cache in redis; same interface as LocalBackend."""
+
+    def __init__(self, url, ttl=TTL_SECONDS, namespace='parking:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.namespace = namespace
+
+    def get(self, key):
+        data = self.client.get(self.namespace + key)
+        return _MISSING if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.namespace + key, pickle.dumps(value), ex=max(1, int(self.ttl if ttl is None else ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.namespace + key for key in keys))
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=self.namespace + prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix('')
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.namespace + '*'))
+
+
+def make_backend(url=CACHE_URL):
+    if url and url.startswith('redis://'):
+        try:
+            return RedisBackend(url)
+        except ImportError:
+            pass
+    return LocalBackend()
+
+
+class Cache:
+    def __init__(self, backend=None):
+        self.backend = backend or make_backend()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for ``key``, calling ``loader()`` on a miss."""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is _MISSING:
+            value = loader()
+            self.backend.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *keys):
+        self.backend.delete(*keys)
+
+    def invalidate_prefix(self, prefix):
+        self.backend.delete_prefix(prefix)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+        }
+
+
+cache = Cache()
+
+
+# Lot catalogue: everything shown about a lot except its live counters,
+# which change on every booking and are always read from SQLite
+CATALOGUE_COLUMNS = "id, name, address, pincode, price_per_hour, total_slots, latitude, longitude"
+
+
+def lot_key(parking_id):
+    return f'lot:{int(parking_id)}'
+
+
+def user_key(user_id):
+    return f'user:{int(user_id)}'
+
+
+def get_lot(conn, parking_id):
+    def load():
+        row = conn.execute(f"SELECT {CATALOGUE_COLUMNS} FROM parkings WHERE id = ?", (parking_id,)).fetchone()
+        return dict(row) if row else None
+    return cache.get_or_load(lot_key(parking_id), load)
+
+
+def get_lots(conn):
+    return cache.get_or_load('lots:all', lambda: [
+        dict(row) for row in conn.execute(f"SELECT {CATALOGUE_COLUMNS} FROM parkings ORDER BY id")])
+
+
+def get_lots_in_pincode(conn, pincode, limit=50):
+    return cache.get_or_load(f'lots:pincode:{pincode}', lambda: [
+        dict(row) for row in conn.execute(
+            f"SELECT {CATALOGUE_COLUMNS} FROM parkings WHERE pincode = ? LIMIT ?", (pincode, limit))])
+
+
+def _live_counts(conn, ids):
+    return dict(conn.execute(
+        "SELECT id, available_slots FROM parkings WHERE id IN (SELECT value FROM json_each(?))",
+        ('[' + ','.join(str(parking_id) for parking_id in ids) + ']',)).fetchall())
+
+
+def with_live_counts(conn, lots):
+    """Copy of ``lots`` with current available_slots read from SQLite (each lot's shard, if sharded)."""
+    if not lots:
+        return []
+    if not shards.enabled():
+        counts = _live_counts(conn, [lot['id'] for lot in lots])
+    else:
+        by_shard, counts = {}, {}
+        for lot in lots:
+            by_shard.setdefault(shards.lot_path(lot['id']), []).append(lot['id'])
+        for path, ids in by_shard.items():
+            counts.update(_live_counts(db.get_db(path), ids))
+    return [dict(lot, available_slots=counts.get(lot['id'], 0)) for lot in lots]
+
+
+def get_user(conn, user_id):
+    """A user's profile fields. Never the password hash: entries may sit pickled in redis."""
+    def load():
+        row = conn.execute("SELECT id, email, full_name, pincode, address, is_admin FROM users WHERE id = ?",
+                           (user_id,)).fetchone()
+        return dict(row) if row else None
+    return cache.get_or_load(user_key(user_id), load)
+
+
+def invalidate_lot(parking_id=None):
+    """Drop a lot (or, with no id, every lot) and the listings that include it."""
+    if parking_id is None:
+        cache.invalidate_prefix('lot:')
+    else:
+        cache.invalidate(lot_key(parking_id))
+    cache.invalidate('lots:all')
+    cache.invalidate_prefix('lots:pincode:')
+
+
+def invalidate_user(user_id):
+    cache.invalidate(user_key(user_id))
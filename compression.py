@@ -0,0 +1,77 @@
+"""Conditional GET and response compression for rendered pages and JSON.
+
+After each request, a complete 200 response to GET or HEAD with a text
+body gets a weak ETag from a hash of its body, unless the route set one
+itself. A client that sends the ETag back gets an empty 304 instead of
+the page. Bodies of at least COMPRESS_MIN_SIZE bytes are then sent
+brotli-compressed to clients that accept it (if the brotli package is
+installed), gzipped otherwise, with Vary: Accept-Encoding. ETags are
+weak so one tag covers every encoding, the way nginx's gzip module
+weakens them.
+
+Streamed responses (exports, /events) are left alone. Set COMPRESS=0
+when a proxy in front already compresses.
+"""
+import gzip
+import hashlib
+import os
+
+from flask import request
+
+ENABLED = os.environ.get('COMPRESS', '1').lower() not in ('0', 'false', 'no')
+MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+
+MIMETYPES = {'text/html', 'text/plain', 'text/csv', 'text/css', 'text/javascript', 'application/json'}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality('br') > 0 and accepted.quality('br') >= accepted.quality('gzip'):
+        return 'br'
+    if accepted.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+def finish(response):
+    """Answer a matching If-None-Match with 304, else compress the body if worth it."""
+    if (request.method not in ('GET', 'HEAD') or response.status_code != 200 or response.is_streamed
+            or response.direct_passthrough or response.mimetype not in MIMETYPES):
+        return response
+
+    etag, weak = response.get_etag()
+    if etag is None:
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest()[:20], weak=True)
+        if 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = 'private, no-cache'
+    response.make_conditional(request)
+    if response.status_code != 200 or not ENABLED or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = _encoding()
+    if encoding is None or len(data) < MIN_SIZE:
+        return response
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    response.set_data(_compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.after_request(finish)
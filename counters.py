@@ -0,0 +1,56 @@
+"""parkings.available_slots bookkeeping.
+
+The counter is kept up to date by triggers on the spots table, so the
+dashboards read it instead of counting spots per lot on every page load.
+Run this module to check for drift (e.g. after manual edits to the DB):
+
+    python counters.py            # report lots whose counter is wrong
+    python counters.py --repair   # ...and fix them
+"""
+import argparse
+
+import db
+import shards
+
+
+def find_drift(conn):
+    return conn.execute('''
+        SELECT p.id, p.name, p.available_slots AS recorded, COUNT(s.id) AS actual
+        FROM parkings p
+        LEFT JOIN spots s ON s.parking_id = p.id AND s.status = 'available'
+        GROUP BY p.id
+        HAVING p.available_slots != COUNT(s.id)
+    ''').fetchall()
+
+
+def reconcile(conn, repair=False):
+    """Return the lots whose counter has drifted, fixing them if asked."""
+    drift = find_drift(conn)
+    if repair and drift:
+        conn.executemany('''
+            UPDATE parkings
+            SET available_slots = (SELECT COUNT(id) FROM spots WHERE parking_id = parkings.id AND status = 'available')
+            WHERE id = ?
+        ''', [(row['id'],) for row in drift])
+        conn.commit()
+    return drift
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify parkings.available_slots against spots")
+    parser.add_argument('--repair', action='store_true', help='rewrite drifted counters')
+    args = parser.parse_args(argv)
+
+    # Each lot's counter and spots live on its shard
+    drift = [row for path in shards.paths() for row in reconcile(db.get_db(path), repair=args.repair)]
+    for row in drift:
+        print(f"lot {row['id']} ({row['name']}): recorded {row['recorded']}, actual {row['actual']}")
+    if not drift:
+        print("✅ All availability counters match")
+    elif args.repair:
+        print(f"✅ Repaired {len(drift)} lot(s)")
+    return 1 if drift and not args.repair else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,181 @@
+"""Synthetic data at scale, for benchmarks and load tests.
+
+Builds a fresh database with the current schema, the two seed accounts from
+init_db.py (test@test.com is user 1, admin@admin.com user 2) and as many
+lots, spots, users and completed bookings as asked for. Rows are generated
+inside SQLite by recursive CTEs, CHUNK_ROWS per transaction, so nothing is
+built row by row in Python. Values come from a multiplicative hash of the
+row number, so the same arguments always give the same data (with the
+bookings history ending today).
+
+Triggers and secondary indexes are dropped for the load and restored
+afterwards. The derived tables (slot counters, revenue rollups, search and
+interval indexes, hourly occupancy) are then rebuilt in one pass each
+rather than row by row.
+
+    python datagen.py --lots 10000 --spots-per-lot 100 --users 1000000 --bookings 50000000
+    python datagen.py --scale small -o data/small.db
+"""
+import argparse
+import os
+import sys
+import time
+
+from werkzeug.security import generate_password_hash
+
+import db
+import migrations
+import occupancy
+import passwords
+import reservations
+import rollups
+import search
+
+CHUNK_ROWS = 1_000_000
+
+# name -> (lots, spots per lot, users, bookings)
+SCALES = {
+    'small': (100, 50, 10_000, 100_000),
+    'medium': (1_000, 100, 100_000, 1_000_000),
+    'large': (10_000, 100, 1_000_000, 50_000_000),
+}
+
+CITIES = ('Delhi', 'Mumbai', 'Bangalore', 'Chennai', 'Kolkata', 'Hyderabad', 'Pune', 'Jaipur')
+
+# Deterministic pseudo-random integer in [0, n) for row number i
+_HASH = "((({i}) * 2654435761 + {salt}) % 4294967296) % ({n})"
+
+
+def _hash(i, n, salt=0):
+    return _HASH.format(i=i, n=n, salt=salt)
+
+
+def _series(conn, sql, total, label, **params):
+    """Run ``sql`` (an INSERT ... SELECT over n(i)) for i in [0, total), CHUNK_ROWS per commit."""
+    started = time.perf_counter()
+    for first in range(0, total, CHUNK_ROWS):
+        conn.execute(f'''
+            WITH RECURSIVE n(i) AS (SELECT :first UNION ALL SELECT i + 1 FROM n WHERE i + 1 < :last)
+            {sql}
+        ''', dict(params, first=first, last=min(total, first + CHUNK_ROWS)))
+        conn.commit()
+        print(f"   {label}: {min(total, first + CHUNK_ROWS):,}/{total:,}", end='\r', file=sys.stderr)
+    print(f"   {label}: {total:,} in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+
+def _detach_schema(conn, tables):
+    """Drop the triggers and secondary indexes on ``tables``; returns the SQL to put them back."""
+    names = ','.join('?' * len(tables))
+    objects = conn.execute(f'''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('trigger', 'index') AND tbl_name IN ({names}) AND sql IS NOT NULL
+    ''', tables).fetchall()
+    for kind, name, _ in objects:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    conn.commit()
+    return [row['sql'] for row in objects]
+
+
+def generate(path, lots, spots_per_lot, users, bookings, days=730):
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = db.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+    migrations.upgrade(conn)
+
+    password = generate_password_hash('Test@1234', passwords.METHOD)
+    conn.executemany("INSERT INTO users (email, password, full_name, pincode, address, is_admin) VALUES (?, ?, ?, ?, ?, ?)",
+                     (('test@test.com', password, 'Test User', '110011', 'Test Address', 0),
+                      ('admin@admin.com', generate_password_hash('Admin@1234', passwords.METHOD), 'Admin Boss', '000000', 'HQ', 1)))
+    conn.commit()
+
+    restore = _detach_schema(conn, ('parkings', 'spots', 'users', 'bookings'))
+    pincodes = max(1, lots // 20)
+    cities = ' '.join(f"WHEN {n} THEN '{city}'" for n, city in enumerate(CITIES))
+
+    # Lots: ~20 per pincode, scattered over India's bounding box
+    _series(conn, f'''
+        INSERT INTO parkings (id, name, address, pincode, total_slots, price_per_hour, available_slots,
+                              latitude, longitude)
+        SELECT i + 1, 'Lot ' || (i + 1),
+               (i + 1) || ' Synthetic Road, ' || CASE i % {len(CITIES)} {cities} END,
+               CAST(110001 + {_hash('i', pincodes, 1)} AS TEXT), :spots, 10 + i % 41, :spots,
+               8.0 + {_hash('i', 2800000, 2)} / 100000.0, 68.0 + {_hash('i', 2900000, 3)} / 100000.0
+        FROM n
+    ''', lots, 'lots', spots=spots_per_lot)
+
+    # The test user lives where the first lot is, so their dashboard has lots to show
+    conn.execute("UPDATE users SET pincode = (SELECT pincode FROM parkings WHERE id = 1) WHERE id = 1")
+
+    _series(conn, f'''
+        INSERT INTO spots (id, parking_id, spot_uid, status)
+        SELECT i + 1, i / {spots_per_lot} + 1, 'S-' || (i % {spots_per_lot} + 1), 'available'
+        FROM n
+    ''', lots * spots_per_lot, 'spots')
+
+    _series(conn, f'''
+        INSERT INTO users (id, email, password, full_name, pincode, address, is_admin)
+        SELECT i + 3, 'user' || (i + 3) || '@example.com', :password, 'User ' || (i + 3),
+               CAST(110001 + {_hash('i', pincodes, 4)} AS TEXT), (i + 3) || ' Synthetic Lane', 0
+        FROM n
+    ''', users, 'users', password=password)
+
+    # Completed bookings of 1-8 hours spread over the `days` before now,
+    # billed at the lot's flat rate
+    _series(conn, f'''
+        INSERT INTO bookings (id, user_id, parking_id, spot_id, vehicle_number, start_time, end_time,
+                              duration, cost, status)
+        SELECT i + 1, user_id, parking_id, (parking_id - 1) * {spots_per_lot} + {_hash('i', spots_per_lot, 7)} + 1,
+               'SY-' || (i % 10000), start_time,
+               strftime('%Y-%m-%d %H:%M', start_time, '+' || hours || ' hours'),
+               hours, hours * (10 + (parking_id - 1) % 41), 'completed'
+        FROM (
+            SELECT i, {_hash('i', users + 2, 5)} + 1 AS user_id, {_hash('i', lots, 6)} + 1 AS parking_id,
+                   1 + i % 8 AS hours,
+                   strftime('%Y-%m-%d %H:00', 'now', '-{days} days',
+                            '+' || (i * :spread / :count) || ' minutes') AS start_time
+            FROM n
+        )
+    ''', bookings, 'bookings', spread=days * 1440 - 8 * 60, count=max(bookings, 1))
+
+    print("   restoring indexes and triggers", file=sys.stderr)
+    for sql in restore:
+        conn.execute(sql)
+    rollups.rebuild(conn)
+    search.rebuild(conn)
+    reservations.rebuild(conn)
+    occupancy.rebuild(conn)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic parking database")
+    parser.add_argument('--scale', choices=sorted(SCALES), help='preset volumes (overridden by the flags below)')
+    parser.add_argument('--lots', type=int)
+    parser.add_argument('--spots-per-lot', type=int)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--bookings', type=int)
+    parser.add_argument('--days', type=int, default=730, help='how far back bookings go')
+    parser.add_argument('-o', '--output', default=os.path.join('data', 'synthetic.db'))
+    args = parser.parse_args(argv)
+
+    defaults = SCALES[args.scale or 'small']
+    volumes = [value if value is not None else default
+               for value, default in zip((args.lots, args.spots_per_lot, args.users, args.bookings), defaults)]
+    started = time.perf_counter()
+    try:
+        generate(args.output, *volumes, days=args.days)
+    except FileExistsError as e:
+        print(f"❌ {e}; remove it first", file=sys.stderr)
+        return 1
+    print(f"✅ Generated {args.output}: {volumes[0]:,} lots, {volumes[0] * volumes[1]:,} spots, "
+          f"{volumes[2]:,} users, {volumes[3]:,} bookings in {time.perf_counter() - started:.0f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+import sqlite3
+import os
+import threading
+import queue
+
+from flask import g, has_app_context
+
+import profiling
+
+DATABASE = os.path.join('data', 'user.db')
+
+# Tuned for lots of short reads with the odd booking write in between.
+# WAL lets readers carry on while /book holds the write lock.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+
+
+def connect(path=None):
+    conn = sqlite3.connect(path or DATABASE, timeout=5,
+                           check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE,
+                           factory=profiling.connection_factory())
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path=None, size=POOL_SIZE):
+        self.path = path or DATABASE
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self.size <= 0:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool(path=None):
+    path = path or DATABASE
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+def get_db(path=None):
+    """Connection shared by everything running in the current request.
+
+    Inside a Flask app context the connection is checked out of the pool
+    into ``g`` and handed back by ``close_db`` on teardown. Scripts and
+    background threads get one connection per thread instead.
+    """
+    path = path or DATABASE
+    if has_app_context():
+        conns = g.setdefault('_db_conns', {})
+        if path not in conns:
+            conns[path] = get_pool(path).acquire()
+        return conns[path]
+
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    if path not in conns:
+        conns[path] = connect(path)
+    return conns[path]
+
+
+def close_db(exc=None):
+    conns = g.pop('_db_conns', None) or {}
+    for path, conn in conns.items():
+        get_pool(path).release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
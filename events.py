@@ -0,0 +1,115 @@
+"""In-process pub/sub for spot status changes, served as Server-Sent Events.
+
+Routes publish a small delta after they commit; every open /events stream
+for that lot (or for all lots) gets it pushed instead of polling SQLite.
+Subscribers that fall too far behind are dropped and simply reconnect,
+which EventSource does on its own.
+"""
+import json
+import queue
+import threading
+
+KEEPALIVE_SECONDS = 15
+MAX_PENDING = 256
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # lot id (None = every lot) -> set of queues
+        self._next_id = 0
+
+    def subscribe(self, parking_id=None):
+        q = queue.Queue(maxsize=MAX_PENDING)
+        with self._lock:
+            self._subscribers.setdefault(parking_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, q, parking_id=None):
+        with self._lock:
+            subs = self._subscribers.get(parking_id)
+            if subs:
+                subs.discard(q)
+                if not subs:
+                    del self._subscribers[parking_id]
+
+    def publish(self, parking_id, event, **data):
+        with self._lock:
+            self._next_id += 1
+            message = (self._next_id, event, dict(data, parking_id=parking_id))
+            targets = list(self._subscribers.get(parking_id, ())) + list(self._subscribers.get(None, ()))
+        for q in targets:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Too slow to keep up; close its stream so the client reconnects
+                self._drop(q)
+
+    def _drop(self, q):
+        with self._lock:
+            for subs in self._subscribers.values():
+                subs.discard(q)
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            q.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+
+broker = Broker()
+
+
+def format_sse(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream(parking_id=None, snapshot=None, keepalive=KEEPALIVE_SECONDS):
+    """Generator of SSE text for one client.
+
+    ``snapshot`` (if given) is sent first so the client starts from the
+    current state, then every published delta follows. Pass a function to
+    have it read only once subscribed, so no delta published while it
+    reads is missed.
+    """
+    q = broker.subscribe(parking_id)
+    try:
+        yield "retry: 3000\n\n"
+        if callable(snapshot):
+            snapshot = snapshot()
+        if snapshot is not None:
+            yield format_sse(snapshot, event='snapshot')
+        while True:
+            try:
+                message = q.get(timeout=keepalive)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if message is None:
+                return
+            event_id, event, data = message
+            yield format_sse(data, event=event, event_id=event_id)
+    finally:
+        broker.unsubscribe(q, parking_id)
+
+
+def spot_changed(conn, parking_id, spot_id, status):
+    """Publish a spot status delta along with the lot's new free count."""
+    if not broker.subscriber_count():
+        return
+    row = conn.execute("SELECT available_slots FROM parkings WHERE id = ?", (parking_id,)).fetchone()
+    broker.publish(int(parking_id), 'spot', spot_id=spot_id, status=status,
+                   available_slots=row['available_slots'] if row else None)
@@ -0,0 +1,55 @@
+"""Cached HTML fragments for the pages everyone sees the same way.
+
+The lot tables and a lot's spot grid come out identical for every visitor
+until something in them changes. render() keeps each rendered fragment
+under a key built from what it shows: lot ids and versions (see
+versions.py), or a digest of the rows for lists that are already in hand.
+Any change makes a new key, so nothing is ever invalidated by hand. Old
+keys just age out of the LRU. The rows are read on every request to
+build the key, so a hit saves the Jinja render, not the query.
+
+Fragments live in their own cache: FRAGMENT_CACHE_ENTRIES in-process, or
+shared in redis under CACHE_URL like cache.py's entries. FRAGMENT_CACHE=0
+renders every time.
+"""
+import hashlib
+import os
+
+from flask import render_template
+from markupsafe import Markup
+
+import cache
+
+ENABLED = os.environ.get('FRAGMENT_CACHE', '1').lower() not in ('0', 'false', 'no')
+MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_ENTRIES', 256))
+TTL_SECONDS = float(os.environ.get('FRAGMENT_CACHE_TTL', 3600))
+
+_fragments = cache.Cache(cache.make_backend() if cache.CACHE_URL
+                         else cache.LocalBackend(maxsize=MAX_ENTRIES, ttl=TTL_SECONDS))
+
+
+def digest(rows):
+    """A short key for ``rows`` (dicts or sqlite3.Rows), changing whenever any value does."""
+    data = repr([tuple(dict(row).items()) for row in rows]).encode()
+    return hashlib.sha1(data).hexdigest()[:20]
+
+
+def render(key, template, load):
+    """``template`` rendered with the context ``load()`` returns, cached under ``key``."""
+    if not ENABLED:
+        return Markup(render_template(template, **load()))
+    return Markup(_fragments.get_or_load(f'fragment:{key}', lambda: render_template(template, **load()),
+                                         TTL_SECONDS))
+
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+
+def clear():
+    _fragments.clear()
+
+
+def stats():
+    return _fragments.stats()
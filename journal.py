@@ -0,0 +1,235 @@
+"""Append-only booking event journal with a group-committing writer.
+
+Routes record a state change ("create", "start", "complete", ...) as an
+event instead of committing it themselves. One background writer thread
+drains the queue: every event that arrived while the previous commit was
+in flight is appended to booking_events and projected into bookings/spots
+in a single transaction. The whole batch shares one commit, so it costs
+one fsync. Set JOURNAL_LINGER_MS to also wait that long for stragglers
+before committing. That trades latency for bigger batches on disks with
+slow fsyncs.
+
+Projections are plain functions registered per event kind with
+register(). Each event runs under its own savepoint, so a bad event fails
+alone and doesn't abort the rest of the batch.
+
+JOURNAL_DURABILITY picks the guarantee a caller gets back:
+  full    wait for the commit; the writer runs synchronous=FULL, so every
+          batch is fsynced before callers return
+  normal  wait for the commit at the pool's synchronous=NORMAL (WAL). A
+          power cut can lose the last few batches but never corrupts.
+  async   write-behind: return once queued. Events still pending at a
+          crash are lost; flush() or interpreter exit drains the queue.
+Events whose result the caller needs (e.g. "create", for the booking id)
+always wait.
+
+With sharding on (see shards.py), each shard database gets its own
+writer from writer(path), so regions commit independently.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import db
+
+DURABILITY = os.environ.get('JOURNAL_DURABILITY', 'normal')
+LINGER_MS = float(os.environ.get('JOURNAL_LINGER_MS', 0))
+MAX_BATCH = int(os.environ.get('JOURNAL_MAX_BATCH', 256))
+
+log = logging.getLogger(__name__)
+
+PROJECTIONS = {}
+
+_STOP = object()
+
+
+def register(kind, projection):
+    """``projection(conn, payload)`` applies one event; its return value goes back to the caller.
+
+    It may set ``payload['booking_id']`` (e.g. for a new booking) so the
+    journal row is linked to it.
+    """
+    PROJECTIONS[kind] = projection
+
+
+class Writer:
+    def __init__(self, path=None, durability=DURABILITY, linger_ms=LINGER_MS, max_batch=MAX_BATCH):
+        if durability not in ('full', 'normal', 'async'):
+            raise ValueError(f"Unknown journal durability '{durability}'")
+        self.path = path
+        self.durability = durability
+        self.linger = linger_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.commits = 0
+        self.events = 0
+
+    def submit(self, kind, payload):
+        if kind not in PROJECTIONS:
+            raise ValueError(f"No projection registered for '{kind}' events")
+        future = Future()
+        self._ensure_started()
+        self._queue.put((kind, payload, future))
+        return future
+
+    def record(self, kind, wait=None, **payload):
+        """Queue an event; unless write-behind, block until it is committed and return its result."""
+        future = self.submit(kind, payload)
+        if wait or (wait is None and self.durability != 'async'):
+            return future.result()
+        return future
+
+    def flush(self):
+        """Block until everything queued so far is committed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def stats(self):
+        return {'durability': self.durability, 'commits': self.commits, 'events': self.events,
+                'pending': self._queue.qsize(),
+                'events_per_commit': round(self.events / self.commits, 2) if self.commits else None}
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='journal-writer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Commit what we have first; stop on the next round
+                self._queue.task_done()
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = db.connect(self.path)
+        if self.durability == 'full':
+            conn.execute("PRAGMA synchronous = FULL")
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    self._queue.task_done()
+                    return
+                try:
+                    self._commit(conn, batch)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for kind, payload, future in batch:
+                conn.execute("SAVEPOINT event")
+                try:
+                    result = PROJECTIONS[kind](conn, payload)
+                    conn.execute("INSERT INTO booking_events (kind, booking_id, payload) VALUES (?, ?, ?)",
+                                 (kind, payload.get('booking_id'), json.dumps(payload, separators=(',', ':'))))
+                    conn.execute("RELEASE event")
+                    results.append((future, result, None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO event")
+                    conn.execute("RELEASE event")
+                    results.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            results = [(future, None, e) for _, _, future in batch]
+        else:
+            self.commits += 1
+            self.events += sum(1 for _, _, error in results if error is None)
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+                if self.durability == 'async':
+                    log.error("Journal event failed: %s", error)
+
+
+_writer = None
+_shard_writers = {}  # path -> Writer, for databases other than db.DATABASE
+_writer_lock = threading.Lock()
+
+
+def writer(path=None):
+    """The writer for the database at ``path`` (default: db.DATABASE)."""
+    global _writer
+    if path is not None and path != db.DATABASE:
+        shard_writer = _shard_writers.get(path)
+        if shard_writer is None:
+            with _writer_lock:
+                shard_writer = _shard_writers.setdefault(path, Writer(path))
+        return shard_writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = Writer()
+    return _writer
+
+
+def writers():
+    return [w for w in (_writer, *_shard_writers.values()) if w is not None]
+
+
+def record(kind, wait=None, **payload):
+    return writer().record(kind, wait, **payload)
+
+
+def flush():
+    for w in writers():
+        w.flush()
+
+
+def stats():
+    """Totals over every writer, in the shape of Writer.stats()."""
+    totals = {'durability': DURABILITY, 'commits': 0, 'events': 0, 'pending': 0}
+    for w in writers():
+        w_stats = w.stats()
+        for key in ('commits', 'events', 'pending'):
+            totals[key] += w_stats[key]
+    totals['events_per_commit'] = round(totals['events'] / totals['commits'], 2) if totals['commits'] else None
+    return totals
+
+
+def events_for(conn, booking_id):
+    return conn.execute("SELECT id, kind, payload, recorded_at FROM booking_events WHERE booking_id = ? ORDER BY id",
+                        (booking_id,)).fetchall()
+
+
+atexit.register(flush)
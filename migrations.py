@@ -0,0 +1,724 @@
+"""Versioned, in-place schema upgrades for data/user.db.
+
+Each step runs once, in order, inside its own transaction and is recorded in
+the schema_version table. Add new steps to the end of MIGRATIONS; never edit
+one that has already shipped. Steps spell out their own DDL, so changing a
+module's queries later can't change what an old step creates.
+
+    python migrations.py            # upgrade data/user.db to the latest version
+    python migrations.py --status   # show applied and pending steps
+"""
+import argparse
+import os
+from datetime import datetime
+
+import archive
+import db
+import occupancy
+import reservations
+import rollups
+import search
+import shards
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def initial_schema(conn):
+    # The tables as the original init_db.py created them
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        pincode TEXT NOT NULL,
+        address TEXT NOT NULL,
+        is_admin INTEGER DEFAULT 0
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS parkings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        address TEXT NOT NULL,
+        pincode TEXT NOT NULL,
+        total_slots INTEGER NOT NULL,
+        price_per_hour REAL DEFAULT 10
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS spots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parking_id INTEGER NOT NULL,
+        spot_uid TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'available',
+        UNIQUE(parking_id, spot_uid),
+        FOREIGN KEY(parking_id) REFERENCES parkings(id) ON DELETE CASCADE
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS bookings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        parking_id INTEGER NOT NULL,
+        spot_id INTEGER NOT NULL,
+        vehicle_number TEXT NOT NULL,
+        start_time TEXT,
+        end_time TEXT,
+        duration REAL DEFAULT 0,
+        cost REAL DEFAULT 0,
+        status TEXT DEFAULT 'booked',
+        FOREIGN KEY(user_id) REFERENCES users(id),
+        FOREIGN KEY(parking_id) REFERENCES parkings(id),
+        FOREIGN KEY(spot_id) REFERENCES spots(id)
+    )
+    ''')
+
+
+def available_slot_counters(conn):
+    if 'available_slots' not in _columns(conn, 'parkings'):
+        conn.execute("ALTER TABLE parkings ADD COLUMN available_slots INTEGER NOT NULL DEFAULT 0")
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS spots_available_insert
+    AFTER INSERT ON spots WHEN NEW.status = 'available'
+    BEGIN
+        UPDATE parkings SET available_slots = available_slots + 1 WHERE id = NEW.parking_id;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS spots_available_delete
+    AFTER DELETE ON spots WHEN OLD.status = 'available'
+    BEGIN
+        UPDATE parkings SET available_slots = available_slots - 1 WHERE id = OLD.parking_id;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS spots_available_update
+    AFTER UPDATE OF status, parking_id ON spots
+    WHEN OLD.status IS NOT NEW.status OR OLD.parking_id IS NOT NEW.parking_id
+    BEGIN
+        UPDATE parkings SET available_slots = available_slots - (OLD.status = 'available') WHERE id = OLD.parking_id;
+        UPDATE parkings SET available_slots = available_slots + (NEW.status = 'available') WHERE id = NEW.parking_id;
+    END
+    ''')
+    conn.execute('''
+        UPDATE parkings
+        SET available_slots = (SELECT COUNT(id) FROM spots WHERE parking_id = parkings.id AND status = 'available')
+    ''')
+
+
+def route_indexes(conn):
+    # One per access path in app.py; see queryplan.py for the check that
+    # keeps every route off full table scans.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_is_admin ON users(is_admin)")
+    # /book claims and availability lookups
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_spots_parking_status ON spots(parking_id, status)")
+    # dashboard recent bookings, profile history/summary/graph
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_user_status
+        ON bookings(user_id, status, start_time, duration, cost)
+    ''')
+    # spot_details live booking lookup, delete_spot checks
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bookings_spot_status ON bookings(spot_id, status)")
+    # admin_stats revenue by lot and by day
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bookings_status_parking ON bookings(status, parking_id, cost)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bookings_status_end_date ON bookings(status, DATE(end_time), cost)")
+
+
+def revenue_rollups(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS revenue_daily (
+        day TEXT PRIMARY KEY,
+        revenue REAL NOT NULL DEFAULT 0,
+        bookings INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS revenue_by_lot (
+        parking_id INTEGER PRIMARY KEY,
+        revenue REAL NOT NULL DEFAULT 0,
+        bookings INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS revenue_lot_daily (
+        day TEXT NOT NULL,
+        parking_id INTEGER NOT NULL,
+        revenue REAL NOT NULL DEFAULT 0,
+        bookings INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, parking_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_revenue_insert
+    AFTER INSERT ON bookings WHEN NEW.status = 'completed'
+    BEGIN
+        INSERT INTO revenue_daily (day, revenue, bookings)
+            SELECT DATE(NEW.end_time), IFNULL(NEW.cost, 0), 1 WHERE NEW.status = 'completed'
+            ON CONFLICT(day) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                           bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_by_lot (parking_id, revenue, bookings)
+            SELECT NEW.parking_id, IFNULL(NEW.cost, 0), 1 WHERE NEW.status = 'completed'
+            ON CONFLICT(parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                  bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_lot_daily (day, parking_id, revenue, bookings)
+            SELECT DATE(NEW.end_time), NEW.parking_id, IFNULL(NEW.cost, 0), 1 WHERE NEW.status = 'completed'
+            ON CONFLICT(day, parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                       bookings = bookings + excluded.bookings;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_revenue_update
+    AFTER UPDATE OF status, cost, end_time, parking_id ON bookings
+    WHEN OLD.status = 'completed' OR NEW.status = 'completed'
+    BEGIN
+        INSERT INTO revenue_daily (day, revenue, bookings)
+            SELECT DATE(OLD.end_time), -IFNULL(OLD.cost, 0), -1 WHERE OLD.status = 'completed'
+            ON CONFLICT(day) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                           bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_by_lot (parking_id, revenue, bookings)
+            SELECT OLD.parking_id, -IFNULL(OLD.cost, 0), -1 WHERE OLD.status = 'completed'
+            ON CONFLICT(parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                  bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_lot_daily (day, parking_id, revenue, bookings)
+            SELECT DATE(OLD.end_time), OLD.parking_id, -IFNULL(OLD.cost, 0), -1 WHERE OLD.status = 'completed'
+            ON CONFLICT(day, parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                       bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_daily (day, revenue, bookings)
+            SELECT DATE(NEW.end_time), IFNULL(NEW.cost, 0), 1 WHERE NEW.status = 'completed'
+            ON CONFLICT(day) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                           bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_by_lot (parking_id, revenue, bookings)
+            SELECT NEW.parking_id, IFNULL(NEW.cost, 0), 1 WHERE NEW.status = 'completed'
+            ON CONFLICT(parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                  bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_lot_daily (day, parking_id, revenue, bookings)
+            SELECT DATE(NEW.end_time), NEW.parking_id, IFNULL(NEW.cost, 0), 1 WHERE NEW.status = 'completed'
+            ON CONFLICT(day, parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                       bookings = bookings + excluded.bookings;
+    END
+    ''')
+    rollups.rebuild(conn)
+
+
+def user_summaries(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_summary (
+        user_id INTEGER PRIMARY KEY,
+        total_duration REAL NOT NULL DEFAULT 0,
+        total_cost REAL NOT NULL DEFAULT 0,
+        bookings INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_daily (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        cost REAL NOT NULL DEFAULT 0,
+        duration REAL NOT NULL DEFAULT 0,
+        bookings INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_user_summary_insert
+    AFTER INSERT ON bookings WHEN NEW.status = 'completed'
+    BEGIN
+        UPDATE user_summary
+            SET total_duration = total_duration + IFNULL(NEW.duration, 0),
+                total_cost = total_cost + IFNULL(NEW.cost, 0),
+                bookings = bookings + 1
+            WHERE user_id = NEW.user_id AND NEW.status = 'completed';
+        INSERT INTO user_daily (user_id, day, cost, duration, bookings)
+            SELECT NEW.user_id, DATE(NEW.start_time), IFNULL(NEW.cost, 0), IFNULL(NEW.duration, 0), 1
+            WHERE NEW.status = 'completed' AND NEW.start_time IS NOT NULL
+              AND EXISTS (SELECT 1 FROM user_summary WHERE user_id = NEW.user_id)
+            ON CONFLICT(user_id, day) DO UPDATE SET cost = cost + excluded.cost,
+                                                    duration = duration + excluded.duration,
+                                                    bookings = bookings + excluded.bookings;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_user_summary_update
+    AFTER UPDATE OF status, cost, duration, start_time, user_id ON bookings
+    WHEN OLD.status = 'completed' OR NEW.status = 'completed'
+    BEGIN
+        UPDATE user_summary
+            SET total_duration = total_duration + -IFNULL(OLD.duration, 0),
+                total_cost = total_cost + -IFNULL(OLD.cost, 0),
+                bookings = bookings + -1
+            WHERE user_id = OLD.user_id AND OLD.status = 'completed';
+        INSERT INTO user_daily (user_id, day, cost, duration, bookings)
+            SELECT OLD.user_id, DATE(OLD.start_time), -IFNULL(OLD.cost, 0), -IFNULL(OLD.duration, 0), -1
+            WHERE OLD.status = 'completed' AND OLD.start_time IS NOT NULL
+              AND EXISTS (SELECT 1 FROM user_summary WHERE user_id = OLD.user_id)
+            ON CONFLICT(user_id, day) DO UPDATE SET cost = cost + excluded.cost,
+                                                    duration = duration + excluded.duration,
+                                                    bookings = bookings + excluded.bookings;
+        UPDATE user_summary
+            SET total_duration = total_duration + IFNULL(NEW.duration, 0),
+                total_cost = total_cost + IFNULL(NEW.cost, 0),
+                bookings = bookings + 1
+            WHERE user_id = NEW.user_id AND NEW.status = 'completed';
+        INSERT INTO user_daily (user_id, day, cost, duration, bookings)
+            SELECT NEW.user_id, DATE(NEW.start_time), IFNULL(NEW.cost, 0), IFNULL(NEW.duration, 0), 1
+            WHERE NEW.status = 'completed' AND NEW.start_time IS NOT NULL
+              AND EXISTS (SELECT 1 FROM user_summary WHERE user_id = NEW.user_id)
+            ON CONFLICT(user_id, day) DO UPDATE SET cost = cost + excluded.cost,
+                                                    duration = duration + excluded.duration,
+                                                    bookings = bookings + excluded.bookings;
+    END
+    ''')
+    # Keyset pagination of profile history and the dashboard's recent
+    # bookings both walk a user's bookings in id order
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bookings_user_history ON bookings(user_id, status, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_bookings_user_recent ON bookings(user_id, id)")
+
+
+def lot_versions(conn):
+    if 'version' not in _columns(conn, 'parkings'):
+        conn.execute("ALTER TABLE parkings ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS parkings_version_update
+    AFTER UPDATE OF name, address, pincode, price_per_hour, total_slots ON parkings
+    BEGIN
+        UPDATE parkings SET version = version + 1 WHERE id = NEW.id;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS spots_version_insert
+    AFTER INSERT ON spots
+    BEGIN
+        UPDATE parkings SET version = version + 1 WHERE id = NEW.parking_id;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS spots_version_delete
+    AFTER DELETE ON spots
+    BEGIN
+        UPDATE parkings SET version = version + 1 WHERE id = OLD.parking_id;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS spots_version_update
+    AFTER UPDATE ON spots
+    BEGIN
+        UPDATE parkings SET version = version + 1 WHERE id IN (OLD.parking_id, NEW.parking_id);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_version_insert
+    AFTER INSERT ON bookings
+    BEGIN
+        UPDATE parkings SET version = version + 1 WHERE id = NEW.parking_id;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_version_update
+    AFTER UPDATE ON bookings
+    BEGIN
+        UPDATE parkings SET version = version + 1 WHERE id IN (OLD.parking_id, NEW.parking_id);
+    END
+    ''')
+
+
+def booking_intervals(conn):
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS booking_intervals
+    USING rtree_i32(id, start_min, end_min, lot_lo, lot_hi, +spot_id)
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_interval_insert
+    AFTER INSERT ON bookings
+    BEGIN
+        INSERT INTO booking_intervals (id, start_min, end_min, lot_lo, lot_hi, spot_id)
+            SELECT NEW.id,
+                   MIN(CAST(strftime('%s', NEW.start_time) AS INTEGER) / 60,
+                       CAST(strftime('%s', NEW.end_time) AS INTEGER) / 60),
+                   MAX(CAST(strftime('%s', NEW.start_time) AS INTEGER) / 60,
+                       CAST(strftime('%s', NEW.end_time) AS INTEGER) / 60),
+                   NEW.parking_id, NEW.parking_id, NEW.spot_id
+            WHERE NEW.status IN ('booked', 'ongoing')
+              AND strftime('%s', NEW.start_time) IS NOT NULL
+              AND strftime('%s', NEW.end_time) IS NOT NULL;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_interval_update
+    AFTER UPDATE OF status, start_time, end_time, spot_id, parking_id ON bookings
+    BEGIN
+        DELETE FROM booking_intervals WHERE id = OLD.id;
+        INSERT INTO booking_intervals (id, start_min, end_min, lot_lo, lot_hi, spot_id)
+            SELECT NEW.id,
+                   MIN(CAST(strftime('%s', NEW.start_time) AS INTEGER) / 60,
+                       CAST(strftime('%s', NEW.end_time) AS INTEGER) / 60),
+                   MAX(CAST(strftime('%s', NEW.start_time) AS INTEGER) / 60,
+                       CAST(strftime('%s', NEW.end_time) AS INTEGER) / 60),
+                   NEW.parking_id, NEW.parking_id, NEW.spot_id
+            WHERE NEW.status IN ('booked', 'ongoing')
+              AND strftime('%s', NEW.start_time) IS NOT NULL
+              AND strftime('%s', NEW.end_time) IS NOT NULL;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_interval_delete
+    AFTER DELETE ON bookings
+    BEGIN
+        DELETE FROM booking_intervals WHERE id = OLD.id;
+    END
+    ''')
+    reservations.rebuild(conn)
+
+
+def lot_search(conn):
+    columns = _columns(conn, 'parkings')
+    for column in ('latitude', 'longitude'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE parkings ADD COLUMN {column} REAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_parkings_pincode ON parkings(pincode)")
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS parkings_fts USING fts5(
+        name, address, pincode,
+        content='parkings', content_rowid='id', tokenize='trigram'
+    )
+    ''')
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS parkings_geo USING rtree(id, min_lat, max_lat, min_lng, max_lng)")
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS parkings_search_insert
+    AFTER INSERT ON parkings
+    BEGIN
+        INSERT INTO parkings_fts (rowid, name, address, pincode) VALUES (NEW.id, NEW.name, NEW.address, NEW.pincode);
+        INSERT INTO parkings_geo (id, min_lat, max_lat, min_lng, max_lng)
+            SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS parkings_search_update
+    AFTER UPDATE OF name, address, pincode ON parkings
+    BEGIN
+        INSERT INTO parkings_fts (parkings_fts, rowid, name, address, pincode)
+            VALUES ('delete', OLD.id, OLD.name, OLD.address, OLD.pincode);
+        INSERT INTO parkings_fts (rowid, name, address, pincode) VALUES (NEW.id, NEW.name, NEW.address, NEW.pincode);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS parkings_geo_update
+    AFTER UPDATE OF latitude, longitude ON parkings
+    BEGIN
+        DELETE FROM parkings_geo WHERE id = OLD.id;
+        INSERT INTO parkings_geo (id, min_lat, max_lat, min_lng, max_lng)
+            SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS parkings_search_delete
+    AFTER DELETE ON parkings
+    BEGIN
+        INSERT INTO parkings_fts (parkings_fts, rowid, name, address, pincode)
+            VALUES ('delete', OLD.id, OLD.name, OLD.address, OLD.pincode);
+        DELETE FROM parkings_geo WHERE id = OLD.id;
+    END
+    ''')
+    search.rebuild(conn)
+
+
+def booking_journal(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS booking_events (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        booking_id INTEGER,
+        payload TEXT NOT NULL,
+        recorded_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_booking_events_booking ON booking_events(booking_id, id)")
+
+
+def tariffs(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS tariffs (
+        parking_id INTEGER PRIMARY KEY REFERENCES parkings(id) ON DELETE CASCADE,
+        first_hour_rate REAL,
+        night_rate REAL,
+        night_start INTEGER,
+        night_end INTEGER,
+        daily_cap REAL,
+        grace_minutes INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    # A tariff edit changes what a lot's pages show, so it bumps the lot version
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS tariffs_version_insert
+    AFTER INSERT ON tariffs
+    BEGIN
+        UPDATE parkings SET version = version + 1 WHERE id = NEW.parking_id;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS tariffs_version_update
+    AFTER UPDATE ON tariffs
+    BEGIN
+        UPDATE parkings SET version = version + 1 WHERE id = NEW.parking_id;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS tariffs_version_delete
+    AFTER DELETE ON tariffs
+    BEGIN
+        UPDATE parkings SET version = version + 1 WHERE id = OLD.parking_id;
+    END
+    ''')
+
+
+def expiry_sweep_index(conn):
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_bookings_live_end
+    ON bookings(end_time) WHERE status IN ('booked', 'ongoing')
+    ''')
+
+
+def lot_shard_routing(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS lot_shards (
+        parking_id INTEGER PRIMARY KEY,
+        shard INTEGER NOT NULL
+    )
+    ''')
+
+
+def booking_archive(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive_partitions (
+        month TEXT PRIMARY KEY,
+        file TEXT NOT NULL,
+        rows INTEGER NOT NULL DEFAULT 0,
+        min_id INTEGER NOT NULL,
+        max_id INTEGER NOT NULL,
+        changed_at TEXT NOT NULL,
+        compacted_at TEXT
+    )
+    ''')
+
+
+def hourly_occupancy(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS occupancy_hourly (
+        parking_id INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        minutes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (parking_id, hour)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS occupancy_changes (
+        id INTEGER PRIMARY KEY,
+        parking_id INTEGER NOT NULL,
+        start_minute INTEGER NOT NULL,
+        end_minute INTEGER NOT NULL,
+        sign INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_occupancy_insert
+    AFTER INSERT ON bookings WHEN NEW.status IN ('booked', 'ongoing', 'completed')
+    BEGIN
+        INSERT INTO occupancy_changes (parking_id, start_minute, end_minute, sign)
+            SELECT NEW.parking_id, CAST(strftime('%s', NEW.start_time) AS INTEGER) / 60,
+                   CAST(strftime('%s', NEW.end_time) AS INTEGER) / 60, 1
+            WHERE NEW.status IN ('booked', 'ongoing', 'completed')
+              AND NEW.start_time IS NOT NULL AND NEW.end_time IS NOT NULL;
+    END
+    ''')
+    # booked -> ongoing with the same window changes nothing here
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_occupancy_update
+    AFTER UPDATE OF status, start_time, end_time, parking_id ON bookings
+    WHEN (OLD.status IN ('booked', 'ongoing', 'completed') OR NEW.status IN ('booked', 'ongoing', 'completed'))
+         AND NOT (OLD.parking_id IS NEW.parking_id AND OLD.start_time IS NEW.start_time
+                  AND OLD.end_time IS NEW.end_time
+                  AND (OLD.status IN ('booked', 'ongoing', 'completed'))
+                      = (NEW.status IN ('booked', 'ongoing', 'completed')))
+    BEGIN
+        INSERT INTO occupancy_changes (parking_id, start_minute, end_minute, sign)
+            SELECT OLD.parking_id, CAST(strftime('%s', OLD.start_time) AS INTEGER) / 60,
+                   CAST(strftime('%s', OLD.end_time) AS INTEGER) / 60, -1
+            WHERE OLD.status IN ('booked', 'ongoing', 'completed')
+              AND OLD.start_time IS NOT NULL AND OLD.end_time IS NOT NULL;
+        INSERT INTO occupancy_changes (parking_id, start_minute, end_minute, sign)
+            SELECT NEW.parking_id, CAST(strftime('%s', NEW.start_time) AS INTEGER) / 60,
+                   CAST(strftime('%s', NEW.end_time) AS INTEGER) / 60, 1
+            WHERE NEW.status IN ('booked', 'ongoing', 'completed')
+              AND NEW.start_time IS NOT NULL AND NEW.end_time IS NOT NULL;
+    END
+    ''')
+    occupancy.rebuild(conn)
+
+
+def rollup_triggers(conn):
+    # Step 4's triggers predate skipping bookings without an end_time, and
+    # CREATE TRIGGER IF NOT EXISTS leaves an existing one as it was
+    for name in ('bookings_revenue_insert', 'bookings_revenue_update'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_revenue_insert
+    AFTER INSERT ON bookings WHEN NEW.status = 'completed'
+    BEGIN
+        INSERT INTO revenue_daily (day, revenue, bookings)
+            SELECT DATE(NEW.end_time), IFNULL(NEW.cost, 0), 1
+            WHERE NEW.status = 'completed' AND NEW.end_time IS NOT NULL
+            ON CONFLICT(day) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                           bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_by_lot (parking_id, revenue, bookings)
+            SELECT NEW.parking_id, IFNULL(NEW.cost, 0), 1 WHERE NEW.status = 'completed'
+            ON CONFLICT(parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                  bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_lot_daily (day, parking_id, revenue, bookings)
+            SELECT DATE(NEW.end_time), NEW.parking_id, IFNULL(NEW.cost, 0), 1
+            WHERE NEW.status = 'completed' AND NEW.end_time IS NOT NULL
+            ON CONFLICT(day, parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                       bookings = bookings + excluded.bookings;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS bookings_revenue_update
+    AFTER UPDATE OF status, cost, end_time, parking_id ON bookings
+    WHEN OLD.status = 'completed' OR NEW.status = 'completed'
+    BEGIN
+        INSERT INTO revenue_daily (day, revenue, bookings)
+            SELECT DATE(OLD.end_time), -IFNULL(OLD.cost, 0), -1
+            WHERE OLD.status = 'completed' AND OLD.end_time IS NOT NULL
+            ON CONFLICT(day) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                           bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_by_lot (parking_id, revenue, bookings)
+            SELECT OLD.parking_id, -IFNULL(OLD.cost, 0), -1 WHERE OLD.status = 'completed'
+            ON CONFLICT(parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                  bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_lot_daily (day, parking_id, revenue, bookings)
+            SELECT DATE(OLD.end_time), OLD.parking_id, -IFNULL(OLD.cost, 0), -1
+            WHERE OLD.status = 'completed' AND OLD.end_time IS NOT NULL
+            ON CONFLICT(day, parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                       bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_daily (day, revenue, bookings)
+            SELECT DATE(NEW.end_time), IFNULL(NEW.cost, 0), 1
+            WHERE NEW.status = 'completed' AND NEW.end_time IS NOT NULL
+            ON CONFLICT(day) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                           bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_by_lot (parking_id, revenue, bookings)
+            SELECT NEW.parking_id, IFNULL(NEW.cost, 0), 1 WHERE NEW.status = 'completed'
+            ON CONFLICT(parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                  bookings = bookings + excluded.bookings;
+        INSERT INTO revenue_lot_daily (day, parking_id, revenue, bookings)
+            SELECT DATE(NEW.end_time), NEW.parking_id, IFNULL(NEW.cost, 0), 1
+            WHERE NEW.status = 'completed' AND NEW.end_time IS NOT NULL
+            ON CONFLICT(day, parking_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+                                                       bookings = bookings + excluded.bookings;
+    END
+    ''')
+    rollups.rebuild(conn, archive.revenue(conn))
+    # Summaries warm lazily, so emptying them rebuilds each with today's warm() on its next view
+    conn.execute("DELETE FROM user_daily")
+    conn.execute("DELETE FROM user_summary")
+
+
+MIGRATIONS = [
+    (1, 'initial schema', initial_schema),
+    (2, 'available slot counters', available_slot_counters),
+    (3, 'route indexes', route_indexes),
+    (4, 'revenue rollups', revenue_rollups),
+    (5, 'user summaries', user_summaries),
+    (6, 'lot versions', lot_versions),
+    (7, 'booking interval index', booking_intervals),
+    (8, 'lot search index', lot_search),
+    (9, 'booking event journal', booking_journal),
+    (10, 'lot tariffs', tariffs),
+    (11, 'expiry sweep index', expiry_sweep_index),
+    (12, 'lot shard routing', lot_shard_routing),
+    (13, 'booking archive partitions', booking_archive),
+    (14, 'hourly lot occupancy', hourly_occupancy),
+    (15, 'rollup trigger refresh', rollup_triggers),
+]
+
+
+def current_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def pending(conn):
+    version = current_version(conn)
+    return [step for step in MIGRATIONS if step[0] > version]
+
+
+def upgrade(conn):
+    """Apply every pending migration. Returns the list of versions applied."""
+    applied = []
+    for version, name, step in pending(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                         (version, name, datetime.now().strftime("%Y-%m-%d %H:%M")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def upgrade_shards():
+    """Create or upgrade every shard database (see shards.py). Returns {path: versions applied}."""
+    if not shards.enabled():
+        return {}
+    applied = {}
+    for n, path in enumerate(shards.paths()):
+        conn = db.connect(path)
+        try:
+            applied[path] = upgrade(conn)
+            shards.prepare(conn, n)
+        finally:
+            conn.close()
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upgrade the database schema in place")
+    parser.add_argument('--status', action='store_true', help='list migrations without applying them')
+    args = parser.parse_args(argv)
+
+    os.makedirs(os.path.dirname(db.DATABASE), exist_ok=True)
+    conn = db.get_db()
+    if args.status:
+        todo = {step[0] for step in pending(conn)}
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>3}  {'pending' if version in todo else 'applied':<8} {name}")
+        return 0
+
+    applied = upgrade(conn)
+    if applied:
+        print(f"✅ Applied migration(s) {', '.join(map(str, applied))}")
+    else:
+        print("✅ Schema already up to date")
+    for path, versions_applied in upgrade_shards().items():
+        if versions_applied:
+            print(f"✅ {path}: applied migration(s) {', '.join(map(str, versions_applied))}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
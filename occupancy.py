@@ -0,0 +1,326 @@
+"""Hourly occupancy per lot, for utilisation heatmaps and peak-hour reports.
+
+occupancy_hourly holds, for every lot and every hour, how many
+spot-minutes its bookings took up: booked, ongoing and completed ones,
+so hours ahead show what is already reserved. Hours are whole hours
+since the epoch (SQLite's strftime('%s') / 3600 on the stored wall-clock
+strings, as in billing.py). Utilisation divides by the lot's current
+total_slots.
+
+Triggers on bookings don't touch the hourly table themselves. They queue
+each change of a booking's window as a signed interval in
+occupancy_changes: minus the old window, plus the new one. Every
+OCCUPANCY_INTERVAL seconds the refresher takes the queue a chunk at a
+time, spreads the intervals over the hours they cover and adds the
+totals in. The expansion is plain array arithmetic: NumPy over a whole
+chunk when it is installed, a loop over the same formula otherwise.
+Like the revenue rollups, archiving a booking doesn't remove its hours.
+With sharding on, each shard keeps occupancy for its own lots.
+
+    python occupancy.py               # apply queued changes once
+    python occupancy.py --every 300   # run as a separate worker
+    python occupancy.py --rebuild     # recompute from every booking
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import archive
+import billing
+import db
+import shards
+
+OCCUPANCY_INTERVAL = float(os.environ.get('OCCUPANCY_INTERVAL', 300))
+CHUNK_ROWS = 50000
+REPORT_DAYS = 30
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+_COUNTED = "('booked', 'ongoing', 'completed')"
+
+_ADD = '''
+    INSERT INTO occupancy_hourly (parking_id, hour, minutes) VALUES (?, ?, ?)
+    ON CONFLICT(parking_id, hour) DO UPDATE SET minutes = minutes + excluded.minutes
+'''
+
+
+def hourly(lots, starts, ends, signs):
+    """Spot-minutes per (lot, hour) for parallel sequences of signed booking windows.
+
+    ``starts`` and ``ends`` are epoch minutes. Returns (parking_id, hour,
+    minutes) tuples with minutes summed and non-zero.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        totals = {}
+        for lot, start, end, sign in zip(lots, starts, ends, signs):
+            end = max(start, end)
+            for hour in range(start // 60, end // 60 + 1):
+                minutes = min(end, (hour + 1) * 60) - max(start, hour * 60)
+                if minutes:
+                    totals[lot, hour] = totals.get((lot, hour), 0) + sign * minutes
+        return [(lot, hour, minutes) for (lot, hour), minutes in totals.items() if minutes]
+
+    lots, starts, ends, signs = (np.asarray(values, dtype=np.int64) for values in (lots, starts, ends, signs))
+    ends = np.maximum(starts, ends)
+    first = starts // 60
+    # Every hour a window touches, the one its end falls in included
+    spans = ends // 60 - first + 1
+    owner = np.repeat(np.arange(len(starts)), spans)
+    hours = first[owner] + np.arange(int(spans.sum())) - np.repeat(np.cumsum(spans) - spans, spans)
+    minutes = (np.minimum(ends[owner], (hours + 1) * 60) - np.maximum(starts[owner], hours * 60)) * signs[owner]
+    keep = minutes != 0
+    keys, index = np.unique((lots[owner][keep] << 32) | hours[keep], return_inverse=True)
+    sums = np.bincount(index.ravel(), weights=minutes[keep]).astype(np.int64)
+    keep = sums != 0
+    return list(zip((keys[keep] >> 32).tolist(), (keys[keep] & 0xFFFFFFFF).tolist(), sums[keep].tolist()))
+
+
+def _add(conn, lots, starts, ends, signs):
+    rows = hourly(lots, starts, ends, signs)
+    conn.executemany(_ADD, rows)
+    return rows
+
+
+def refresh(conn, chunk=CHUNK_ROWS):
+    """Fold queued booking changes into occupancy_hourly; returns how many were applied."""
+    applied = last_id = 0
+    while True:
+        # Taking the write lock first keeps two refreshers from counting a change twice
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute('''
+                SELECT id, parking_id, start_minute, end_minute, sign FROM occupancy_changes
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, chunk)).fetchall()
+            if rows:
+                ids, lots, starts, ends, signs = zip(*rows)
+                _add(conn, lots, starts, ends, signs)
+                conn.execute("DELETE FROM occupancy_changes WHERE id <= ?", (ids[-1],))
+                last_id = ids[-1]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied += len(rows)
+        if len(rows) < chunk:
+            return applied
+
+
+def _replay(conn, source, where, chunk, *params):
+    last_id = 0
+    while True:
+        rows = source.execute(f'''
+            SELECT id, parking_id, {billing.MINUTES_SQL.format('start_time')}, {billing.MINUTES_SQL.format('end_time')}
+            FROM bookings NOT INDEXED
+            WHERE id > ? AND {where} AND start_time IS NOT NULL AND end_time IS NOT NULL
+            ORDER BY id LIMIT ?
+        ''', (last_id, *params, chunk)).fetchall()
+        if not rows:
+            return
+        ids, lots, starts, ends = zip(*rows)
+        _add(conn, lots, starts, ends, [1] * len(rows))
+        last_id = ids[-1]
+
+
+def rebuild(conn, chunk=CHUNK_ROWS):
+    """Recompute occupancy_hourly from bookings and their archive partitions. Does not commit."""
+    conn.execute("DELETE FROM occupancy_hourly")
+    conn.execute("DELETE FROM occupancy_changes")
+    _replay(conn, conn, f"status IN {_COUNTED}", chunk)
+    for partition in archive.partitions(conn):
+        archived = db.connect(partition['path'])
+        try:
+            # Rows a crash left in both places were replayed from bookings already
+            _replay(conn, archived, "status = 'completed' AND id NOT IN (SELECT value FROM json_each(?))", chunk,
+                    archive.leftovers(conn, partition))
+        finally:
+            archived.close()
+
+
+def _hours(date_from=None, date_to=None):
+    """[first, last) epoch hours for the days ``date_from`` to ``date_to`` inclusive."""
+    date_to = date_to or datetime.now().strftime('%Y-%m-%d')
+    date_from = date_from or (datetime.fromisoformat(date_to) - timedelta(days=REPORT_DAYS - 1)).strftime('%Y-%m-%d')
+    return billing.minutes(date_from) // 60, billing.minutes(date_to) // 60 + 24
+
+
+def _label(hour):
+    return (billing.EPOCH + timedelta(hours=hour)).strftime('%Y-%m-%d %H:00')
+
+
+def _weekday(hour):
+    # The epoch fell on a Thursday
+    return (hour // 24 + 3) % 7
+
+
+def heatmap(conn, parking_id, slots, date_from=None, date_to=None):
+    """Average utilisation (0-1) by weekday (Monday first) and hour of day: a 7 x 24 grid."""
+    first, last = _hours(date_from, date_to)
+    days = [0] * 7
+    for day in range(first // 24, last // 24):
+        days[_weekday(day * 24)] += 1
+    grid = [[0.0] * 24 for _ in range(7)]
+    for row in conn.execute('''
+        SELECT (hour / 24 + 3) % 7 AS weekday, hour % 24 AS hour_of_day, SUM(minutes) AS minutes
+        FROM occupancy_hourly
+        WHERE parking_id = ? AND hour >= ? AND hour < ?
+        GROUP BY weekday, hour_of_day
+    ''', (parking_id, first, last)):
+        capacity = (slots or 0) * 60 * days[row['weekday']]
+        grid[row['weekday']][row['hour_of_day']] = round(row['minutes'] / capacity, 4) if capacity else 0.0
+    return grid
+
+
+def busiest(conn, parking_id, slots, date_from=None, date_to=None, limit=10):
+    """The single hours with the most spots taken, busiest first."""
+    first, last = _hours(date_from, date_to)
+    rows = conn.execute('''
+        SELECT hour, minutes FROM occupancy_hourly
+        WHERE parking_id = ? AND hour >= ? AND hour < ?
+        ORDER BY minutes DESC LIMIT ?
+    ''', (parking_id, first, last, limit)).fetchall()
+    return [{'hour': _label(row['hour']), 'spots': round(row['minutes'] / 60, 1),
+             'utilisation': round(row['minutes'] / (slots * 60), 4) if slots else 0.0} for row in rows]
+
+
+def report(parking_id, date_from=None, date_to=None, limit=5):
+    """One lot's heatmap, hour-of-day profile and peak hours; None for an unknown lot."""
+    conn = shards.lot_db(parking_id)
+    lot = conn.execute("SELECT id, name, total_slots FROM parkings WHERE id = ?", (parking_id,)).fetchone()
+    if lot is None:
+        return None
+    slots = lot['total_slots']
+    grid = heatmap(conn, parking_id, slots, date_from, date_to)
+    by_hour = [round(sum(day[hour] for day in grid) / 7, 4) for hour in range(24)]
+    peaks = sorted(((grid[day][hour], day, hour) for day in range(7) for hour in range(24)), reverse=True)[:limit]
+    first, last = _hours(date_from, date_to)
+    return {
+        'parking_id': lot['id'], 'name': lot['name'], 'total_slots': slots,
+        'from': _label(first)[:10], 'to': _label(last - 1)[:10],
+        'weekdays': WEEKDAYS, 'heatmap': grid, 'by_hour': by_hour,
+        'peak_hours': [{'weekday': WEEKDAYS[day], 'hour': hour, 'utilisation': value}
+                       for value, day, hour in peaks if value],
+        'busiest': busiest(conn, parking_id, slots, date_from, date_to, limit),
+    }
+
+
+def _by_lot(conn, first, last):
+    return [dict(row) for row in conn.execute('''
+        SELECT p.id AS parking_id, p.name, p.total_slots,
+               (SELECT IFNULL(SUM(minutes), 0) FROM occupancy_hourly o
+                WHERE o.parking_id = p.id AND o.hour >= ? AND o.hour < ?) AS minutes
+        FROM parkings p
+    ''', (first, last))]
+
+
+def by_lot(date_from=None, date_to=None):
+    """Every lot's utilisation over the range, busiest first."""
+    first, last = _hours(date_from, date_to)
+    # Each shard's parkings copy lists just the lots it holds
+    rows = [row for rows in shards.fan_out(_by_lot, first, last) for row in rows]
+    for row in rows:
+        capacity = (row['total_slots'] or 0) * 60 * (last - first)
+        row['utilisation'] = round(row.pop('minutes') / capacity, 4) if capacity else 0.0
+    return sorted(rows, key=lambda row: row['utilisation'], reverse=True)
+
+
+class Refresher:
+    def __init__(self, interval=OCCUPANCY_INTERVAL, path=None):
+        self.interval = interval
+        self.path = path
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.applied = 0
+        self.last_run = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='occupancy-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self, conn):
+        started = time.perf_counter()
+        applied = refresh(conn)
+        self.runs += 1
+        self.applied += applied
+        self.last_run = {'at': datetime.now().strftime(TIME_FORMAT), 'applied': applied,
+                         'ms': round((time.perf_counter() - started) * 1000, 1)}
+        return self.last_run
+
+    def stats(self):
+        return {'interval': self.interval, 'runs': self.runs, 'applied': self.applied, 'last_run': self.last_run}
+
+    def _run(self):
+        conns = {path: db.connect(path) for path in ([self.path] if self.path else shards.paths())}
+        try:
+            while not self._stop.wait(self.interval):
+                for path, conn in conns.items():
+                    try:
+                        self.run_once(conn)
+                    except Exception as e:
+                        print(f"❌ Occupancy refresh of {path} failed: {e}")
+        finally:
+            for conn in conns.values():
+                conn.close()
+
+
+_refresher = Refresher()
+
+
+def start():
+    return _refresher.start()
+
+
+def stop():
+    _refresher.stop()
+
+
+def stats():
+    return _refresher.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain hourly occupancy per parking lot")
+    parser.add_argument('--every', type=float, help='keep refreshing every this many seconds')
+    parser.add_argument('--rebuild', action='store_true', help='recompute everything from the bookings')
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        for path in shards.paths():
+            conn = db.get_db(path)
+            started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rebuild(conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            hours = conn.execute("SELECT COUNT(*) FROM occupancy_hourly").fetchone()[0]
+            print(f"✅ {path}: {hours:,} lot-hours rebuilt in {time.perf_counter() - started:.1f} s")
+        return 0
+
+    while True:
+        for path in shards.paths():
+            run = _refresher.run_once(db.get_db(path))
+            print(f"✅ {path}: applied {run['applied']} booking change(s) in {run['ms']} ms")
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
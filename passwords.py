@@ -0,0 +1,160 @@
+"""Password hashing off the request thread.
+
+Password KDFs are deliberately slow. Run inline, a burst of logins would
+hold the CPU and the GIL while every other route waits. Here hashes run
+in a pool of HASH_WORKERS processes. At most HASH_MAX_PENDING may be
+queued or running at once; past that, callers get Busy straight away
+rather than piling up. Routes answer with "try again", not a timeout.
+HASH_WORKERS=0 hashes inline.
+
+PASSWORD_METHOD picks the KDF and its cost (any werkzeug method string).
+A user whose stored hash used other parameters is rehashed with the
+current ones the next time they log in.
+
+A successful check is remembered for PASSWORD_VERIFIED_TTL seconds, so
+logging in again with the same password skips the KDF. The key is an
+HMAC of the stored hash and the password under a random per-process key.
+It changes with the password and is never stored anywhere.
+"""
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import cache
+
+METHOD = os.environ.get('PASSWORD_METHOD', 'scrypt:32768:8:1')
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+MAX_PENDING = int(os.environ.get('HASH_MAX_PENDING', 32))
+TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 10))
+VERIFIED_TTL = float(os.environ.get('PASSWORD_VERIFIED_TTL', 300))
+
+
+class Busy(Exception):
+    """Too many hashes in flight; the caller should ask the client to retry."""
+
+
+class Hasher:
+    def __init__(self, workers=HASH_WORKERS, max_pending=MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self.hashed = 0
+        self.rejected = 0
+
+    def run(self, fn, *args):
+        """``fn(*args)`` in a worker process; raises Busy if the queue is full or it times out."""
+        if self.workers <= 0:
+            self._count('hashed')
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise Busy()
+        future = None
+        try:
+            future = self._executor().submit(fn, *args)
+            # A job we stop waiting for still holds a worker, so it keeps its slot until it ends
+            future.add_done_callback(self._release)
+            result = future.result(TIMEOUT)
+        except TimeoutError:
+            self._count('rejected')
+            raise Busy() from None
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool next time
+            with self._lock:
+                self._pool = None
+            raise Busy() from None
+        finally:
+            if future is None:
+                self._slots.release()
+        self._count('hashed')
+        return result
+
+    def _release(self, future):
+        self._slots.release()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # Spawned, not forked: the app process has writer threads running
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            hashed, rejected = self.hashed, self.rejected
+        return {'workers': self.workers, 'max_pending': self.max_pending, 'hashed': hashed,
+                'rejected': rejected, 'verified_hits': _verified_hits}
+
+
+hasher = Hasher()
+
+_verified = cache.LocalBackend(maxsize=10000)
+_verified_key = secrets.token_bytes(32)
+_verified_hits = 0
+_verified_lock = threading.Lock()
+
+
+def _fingerprint(stored, password):
+    return hmac.new(_verified_key, f"{stored}\0{password}".encode(), hashlib.sha256).digest()
+
+
+def hash_password(password):
+    return hasher.run(generate_password_hash, password, METHOD)
+
+
+def check(stored, password):
+    """True if ``password`` matches the ``stored`` hash. Raises Busy."""
+    global _verified_hits
+    key = _fingerprint(stored, password)
+    if VERIFIED_TTL > 0 and _verified.get(key) is True:
+        with _verified_lock:
+            _verified_hits += 1
+        return True
+    ok = hasher.run(check_password_hash, stored, password)
+    if ok and VERIFIED_TTL > 0:
+        _verified.set(key, True, VERIFIED_TTL)
+    return ok
+
+
+def needs_rehash(stored):
+    return not stored.startswith(METHOD + '$')
+
+
+def authenticate(conn, email, password):
+    """The user row for ``email`` if ``password`` is right, else None. Raises Busy.
+
+    Upgrades the stored hash to PASSWORD_METHOD on the way.
+    """
+    user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+    if not user or not check(user['password'], password):
+        return None
+    if needs_rehash(user['password']):
+        conn.execute("UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                     (hash_password(password), user['id'], user['password']))
+        conn.commit()
+        cache.invalidate_user(user['id'])
+    return user
+
+
+def close():
+    hasher.close()
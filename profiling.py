@@ -0,0 +1,277 @@
+"""Opt-in request and SQL profiling, exported as Prometheus metrics.
+
+Set SQL_PROFILE=1 (or call enable() before the first connection is made)
+and every connection from db.connect() times its statements: execute and
+every fetch, with the rows they return or change. The numbers are
+aggregated per Flask endpoint, or per thread name outside a request
+("journal-writer", "expiry-sweeper"). The first time a statement is seen
+it is EXPLAIN QUERY PLANned and flagged if it full-scans a table, using
+the same rules as queryplan.py. Statements slower than SLOW_QUERY_MS go to
+the "slow_sql" logger (stderr, or the file named by SLOW_QUERY_LOG).
+
+Disabled, connections are plain sqlite3 connections and no request hooks
+are installed, so the cost is nil.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+ENABLED = os.environ.get('SQL_PROFILE', '').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')
+
+# Listing every lot is the whole point of some pages, the per-lot
+# revenue rollup holds exactly one row per lot, and the archive has one
+# partition per month
+ALLOWED_SCANS = {
+    'SCAN p',
+    'SCAN parkings',
+    'SCAN revenue_by_lot',
+    'SCAN archive_partitions',
+}
+
+STATEMENT = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(\w+)')
+_CTE = re.compile(r'(?:WITH(?: RECURSIVE)?|,)\s*(\w+)\s*(?:\([^)]*\))?\s+AS\s*\(', re.IGNORECASE)
+
+slow_log = logging.getLogger('slow_sql')
+if not slow_log.handlers:
+    slow_log.addHandler(logging.FileHandler(SLOW_QUERY_LOG) if SLOW_QUERY_LOG else logging.StreamHandler())
+    slow_log.setLevel(logging.WARNING)
+    slow_log.propagate = False
+
+
+def full_scans(plan, sql=''):
+    """The plan lines of ``plan`` that scan a whole table and aren't allowed to."""
+    # Walking a CTE (e.g. a generated series) or a table-valued function
+    # like json_each over a bound parameter isn't a table scan
+    ctes = set(_CTE.findall(sql))
+    return [detail for detail in plan
+            if _SCAN.match(detail) and detail not in ALLOWED_SCANS
+            and 'VIRTUAL TABLE' not in detail
+            and _SCAN.match(detail).group(1) not in ctes]
+
+
+class Statement:
+    __slots__ = ('endpoint', 'sql', 'calls', 'seconds', 'rows', 'slow', 'scans')
+
+    def __init__(self, endpoint, sql, scans):
+        self.endpoint = endpoint
+        self.sql = sql
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.scans = scans
+
+    def as_dict(self):
+        return {'endpoint': self.endpoint, 'sql': ' '.join(self.sql.split()), 'calls': self.calls,
+                'total_ms': round(self.seconds * 1000, 3),
+                'mean_ms': round(self.seconds * 1000 / self.calls, 3) if self.calls else None,
+                'rows': self.rows, 'slow': self.slow, 'full_scans': self.scans}
+
+
+_lock = threading.Lock()
+_statements = {}   # (endpoint, sql) -> Statement
+_requests = {}     # endpoint -> [count, seconds]
+
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or request.path
+    return threading.current_thread().name
+
+
+def _statement(conn, sql, parameters):
+    key = (_endpoint(), sql)
+    stat = _statements.get(key)
+    if stat is None:
+        scans = []
+        if parameters is not None and STATEMENT.match(sql):
+            try:
+                # A plain cursor, so the EXPLAIN itself isn't profiled
+                plan = [row[3] for row in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+                scans = full_scans(plan, sql)
+            except sqlite3.Error:
+                pass
+        with _lock:
+            stat = _statements.setdefault(key, Statement(key[0], sql, scans))
+    return stat
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    _stat = None
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        self._stat = _statement(self.connection, sql, parameters)
+        self._elapsed = 0.0
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(time.perf_counter() - started, 0 if self.description else max(self.rowcount, 0), 1)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._stat = _statement(self.connection, sql, None)
+        self._elapsed = 0.0
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(time.perf_counter() - started, max(self.rowcount, 0), 1)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._record(time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._record(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._record(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._record(time.perf_counter() - started, 0)
+            raise
+        self._record(time.perf_counter() - started, 1)
+        return row
+
+    def _record(self, elapsed, rows, calls=0):
+        stat = self._stat
+        if stat is None:
+            return
+        before = self._elapsed
+        self._elapsed += elapsed
+        slow = before * 1000 < SLOW_QUERY_MS <= self._elapsed * 1000
+        with _lock:
+            stat.calls += calls
+            stat.seconds += elapsed
+            stat.rows += rows
+            stat.slow += slow
+        if slow:
+            slow_log.warning("slow query %.1f ms [%s]: %s", self._elapsed * 1000, stat.endpoint,
+                             ' '.join(stat.sql.split()))
+
+
+class ProfiledConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    return ProfiledConnection if ENABLED else sqlite3.Connection
+
+
+def enable(on=True):
+    """Profile connections made from now on; existing ones are unaffected."""
+    global ENABLED
+    ENABLED = on
+
+
+def init_app(app):
+    """Time every request per endpoint. A no-op unless profiling is enabled."""
+    if not ENABLED:
+        return
+
+    @app.before_request
+    def start_timer():
+        g._profile_started = time.perf_counter()
+
+    @app.teardown_request
+    def stop_timer(exc=None):
+        started = g.pop('_profile_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        with _lock:
+            totals = _requests.setdefault(request.endpoint or request.path, [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed
+
+
+def top(limit=20):
+    """The statements that have taken the most total time, slowest first."""
+    with _lock:
+        stats = sorted(_statements.values(), key=lambda stat: stat.seconds, reverse=True)[:limit]
+        return [stat.as_dict() for stat in stats]
+
+
+def reset():
+    with _lock:
+        _statements.clear()
+        _requests.clear()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    # Full precision: ':g' would print 1234567 as 1.23457e+06
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+def metrics(gauges=None, counters=None):
+    """Prometheus text exposition of request and SQL totals per endpoint, plus ``gauges`` and ``counters``.
+
+    Both map a metric name to ``(help, value)``. Counters only ever go up
+    and, by Prometheus convention, are named ``*_total``.
+    """
+    with _lock:
+        requests = {endpoint: tuple(totals) for endpoint, totals in _requests.items()}
+        per_endpoint = {}
+        for stat in _statements.values():
+            totals = per_endpoint.setdefault(stat.endpoint, [0, 0.0, 0, 0, 0])
+            totals[0] += stat.calls
+            totals[1] += stat.seconds
+            totals[2] += stat.rows
+            totals[3] += stat.slow
+            totals[4] += stat.calls if stat.scans else 0
+
+    families = [
+        ('app_http_requests_total', 'counter', 'Requests served', requests, 0),
+        ('app_http_request_seconds_total', 'counter', 'Time spent serving requests', requests, 1),
+        ('app_sql_queries_total', 'counter', 'SQL statements executed', per_endpoint, 0),
+        ('app_sql_seconds_total', 'counter', 'Time spent in SQL, execute and fetch', per_endpoint, 1),
+        ('app_sql_rows_total', 'counter', 'Rows returned or changed', per_endpoint, 2),
+        ('app_sql_slow_queries_total', 'counter', f'Statements slower than {SLOW_QUERY_MS:g} ms', per_endpoint, 3),
+        ('app_sql_full_scan_queries_total', 'counter', 'Executions of statements that plan a full table scan',
+         per_endpoint, 4),
+    ]
+    lines = []
+    for name, kind, help_text, series, index in families:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for endpoint, totals in sorted(series.items()):
+            lines.append(f'{name}{{endpoint="{_label(endpoint)}"}} {_number(totals[index])}')
+    for kind, values in (('counter', counters), ('gauge', gauges)):
+        for name, (help_text, value) in (values or {}).items():
+            if value is None:
+                continue
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {_number(value)}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,140 @@
+"""Bulk creation of parking lots and their spots.
+
+Each lot's spots are written by a single INSERT, and a batch of lots goes
+in under one transaction, so a multi-level garage or a city's worth
+of lots no longer means one INSERT round-trip per spot.
+"""
+import csv
+import io
+import json
+
+import db
+import shards
+
+SCHEMES = ('flat', 'level')
+FIELDS = ('name', 'address', 'pincode', 'price', 'slots', 'latitude', 'longitude', 'scheme', 'levels', 'rows', 'prefix')
+
+
+# Spot UIDs are generated inside SQLite from a recursive series, so a lot of
+# any size is one INSERT statement with no per-spot Python work.
+_SERIES = "WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < :count) "
+
+# flat:  A-1, A-2, ... (the original scheme; prefix sets the letter)
+_FLAT_SQL = _SERIES + """
+    INSERT INTO spots (parking_id, spot_uid)
+    SELECT :parking_id, :prefix || '-' || (i + 1) FROM n
+"""
+
+# level: L1-A1, L1-A2, ... L1-B1, ... L2-A1; spots are spread evenly over
+# `levels` floors of `rows` rows each. Rows are lettered A..Z, AA..ZZ.
+_LEVEL_SQL = _SERIES + """
+    INSERT INTO spots (parking_id, spot_uid)
+    SELECT :parking_id,
+           'L' || (i / :per_level + 1) || '-' ||
+           CASE WHEN (i % :per_level) / :per_row < 26
+                THEN char(65 + (i % :per_level) / :per_row)
+                ELSE char(64 + (i % :per_level) / :per_row / 26) || char(65 + (i % :per_level) / :per_row % 26)
+           END ||
+           ((i % :per_level) % :per_row + 1)
+    FROM n
+"""
+MAX_ROWS = 26 * 27
+
+
+def add_spots(conn, parking_id, count, scheme='flat', levels=1, rows=1, prefix='A'):
+    count = int(count)
+    if count <= 0:
+        return
+    if scheme == 'flat':
+        conn.execute(_FLAT_SQL, {'count': count, 'parking_id': parking_id, 'prefix': prefix})
+    elif scheme == 'level':
+        levels, rows = max(1, int(levels)), max(1, int(rows))
+        if rows > MAX_ROWS:
+            raise ValueError(f"At most {MAX_ROWS} rows per level")
+        per_level = -(-count // levels)
+        per_row = max(1, -(-per_level // rows))
+        conn.execute(_LEVEL_SQL, {'count': count, 'parking_id': parking_id,
+                                  'per_level': per_level, 'per_row': per_row})
+    else:
+        raise ValueError(f"Unknown spot UID scheme '{scheme}'")
+
+
+def _insert_lot(conn, parking_id, name, address, pincode, price, slots, latitude=None, longitude=None, **layout):
+    return conn.execute('''
+        INSERT INTO parkings (id, name, address, pincode, price_per_hour, total_slots, latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (parking_id, name, address, pincode, price, int(slots), latitude, longitude)).lastrowid
+
+
+def create_lot(conn, name, address, pincode, price, slots, latitude=None, longitude=None, parking_id=None, **layout):
+    """Insert one lot and all of its spots. Does not commit.
+
+    ``parking_id`` gives a shard's copy of a lot the id it has in the catalogue.
+    """
+    parking_id = _insert_lot(conn, parking_id, name, address, pincode, price, slots, latitude, longitude)
+    add_spots(conn, parking_id, slots, **layout)
+    return parking_id
+
+
+def _create_on_shards(conn, lots):
+    # The catalogue row and route first, for the id; then each shard's
+    # lots and spots in one transaction per shard
+    by_shard = {}
+    ids = []
+    for lot in lots:
+        parking_id = _insert_lot(conn, None, **lot)
+        by_shard.setdefault(shards.place(conn, parking_id, lot['pincode']), []).append(dict(lot, parking_id=parking_id))
+        ids.append(parking_id)
+    for n, shard_lots in by_shard.items():
+        shard = db.get_db(shards.path(n))
+        shard.execute("BEGIN IMMEDIATE")
+        try:
+            for lot in shard_lots:
+                create_lot(shard, **lot)
+            shard.commit()
+        except Exception:
+            shard.rollback()
+            raise
+    return ids
+
+
+def create_lots(conn, lots):
+    """Create many lots in one transaction; all or nothing. Returns their ids.
+
+    With sharding on, ``conn`` is the catalogue, which commits last. If a
+    shard fails, lots already written to other shards are left without a
+    catalogue row or route, so nothing can reach them.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = _create_on_shards(conn, lots) if shards.enabled() else [create_lot(conn, **lot) for lot in lots]
+        conn.commit()
+        return ids
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def parse_lots(data, filename=''):
+    """Parse an uploaded CSV or JSON list of lots into create_lot() kwargs.
+
+    Both formats use the admin form's field names: name, address, pincode,
+    price, slots, plus optional latitude, longitude, scheme, levels, rows
+    and prefix.
+    """
+    text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    if filename.lower().endswith('.json') or text.lstrip().startswith('['):
+        records = json.loads(text)
+    else:
+        records = list(csv.DictReader(io.StringIO(text)))
+
+    lots = []
+    for n, record in enumerate(records, start=1):
+        lot = {key: record[key] for key in FIELDS if record.get(key) not in (None, '')}
+        missing = [key for key in FIELDS[:5] if key not in lot]
+        if missing:
+            raise ValueError(f"Lot {n}: missing {', '.join(missing)}")
+        if lot.setdefault('scheme', 'flat') not in SCHEMES:
+            raise ValueError(f"Lot {n}: unknown scheme '{lot['scheme']}'")
+        lots.append(lot)
+    return lots
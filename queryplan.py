@@ -0,0 +1,213 @@
+"""Query-plan check: no route in app.py may full-scan a table.
+
+Drives every route through the Flask test client against a fresh database,
+captures the SQL each one actually runs, and EXPLAIN QUERY PLANs it. Exits
+non-zero if any statement plans a SCAN that isn't on the allow-list.
+
+    python queryplan.py
+    python queryplan.py -v      # print every plan
+
+python -m pytest runs it too, from tests/test_queryplan.py.
+"""
+import argparse
+import os
+import re
+import tempfile
+import threading
+from collections import defaultdict
+
+from flask import has_request_context, request
+from flask.testing import FlaskClient
+
+import archive
+import bench
+import db
+import occupancy
+import profiling
+import sweeper
+
+# FTS5 and R*Tree read their own shadow tables with schema-quoted SQL
+_SHADOW = re.compile(r"'main'\.'\w+'")
+
+
+def capture_statements():
+    """Patch db.connect so every connection reports its SQL, with its database, per endpoint."""
+    seen = defaultdict(list)
+    connect = db.connect
+
+    def traced_connect(path=None):
+        conn = connect(path)
+        path = path or db.DATABASE
+
+        def trace(sql):
+            if not profiling.STATEMENT.match(sql) or _SHADOW.search(sql):
+                return
+            thread = threading.current_thread().name
+            if has_request_context():
+                seen[request.endpoint].append((path, sql.strip()))
+            elif thread == 'journal-writer':
+                # Booking writes are projected by the journal's writer thread
+                seen['journal'].append((path, sql.strip()))
+            elif thread in ('expiry-sweeper', 'booking-archiver', 'occupancy-refresher'):
+                seen[thread].append((path, sql.strip()))
+
+        conn.set_trace_callback(trace)
+        return conn
+
+    db.connect = traced_connect
+    return seen
+
+
+def explain(conn, sql):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+class CheckedClient(FlaskClient):
+    """Test client that fails on any server error, so a broken route can't pass unnoticed."""
+
+    def open(self, *args, **kwargs):
+        response = super().open(*args, **kwargs)
+        assert response.status_code < 500, \
+            f"{response.request.method} {response.request.path} returned {response.status_code}"
+        return response
+
+
+def exercise_routes(app):
+    app.test_client_class = CheckedClient
+    user = bench.logged_in_client(app)
+    admin = bench.logged_in_client(app, user_id=2, is_admin=True)
+    anon = app.test_client()
+
+    user.get('/dashboard')
+    anon.post('/login', data={'email': 'test@test.com', 'password': 'Test@1234'})
+    user.get('/dashboard')
+    user.get('/dashboard?q=Central')
+    user.get('/dashboard?q=56')
+    user.get('/dashboard?lat=12.97&lng=77.59')
+    user.get('/parking/1/availability?start_time=2030-01-01T09:00&duration=2')
+    user.post('/book', data={'parking_id': 1, 'start_time': '2025-01-01T09:00',
+                             'duration': 2, 'vehicle_number': 'DL-1'})
+    user.post('/update_booking_status/1/ongoing')
+    user.post('/update_booking_status/1/completed')
+    user.post('/book', data={'parking_id': 1, 'start_time': '2025-01-01T09:00',
+                             'duration': 2, 'vehicle_number': 'DL-2'})
+    user.get('/profile')
+
+    admin.get('/admin')
+    admin.get('/admin/users')
+    admin.get('/admin/stats')
+    admin.get('/admin/parking/1')
+    admin.get('/admin/spot_details/1')
+    admin.get('/admin/parking/1/spot_details')
+    admin.get('/admin/parking/1/spot_details?ids=1,2,3')
+    admin.post('/admin/add_parking', data={'name': 'Plan Lot', 'address': 'Somewhere',
+                                           'pincode': '110001', 'price': 10, 'slots': 5})
+    admin.post('/admin/edit_parking/1', data={'name': 'City Center Parking', 'address': '123 Main Road, Delhi',
+                                              'pincode': '110011', 'price': 15})
+    admin.post('/admin/delete_spot/10')
+    admin.post('/admin/tariff/1', data={'first_hour_rate': '30', 'night_rate': '10', 'night_start': '22:00',
+                                        'night_end': '06:00', 'daily_cap': '250', 'grace_minutes': '15'})
+    admin.get('/admin/spot_details/1')
+    admin.get('/admin/cache_stats')
+    admin.get('/admin/export/bookings').get_data()
+    admin.get('/admin/export/bookings?from=2024-01-01&to=2024-12-31').get_data()
+    admin.get('/admin/export/revenue_by_lot').get_data()
+    admin.get('/admin/export/revenue_by_day?format=parquet').get_data()
+    user.get('/api/v1/lots?limit=2')
+    user.get('/api/v1/lots?after=1&fields=id,name')
+    user.get('/api/v1/lots?q=Central')
+    user.get('/api/v1/lots?lat=12.97&lng=77.59')
+    user.get('/api/v1/lots/2')
+    user.get('/api/v1/lots/2/availability?start_time=2030-01-01T09:00&duration=2&spots=1')
+    user.post('/api/v1/bookings', json={'parking_id': 2, 'start_time': '2030-01-01T09:00',
+                                        'duration': 2, 'vehicle_number': 'DL-API'})
+    user.get('/api/v1/bookings?status=active')
+    user.get('/api/v1/bookings?limit=5')
+    user.get('/api/v1/bookings/1')
+    user.post('/api/v1/bookings/1/complete')
+    user.get('/api/v1/summary')
+    admin.get('/admin/sweeper_stats')
+    admin.get('/admin/sql_profile')
+    anon.get('/metrics')
+
+    # One expiry pass, late enough to catch the bookings made above
+    def sweep():
+        conn = db.connect(db.DATABASE)
+        sweeper.sweep(conn, now='2031-01-01 00:00')
+        conn.close()
+    thread = threading.Thread(target=sweep, name='expiry-sweeper')
+    thread.start()
+    thread.join()
+
+    # Then archive everything that pass completed and read it back through the partitions
+    def archive_pass():
+        conn = db.connect(db.DATABASE)
+        archive.Archiver().run_once(conn, now='2031-06-01 00:00', compact_now=True)
+        conn.close()
+    thread = threading.Thread(target=archive_pass, name='booking-archiver')
+    thread.start()
+    thread.join()
+    user.get('/profile')
+    user.get('/dashboard')
+    user.get('/api/v1/bookings?limit=5')
+    user.get('/api/v1/bookings/1')
+    user.get('/api/v1/summary')
+    admin.get('/admin/archive_stats')
+    admin.get('/admin/export/bookings').get_data()
+
+    # Fold every booking change above into the hourly occupancy, then rebuild it from scratch
+    def refresh():
+        conn = db.connect(db.DATABASE)
+        occupancy.Refresher().run_once(conn)
+        occupancy.rebuild(conn)
+        conn.commit()
+        conn.close()
+    thread = threading.Thread(target=refresh, name='occupancy-refresher')
+    thread.start()
+    thread.join()
+    admin.get('/admin/occupancy')
+    admin.get('/admin/occupancy?from=2024-12-01&to=2025-01-31')
+    admin.get('/admin/occupancy/2?from=2024-12-01&to=2025-01-31')
+    admin.get('/admin/occupancy/999')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if any route's SQL does a full table scan")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        bench.setup_database(workdir, extra_spots=0)
+        seen = capture_statements()
+        # Run the routes through the profiling wrappers too, so they're checked as well
+        profiling.enable()
+        app = bench.make_app()
+        exercise_routes(app)
+
+        conns = {}
+        for endpoint, statements in sorted(seen.items()):
+            for path, sql in dict.fromkeys(statements):
+                if path not in conns:
+                    conns[path] = db.connect(path)
+                    conns[path].set_trace_callback(None)
+                plan = explain(conns[path], sql)
+                scans = profiling.full_scans(plan, sql)
+                if scans or args.verbose:
+                    print(f"[{endpoint}] {' '.join(sql.split())}")
+                    for detail in plan:
+                        print(f"    {'!!' if detail in scans else '  '} {detail}")
+                failures += bool(scans)
+        for conn in conns.values():
+            conn.close()
+        os.chdir(bench.ROOT)
+
+    if failures:
+        print(f"❌ {failures} statement(s) do a full table scan")
+        return 1
+    print(f"✅ No full table scans across {len(seen)} endpoints")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
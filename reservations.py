@@ -0,0 +1,48 @@
+"""Interval index over live bookings.
+
+Every booked/ongoing booking is mirrored into an R*Tree keyed on
+(start minute, end minute) x (parking id), so "which spots in lot X are
+taken between T1 and T2" is a logarithmic box query rather than a scan of
+the lot's bookings. Triggers on bookings keep it in sync; completed
+bookings drop out.
+
+Times are stored as minutes since the epoch, computed by SQLite from the
+same "YYYY-MM-DD HH:MM" strings the bookings table holds.
+"""
+
+_MINUTES = "CAST(strftime('%s', {}) AS INTEGER) / 60"
+
+# Spot ids in a lot with a live booking overlapping [:start, :end)
+BUSY_SPOTS_SQL = f'''
+    SELECT spot_id FROM booking_intervals
+    WHERE lot_lo <= :parking_id AND lot_hi >= :parking_id
+      AND start_min < {_MINUTES.format(':end')} AND end_min > {_MINUTES.format(':start')}
+'''
+
+
+def rebuild(conn):
+    conn.execute("DELETE FROM booking_intervals")
+    conn.execute(f'''
+        INSERT INTO booking_intervals (id, start_min, end_min, lot_lo, lot_hi, spot_id)
+        SELECT id,
+               MIN({_MINUTES.format('start_time')}, {_MINUTES.format('end_time')}),
+               MAX({_MINUTES.format('start_time')}, {_MINUTES.format('end_time')}),
+               parking_id, parking_id, spot_id
+        FROM bookings
+        WHERE status IN ('booked', 'ongoing')
+          AND strftime('%s', start_time) IS NOT NULL
+          AND strftime('%s', end_time) IS NOT NULL
+    ''')
+
+
+def free_spots(conn, parking_id, start, end):
+    """Spots in the lot with no live booking overlapping [start, end).
+
+    ``start``/``end`` are "YYYY-MM-DD HH:MM" strings, like bookings rows.
+    """
+    params = {'parking_id': int(parking_id), 'start': start, 'end': end}
+    return conn.execute(f'''
+        SELECT id, spot_uid, status FROM spots
+        WHERE parking_id = :parking_id AND id NOT IN ({BUSY_SPOTS_SQL})
+        ORDER BY spot_uid
+    ''', params).fetchall()
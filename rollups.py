@@ -0,0 +1,120 @@
+"""Pre-aggregated revenue for /admin/stats.
+
+Triggers on bookings fold each booking's cost into the rollup tables the
+moment it is marked completed (and adjust them if a completed booking is
+re-priced), so the stats page reads a few hundred rows at most no matter
+how much history there is. With sharding on, each shard keeps rollups for
+its own lots and revenue() adds them up. Rebuild from scratch with:
+
+    python rollups.py --backfill
+"""
+import argparse
+
+import archive
+import db
+import shards
+
+
+_ADD_DAILY = '''
+    INSERT INTO revenue_daily (day, revenue, bookings) VALUES (?, ?, ?)
+    ON CONFLICT(day) DO UPDATE SET revenue = revenue + excluded.revenue, bookings = bookings + excluded.bookings
+'''
+_ADD_LOT = '''
+    INSERT INTO revenue_by_lot (parking_id, revenue, bookings) VALUES (?, ?, ?)
+    ON CONFLICT(parking_id) DO UPDATE SET revenue = revenue + excluded.revenue, bookings = bookings + excluded.bookings
+'''
+_ADD_LOT_DAILY = '''
+    INSERT INTO revenue_lot_daily (day, parking_id, revenue, bookings) VALUES (?, ?, ?, ?)
+    ON CONFLICT(day, parking_id) DO UPDATE SET revenue = revenue + excluded.revenue, bookings = bookings + excluded.bookings
+'''
+
+
+def rebuild(conn, archived=()):
+    """Recompute the rollups from bookings plus ``archived`` (archive.revenue() rows). Does not commit."""
+    for table in ('revenue_daily', 'revenue_by_lot', 'revenue_lot_daily'):
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute('''
+        INSERT INTO revenue_lot_daily (day, parking_id, revenue, bookings)
+        SELECT DATE(end_time), parking_id, SUM(IFNULL(cost, 0)), COUNT(*)
+        FROM bookings WHERE status = 'completed' AND end_time IS NOT NULL
+        GROUP BY DATE(end_time), parking_id
+    ''')
+    conn.execute('''
+        INSERT INTO revenue_daily (day, revenue, bookings)
+        SELECT day, SUM(revenue), SUM(bookings) FROM revenue_lot_daily GROUP BY day
+    ''')
+    conn.execute('''
+        INSERT INTO revenue_by_lot (parking_id, revenue, bookings)
+        SELECT parking_id, SUM(IFNULL(cost, 0)), COUNT(*)
+        FROM bookings WHERE status = 'completed'
+        GROUP BY parking_id
+    ''')
+    # Archived bookings were folded in when they completed; add them back
+    for day, parking_id, amount, count in archived:
+        conn.execute(_ADD_DAILY, (day, amount, count))
+        conn.execute(_ADD_LOT, (parking_id, amount, count))
+        conn.execute(_ADD_LOT_DAILY, (day, parking_id, amount, count))
+
+
+def backfill(conn):
+    """Rebuild every rollup table from the bookings history in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rebuild(conn, archive.revenue(conn))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def revenue_by_lot(conn, date_from=None, date_to=None):
+    if date_from is None and date_to is None:
+        return conn.execute('''
+            SELECT p.name, SUM(revenue_by_lot.revenue) AS total_revenue
+            FROM revenue_by_lot
+            JOIN parkings p ON revenue_by_lot.parking_id = p.id
+            GROUP BY p.name
+        ''').fetchall()
+    return conn.execute('''
+        SELECT p.name, SUM(r.revenue) AS total_revenue
+        FROM revenue_lot_daily r
+        JOIN parkings p ON r.parking_id = p.id
+        WHERE r.day BETWEEN ? AND ?
+        GROUP BY p.name
+    ''', (date_from or '0000-00-00', date_to or '9999-12-31')).fetchall()
+
+
+def revenue_by_day(conn, date_from=None, date_to=None):
+    return conn.execute('''
+        SELECT day AS date, revenue AS daily_revenue
+        FROM revenue_daily
+        WHERE day BETWEEN ? AND ?
+        ORDER BY day ASC
+    ''', (date_from or '0000-00-00', date_to or '9999-12-31')).fetchall()
+
+
+def revenue(date_from=None, date_to=None):
+    """``(revenue_by_lot, revenue_by_day)`` summed over every shard."""
+    parts = shards.fan_out(lambda conn: (revenue_by_lot(conn, date_from, date_to),
+                                         revenue_by_day(conn, date_from, date_to)))
+    return (shards.combine([by_lot for by_lot, _ in parts], 'name', 'total_revenue'),
+            shards.combine([by_day for _, by_day in parts], 'date', 'daily_revenue'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the revenue rollup tables")
+    parser.add_argument('--backfill', action='store_true', help='rebuild rollups from bookings')
+    args = parser.parse_args(argv)
+
+    if args.backfill:
+        for path in shards.paths():
+            backfill(db.get_db(path))
+            print(f"✅ {path}: revenue rollups rebuilt from booking history")
+    by_lot, _ = revenue()
+    for row in by_lot:
+        print(f"{row['name']:<30} {row['total_revenue']:>12.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
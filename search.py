@@ -0,0 +1,89 @@
+"""Lot search: full-text over name/address/pincode and nearest-by-location.
+
+parkings_fts is an FTS5 trigram index (substring matches, like the old
+LIKE '%term%', but indexed and ranked by bm25) and parkings_geo an R*Tree
+over lot coordinates. Triggers on parkings keep both in sync with
+admin_add_parking / admin_edit_parking and bulk imports.
+"""
+import math
+
+LOT_COLUMNS = "p.id, p.name, p.address, p.pincode, p.price_per_hour, p.available_slots, p.total_slots, p.latitude, p.longitude"
+DEFAULT_LIMIT = 50
+EARTH_RADIUS_KM = 6371.0
+# Search radii tried in turn until enough lots are found
+RADII_KM = (2, 10, 50, 250, 1000, 20000)
+
+
+def rebuild(conn):
+    conn.execute("INSERT INTO parkings_fts (parkings_fts) VALUES ('rebuild')")
+    conn.execute("DELETE FROM parkings_geo")
+    conn.execute('''
+        INSERT INTO parkings_geo (id, min_lat, max_lat, min_lng, max_lng)
+        SELECT id, latitude, latitude, longitude, longitude FROM parkings
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ''')
+
+
+def search_parkings(conn, term, limit=DEFAULT_LIMIT):
+    """Lots whose name, address or pincode contains ``term``, best match first."""
+    term = (term or '').strip()
+    if len(term) < 3:
+        # Trigrams need three characters; very short terms only match pincode prefixes
+        return conn.execute(f'''
+            SELECT {LOT_COLUMNS} FROM parkings p
+            WHERE p.pincode >= ? AND p.pincode < ?
+            ORDER BY p.pincode LIMIT ?
+        ''', (term, term + '\uffff', limit)).fetchall()
+
+    phrase = '"' + term.replace('"', '""') + '"'
+    return conn.execute(f'''
+        SELECT {LOT_COLUMNS}
+        FROM parkings_fts
+        JOIN parkings p ON p.id = parkings_fts.rowid
+        WHERE parkings_fts MATCH ?
+        ORDER BY parkings_fts.rank
+        LIMIT ?
+    ''', (phrase, limit)).fetchall()
+
+
+def list_parkings(conn, after=0, limit=DEFAULT_LIMIT):
+    """Every lot in id order, one keyset page at a time."""
+    return conn.execute(f"SELECT {LOT_COLUMNS} FROM parkings p WHERE p.id > ? ORDER BY p.id LIMIT ?",
+                        (after or 0, limit)).fetchall()
+
+
+def parkings_in_pincode(conn, pincode, limit=DEFAULT_LIMIT):
+    return conn.execute(f"SELECT {LOT_COLUMNS} FROM parkings p WHERE p.pincode = ? LIMIT ?",
+                        (pincode, limit)).fetchall()
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def nearest_parkings(conn, lat, lng, limit=10):
+    """The ``limit`` closest lots to (lat, lng) as ``(distance_km, row)`` pairs.
+
+    Widens a bounding box over the R*Tree until it holds enough lots within
+    the radius, so only the neighbourhood is ever read.
+    """
+    lat, lng = float(lat), float(lng)
+    found = []
+    for radius in RADII_KM:
+        dlat = radius / 111.0
+        dlng = radius / max(1e-6, 111.0 * math.cos(math.radians(lat)))
+        rows = conn.execute(f'''
+            SELECT {LOT_COLUMNS}
+            FROM parkings_geo g
+            JOIN parkings p ON p.id = g.id
+            WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lng >= ? AND g.min_lng <= ?
+        ''', (lat - dlat, lat + dlat, lng - dlng, lng + dlng)).fetchall()
+        found = sorted(((distance_km(lat, lng, row['latitude'], row['longitude']), row) for row in rows),
+                       key=lambda pair: pair[0])
+        within = [pair for pair in found if pair[0] <= radius]
+        if len(within) >= limit:
+            return within[:limit]
+    return found[:limit]
@@ -0,0 +1,52 @@
+"""Production launcher.
+
+Serves asgi:application under uvicorn with several worker processes. Each
+worker has its own SQLite connection pool and DB thread pool; WAL lets
+them all read at once while bookings serialise on the write lock.
+
+SSE subscribers only see events published by their own worker, so run a
+single worker if live spot updates must reach every client.
+
+    python serve.py --workers 4 --port 8000
+    python serve.py --dev                 # Flask's threaded dev server
+"""
+import argparse
+import importlib
+import os
+
+
+def load(target, factory=False):
+    module, _, attr = target.partition(':')
+    obj = getattr(importlib.import_module(module), attr)
+    return obj() if factory else obj
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--app', default=None,
+                        help="module:attr to serve (default asgi:application, or app:app with --dev)")
+    parser.add_argument('--factory', action='store_true', help='--app names a function returning the app')
+    parser.add_argument('--dev', action='store_true', help="run Flask's threaded development server instead")
+    args = parser.parse_args(argv)
+
+    if args.dev:
+        app = load(args.app or 'app:app', args.factory)
+        print(f"🚗 Dev server on http://{args.host}:{args.port}")
+        app.run(host=args.host, port=args.port, threaded=True)
+        return
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("❌ uvicorn is not installed: pip install uvicorn (or run with --dev)")
+
+    print(f"🚗 Serving {args.app or 'asgi:application'} with {args.workers} worker(s) on http://{args.host}:{args.port}")
+    uvicorn.run(args.app or 'asgi:application', factory=args.factory, host=args.host, port=args.port,
+                workers=args.workers, lifespan='on', log_level='warning', access_log=False)
+
+
+if __name__ == '__main__':
+    main()
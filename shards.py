@@ -0,0 +1,167 @@
+"""Per-region shard databases for spots and bookings.
+
+With DB_SHARDS=N (N > 0), every parking lot lives in one of N shard
+databases next to data/user.db. The shard is chosen by the first digit
+of the lot's pincode, which is its postal region. A shard holds its
+lots' spots, bookings, booking journal, tariffs and rollups. It also
+holds a copy of their parkings rows, which carries the live
+available_slots counter. data/user.db stays the catalogue: users, the
+lot listing and search index, and lot_shards, which records where each
+lot was placed. A lot stays on its shard if its pincode is edited later.
+
+Each shard has its own write lock and its own journal writer, so
+bookings in different regions commit in parallel. Spot and booking ids
+start at n * ID_SPAN on shard n, so an id alone says which shard to
+open. Per-user pages and admin_stats query every shard at once with
+fan_out() and merge the results. Across shards, history pages are keyed
+on booking id, so they come grouped by shard rather than strictly by
+time.
+
+DB_SHARDS=0, the default, keeps everything in data/user.db as before.
+Every lookup here then resolves to it, and fan_out() runs inline.
+
+    DB_SHARDS=4 python init_db.py        # catalogue plus four shards
+    DB_SHARDS=4 python migrations.py     # upgrades the shards as well
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+SHARDS = int(os.environ.get('DB_SHARDS', 0))
+ID_SPAN = 2 ** 40
+
+_routes = {}  # parking_id -> shard, filled from lot_shards as lots are looked up
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def enabled():
+    return SHARDS > 0
+
+
+def count():
+    return max(SHARDS, 1)
+
+
+def path(n):
+    if not enabled():
+        return db.DATABASE
+    return os.path.join(os.path.dirname(db.DATABASE), f'shard-{n}.db')
+
+
+def paths():
+    return [path(n) for n in range(count())]
+
+
+def region(pincode):
+    """Shard number for a new lot in ``pincode``."""
+    pincode = str(pincode).strip()
+    first = int(pincode[0]) if pincode[:1].isdigit() else sum(map(ord, pincode))
+    return first % count()
+
+
+def place(conn, parking_id, pincode):
+    """Record a new lot's shard in the catalogue (``conn``). Does not commit."""
+    n = region(pincode)
+    conn.execute("INSERT INTO lot_shards (parking_id, shard) VALUES (?, ?)", (parking_id, n))
+    return n
+
+
+def for_lot(parking_id):
+    """Shard number holding lot ``parking_id``."""
+    if not enabled():
+        return 0
+    parking_id = int(parking_id)
+    n = _routes.get(parking_id)
+    if n is None:
+        row = db.get_db().execute("SELECT shard FROM lot_shards WHERE parking_id = ?", (parking_id,)).fetchone()
+        # An unknown lot isn't on any shard, so the first one answers "not found" as well as any
+        if row is None:
+            return 0
+        n = _routes[parking_id] = row['shard']
+    return n
+
+
+def for_id(row_id):
+    """Shard number holding the spot or booking ``row_id``."""
+    n = int(row_id) // ID_SPAN
+    return n if 0 <= n < count() else 0
+
+
+def lot_path(parking_id):
+    return path(for_lot(parking_id))
+
+
+def lot_db(parking_id):
+    return db.get_db(lot_path(parking_id))
+
+
+def id_path(row_id):
+    return path(for_id(row_id))
+
+
+def id_db(row_id):
+    return db.get_db(id_path(row_id))
+
+
+def prepare(conn, n):
+    """Start shard ``n``'s spot and booking ids at n * ID_SPAN."""
+    for table in ('spots', 'bookings'):
+        conn.execute('''
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+        ''', (table, n * ID_SPAN, table))
+    conn.commit()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(count(), thread_name_prefix='shard-fanout')
+    return _executor
+
+
+def fan_out(fn, *args):
+    """``[fn(conn, *args)]`` for every shard, run on all of them at once."""
+    if not enabled():
+        return [fn(db.get_db(), *args)]
+    # Pool threads have no app context, so each keeps its own connection per shard
+    return list(_pool().map(lambda shard: fn(db.get_db(shard), *args), paths()))
+
+
+def combine(results, key, *columns):
+    """Rows from every shard with the same ``key`` summed over ``columns``, in key order."""
+    # One shard's rows are already grouped and ordered by the query itself
+    if len(results) == 1:
+        return results[0]
+    totals = {}
+    for rows in results:
+        for row in rows:
+            entry = totals.setdefault(row[key], dict.fromkeys(columns, 0))
+            for column in columns:
+                entry[column] += row[column] or 0
+    return [dict({key: value}, **entry) for value, entry in sorted(totals.items())]
+
+
+def merged(results, key, reverse=False, limit=None):
+    """Rows from every shard in ``key`` order, the first ``limit`` of them."""
+    if len(results) == 1:
+        rows = results[0]
+    else:
+        rows = sorted((row for rows in results for row in rows), key=lambda row: row[key], reverse=reverse)
+    return rows[:limit] if limit is not None else rows
+
+
+def configure(shards):
+    """Switch to ``shards`` shards (0 for a single database) from now on."""
+    global SHARDS, _executor
+    with _executor_lock:
+        SHARDS = shards
+        _routes.clear()
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
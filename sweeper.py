@@ -0,0 +1,151 @@
+"""Expiry sweeper: closes bookings left live after their end time.
+
+A booking nobody starts or completes would otherwise hold its spot (and
+the lot's available_slots) forever. Every SWEEP_INTERVAL seconds the
+sweeper finds booked/ongoing bookings whose end_time is more than
+GRACE_MINUTES in the past, via a partial index on end_time over live
+bookings only. Each one is recorded as an "expire" event in the booking
+journal: completed and billed for its booked window, with its spot freed.
+The journal's writer commits them in batches, up to journal.MAX_BATCH
+events per transaction. With sharding on, each shard is swept in turn
+through its own journal.
+
+It runs in-process from the ASGI lifespan and `python app.py`. With
+several workers, set SWEEP_INTERVAL=0 and run one sweeper on its own
+instead. Concurrent sweeps are harmless, just wasted work.
+
+    python sweeper.py               # one pass
+    python sweeper.py --every 60    # run as a separate worker
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import bookings
+import db
+import events
+import journal
+import shards
+
+SWEEP_INTERVAL = float(os.environ.get('SWEEP_INTERVAL', 60))
+GRACE_MINUTES = int(os.environ.get('SWEEP_GRACE_MINUTES', 15))
+BATCH_SIZE = int(os.environ.get('SWEEP_BATCH_SIZE', 500))
+
+EXPIRED_SQL = '''
+    SELECT id, parking_id, spot_id FROM bookings INDEXED BY idx_bookings_live_end
+    WHERE status IN ('booked', 'ongoing') AND end_time < ?
+    ORDER BY end_time
+    LIMIT ?
+'''
+
+
+def sweep(conn, now=None, batch=BATCH_SIZE, path=None):
+    """Expire everything overdue as of ``now``; returns (bookings expired, spots reclaimed).
+
+    ``path`` is the database ``conn`` is connected to, if not db.DATABASE.
+    """
+    now = now or bookings.now_str()
+    cutoff = (datetime.strptime(now, bookings.TIME_FORMAT) - timedelta(minutes=GRACE_MINUTES)).strftime(bookings.TIME_FORMAT)
+    expired = reclaimed = 0
+    while True:
+        rows = conn.execute(EXPIRED_SQL, (cutoff, batch)).fetchall()
+        if not rows:
+            break
+        futures = [(row, journal.writer(path).submit('expire', {'booking_id': row['id'], 'cutoff': cutoff, 'now': now}))
+                   for row in rows]
+        for row, future in futures:
+            if future.result():
+                reclaimed += 1
+                events.spot_changed(conn, row['parking_id'], row['spot_id'], 'available')
+        expired += len(rows)
+        if len(rows) < batch:
+            break
+    return expired, reclaimed
+
+
+class Sweeper:
+    def __init__(self, interval=SWEEP_INTERVAL, path=None):
+        self.interval = interval
+        self.path = path
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.expired = 0
+        self.reclaimed = 0
+        self.last_run = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self, conn, now=None, path=None):
+        started = time.perf_counter()
+        expired, reclaimed = sweep(conn, now, path=path)
+        self.runs += 1
+        self.expired += expired
+        self.reclaimed += reclaimed
+        self.last_run = {'at': now or bookings.now_str(), 'expired': expired, 'spots_reclaimed': reclaimed,
+                         'ms': round((time.perf_counter() - started) * 1000, 1)}
+        return self.last_run
+
+    def stats(self):
+        return {'interval': self.interval, 'runs': self.runs, 'expired': self.expired,
+                'spots_reclaimed': self.reclaimed, 'last_run': self.last_run}
+
+    def _run(self):
+        conns = {path: db.connect(path) for path in ([self.path] if self.path else shards.paths())}
+        try:
+            while not self._stop.wait(self.interval):
+                for path, conn in conns.items():
+                    try:
+                        self.run_once(conn, path=path)
+                    except Exception as e:
+                        print(f"❌ Expiry sweep of {path} failed: {e}")
+        finally:
+            for conn in conns.values():
+                conn.close()
+
+
+_sweeper = Sweeper()
+
+
+def start():
+    return _sweeper.start()
+
+
+def stop():
+    _sweeper.stop()
+
+
+def stats():
+    return _sweeper.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Expire bookings left live past their end time")
+    parser.add_argument('--every', type=float, help='keep sweeping every this many seconds')
+    args = parser.parse_args(argv)
+
+    while True:
+        for path in shards.paths():
+            run = _sweeper.run_once(db.get_db(path), path=path)
+            print(f"✅ {path}: expired {run['expired']} booking(s), reclaimed {run['spots_reclaimed']} spot(s) "
+                  f"in {run['ms']} ms")
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench  # noqa: E402
+import db  # noqa: E402
+import provisioning  # noqa: E402
+
+
+# One throwaway database for the whole run: the connection pools and the
+# journal's writer thread hold on to data/user.db for the life of the process.
+# Tests keep out of each other's way by working in lots of their own.
+@pytest.fixture(scope='session')
+def workdir(tmp_path_factory):
+    cwd = os.getcwd()
+    path = tmp_path_factory.mktemp('parking')
+    bench.setup_database(str(path), extra_spots=0)
+    yield str(path)
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope='session')
+def app(workdir):
+    return bench.make_app()
+
+
+@pytest.fixture
+def conn(workdir):
+    conn = db.connect(db.DATABASE)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_lot(conn):
+    """Create a lot with ``slots`` spots at ``price`` an hour; returns its id."""
+    def make(slots=1, price=10):
+        parking_id = provisioning.create_lot(conn, 'Test Lot', 'Test Road', '999999', price, slots)
+        conn.commit()
+        return parking_id
+    return make
@@ -0,0 +1,36 @@
+"""Tariff rules price a stay, and completed bookings are charged by them."""
+import pytest
+
+import billing
+import bookings
+
+HOURLY = billing.flat(10)
+
+
+@pytest.mark.parametrize('rules, start, end, expected', [
+    ({}, '2025-03-01 09:00', '2025-03-01 11:30', 25.0),
+    ({'grace_minutes': 15}, '2025-03-01 09:00', '2025-03-01 09:10', 0.0),
+    ({'first_hour_rate': 30}, '2025-03-01 09:00', '2025-03-01 12:00', 50.0),
+    # Two hours before 22:00 at the day rate, two after at the night rate
+    ({'night_rate': 5, 'night_start': 22 * 60, 'night_end': 6 * 60}, '2025-03-01 20:00', '2025-03-02 00:00', 30.0),
+    ({'daily_cap': 100}, '2025-03-01 09:00', '2025-03-03 09:00', 200.0),
+])
+def test_cost(rules, start, end, expected):
+    tariff = HOURLY._replace(**rules)
+    assert billing.cost(start, end, tariff) == pytest.approx(expected)
+    assert billing.price_batch([billing.minutes(start)], [billing.minutes(end)], tariff) == [pytest.approx(expected)]
+
+
+def test_completed_booking_is_billed_and_rebilled_by_its_lots_tariff(conn, make_lot):
+    lot = make_lot(slots=1, price=10)
+    billing.set_tariff(conn, lot, first_hour_rate=30)
+    conn.commit()
+
+    booking = bookings.create(conn, 1, lot, 'DL-1', '2025-03-02T09:00', 3, now='2025-03-02 09:00')
+    bookings.complete(booking, now='2025-03-02 12:00')
+    assert bookings.get(conn, booking['id'], 1)['cost'] == 50.0
+
+    billing.set_tariff(conn, lot, daily_cap=25)
+    conn.commit()
+    assert billing.rebill(conn, '2025-03-02', lot) == 1
+    assert bookings.get(conn, booking['id'], 1)['cost'] == 25.0
@@ -0,0 +1,14 @@
+"""A small book_race run: concurrent bookings for one lot never share a spot."""
+import bench
+from bench.routes import post_book_race
+
+
+def test_book_race(app, workdir, conn):
+    # 60 claims from threads and processes on lot 2's 20 spots. bench.run
+    # re-raises anything that failed in its threads here.
+    bench.run('book_race', app, post_book_race, 8, 5)
+    bench.run_processes(workdir, 2, 10)
+
+    bench.check_allocations()
+    assert conn.execute("SELECT available_slots FROM parkings WHERE id = 2").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM spots WHERE parking_id = 2 AND status = 'occupied'").fetchone()[0] == 20
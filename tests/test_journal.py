@@ -0,0 +1,67 @@
+"""Booking events are journalled and projected into bookings and spots."""
+import json
+
+import pytest
+
+import bookings
+
+
+def spot_status(conn, spot_id):
+    return conn.execute("SELECT status FROM spots WHERE id = ?", (spot_id,)).fetchone()[0]
+
+
+def test_lifecycle_is_journalled_and_projected(conn, make_lot):
+    lot = make_lot(slots=1, price=20)
+    booking = bookings.create(conn, 1, lot, 'DL-1', '2025-02-01T09:00', 2, now='2025-02-01 08:00')
+    assert booking['status'] == 'booked'
+    assert spot_status(conn, booking['spot_id']) == 'available'
+
+    bookings.start(booking, now='2025-02-01 09:00')
+    started = bookings.get(conn, booking['id'], 1)
+    assert started['status'] == 'ongoing'
+    assert spot_status(conn, booking['spot_id']) == 'occupied'
+
+    bookings.complete(started, now='2025-02-01 10:30')
+    done = bookings.get(conn, booking['id'], 1)
+    assert (done['status'], done['end_time'], done['duration'], done['cost']) == \
+        ('completed', '2025-02-01 10:30', 1.5, 30.0)
+    assert spot_status(conn, booking['spot_id']) == 'available'
+
+    events = conn.execute("SELECT kind, payload FROM booking_events WHERE booking_id = ? ORDER BY id",
+                          (booking['id'],)).fetchall()
+    assert [event['kind'] for event in events] == ['create', 'start', 'complete']
+    assert json.loads(events[-1]['payload'])['at'] == '2025-02-01 10:30'
+
+
+def test_finished_booking_cannot_be_restarted_or_rebilled(conn, make_lot):
+    lot = make_lot(slots=1)
+    booking = bookings.create(conn, 1, lot, 'DL-1', '2025-02-02T09:00', 1, now='2025-02-02 09:00')
+    bookings.complete(booking, now='2025-02-02 10:00')
+    done = bookings.get(conn, booking['id'], 1)
+
+    with pytest.raises(bookings.InvalidTransition):
+        bookings.start(done)
+    with pytest.raises(bookings.InvalidTransition):
+        bookings.complete(done, now='2025-02-02 18:00')
+    # A stale row that still says ongoing is caught by the projection
+    with pytest.raises(bookings.InvalidTransition):
+        bookings.complete(dict(done, status='ongoing'), now='2025-02-02 18:00')
+    assert bookings.get(conn, booking['id'], 1)['cost'] == done['cost']
+
+
+def test_completing_an_overrun_keeps_the_next_reservation_parked(conn, make_lot):
+    lot = make_lot(slots=1)
+    now = '2025-02-03 08:00'
+    first = bookings.create(conn, 1, lot, 'DL-A', '2025-02-03T10:00', 1, now=now)
+    second = bookings.create(conn, 1, lot, 'DL-B', '2025-02-03T11:00', 1, now=now)
+    assert first['spot_id'] == second['spot_id']
+    spot = first['spot_id']
+
+    bookings.start(first, now='2025-02-03 10:00')
+    bookings.start(second, now='2025-02-03 11:00')
+    # A overstays its 10-11 window; B is already parked when A leaves
+    bookings.complete(bookings.get(conn, first['id'], 1), now='2025-02-03 11:30')
+    assert spot_status(conn, spot) == 'occupied'
+
+    bookings.complete(bookings.get(conn, second['id'], 1), now='2025-02-03 12:00')
+    assert spot_status(conn, spot) == 'available'
@@ -0,0 +1,13 @@
+"""queryplan.py as a test: no route or background thread may full-scan a table."""
+import os
+import subprocess
+import sys
+
+import bench
+
+
+def test_no_full_table_scans():
+    # A process of its own: the check patches db.connect and turns profiling on for good
+    result = subprocess.run([sys.executable, os.path.join(bench.ROOT, 'queryplan.py')], cwd=bench.ROOT,
+                            capture_output=True, text=True, timeout=600)
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,56 @@
+"""Time-window allocation: overlapping reservations never share a spot."""
+import pytest
+
+import allocation
+import bench
+import bookings
+
+NOW = '2099-01-01 08:00'
+
+
+def test_overlapping_window_is_refused(conn, make_lot):
+    lot = make_lot(slots=1)
+    first = bookings.create(conn, 1, lot, 'DL-1', '2099-01-01T09:00', 2, now=NOW)
+    assert first and not first['immediate']
+
+    # 10:00-11:00 overlaps 09:00-11:00 on the only spot
+    assert bookings.create(conn, 1, lot, 'DL-2', '2099-01-01T10:00', 1, now=NOW) is None
+    # Back to back is fine, and gets the same spot
+    after = bookings.create(conn, 1, lot, 'DL-3', '2099-01-01T11:00', 1, now=NOW)
+    assert after['spot_id'] == first['spot_id']
+    assert not allocation.find_collisions(conn)
+
+
+def test_overlap_takes_another_spot(conn, make_lot):
+    lot = make_lot(slots=2)
+    first = bookings.create(conn, 1, lot, 'DL-1', '2099-01-02T09:00', 2, now=NOW)
+    second = bookings.create(conn, 1, lot, 'DL-2', '2099-01-02T10:00', 2, now=NOW)
+    assert second['spot_id'] != first['spot_id']
+    assert bookings.create(conn, 1, lot, 'DL-3', '2099-01-02T10:30', 1, now=NOW) is None
+
+
+def test_availability_excludes_reserved_spots(app, conn, make_lot):
+    lot = make_lot(slots=2)
+    booked = bookings.create(conn, 1, lot, 'DL-1', '2099-01-03T09:00', 2, now=NOW)
+    client = bench.logged_in_client(app)
+
+    during = client.get(f'/parking/{lot}/availability?start_time=2099-01-03T10:00&duration=1').json
+    assert booked['spot_id'] not in [spot['spot_id'] for spot in during['spots']]
+    assert during['free_slots'] == 1
+    later = client.get(f'/parking/{lot}/availability?start_time=2099-01-03T11:00&duration=1').json
+    assert later['free_slots'] == 2
+
+
+@pytest.mark.parametrize('duration', [0, -3])
+def test_window_shorter_than_an_hour_is_rejected(app, conn, make_lot, duration):
+    lot = make_lot(slots=1)
+    with pytest.raises(ValueError):
+        bookings.window('2099-01-04T09:00', duration)
+
+    client = bench.logged_in_client(app)
+    assert client.get(f'/parking/{lot}/availability?start_time=2099-01-04T09:00&duration={duration}').status_code == 400
+    assert client.post('/api/v1/bookings', json={'parking_id': lot, 'start_time': '2099-01-04T09:00',
+                                                 'duration': duration, 'vehicle_number': 'DL-1'}).status_code == 400
+    client.post('/book', data={'parking_id': lot, 'start_time': '2099-01-04T09:00', 'duration': duration,
+                               'vehicle_number': 'DL-1'})
+    assert conn.execute("SELECT COUNT(*) FROM bookings WHERE parking_id = ?", (lot,)).fetchone()[0] == 0
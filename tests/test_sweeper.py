@@ -0,0 +1,25 @@
+"""The expiry sweep closes bookings left live past their end time."""
+import bookings
+import sweeper
+
+
+def test_overdue_bookings_are_expired_and_billed(conn, make_lot):
+    lot = make_lot(slots=2, price=10)
+    overdue = bookings.create(conn, 1, lot, 'DL-1', '2019-01-01T20:00', 3, now='2019-01-01 20:00')
+    # Ends at 23:50, inside the grace period at midnight
+    in_grace = bookings.create(conn, 1, lot, 'DL-2', '2019-01-01T22:50', 1, now='2019-01-01 22:50')
+
+    expired, reclaimed = sweeper.sweep(conn, now='2019-01-02 00:00')
+    assert (expired, reclaimed) == (1, 1)
+
+    closed = bookings.get(conn, overdue['id'], 1)
+    # Billed for the window booked, not the time until the sweep
+    assert (closed['status'], closed['end_time'], closed['duration'], closed['cost']) == \
+        ('completed', '2019-01-01 23:00', 3.0, 30.0)
+    assert conn.execute("SELECT status FROM spots WHERE id = ?", (overdue['spot_id'],)).fetchone()[0] == 'available'
+    assert bookings.get(conn, in_grace['id'], 1)['status'] == 'booked'
+
+    # Once its grace runs out too
+    assert sweeper.sweep(conn, now='2019-01-02 00:10') == (1, 1)
+    assert bookings.get(conn, in_grace['id'], 1)['status'] == 'completed'
+    assert conn.execute("SELECT available_slots FROM parkings WHERE id = ?", (lot,)).fetchone()[0] == 2
@@ -0,0 +1,99 @@
+"""Per-user booking totals and daily series for /profile.
+
+A user's summary is built lazily: the first profile view computes it in one
+pass over their completed bookings and stores it, after which triggers on
+bookings keep it current. Users who never open their profile cost nothing.
+With sharding on, every shard keeps summaries of the bookings it holds;
+overall() and history() combine them. Archived bookings (see archive.py)
+stay counted, and history pages read the archive partitions as well.
+"""
+import archive
+import shards
+
+PAGE_SIZE = 20
+HISTORY_COLUMNS = ('id', 'start_time', 'end_time', 'duration', 'cost', 'parking_name', 'spot_uid')
+
+
+def warm(conn, user_id):
+    """Build a user's summary in a single pass over their completed bookings."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM user_summary WHERE user_id = ?", (user_id,)).fetchone():
+            conn.rollback()
+            return
+        days = conn.execute('''
+            SELECT DATE(start_time) AS day, SUM(cost) AS cost, SUM(duration) AS duration, COUNT(*) AS bookings
+            FROM bookings
+            WHERE user_id = ? AND status = 'completed'
+            GROUP BY DATE(start_time)
+        ''', (user_id,)).fetchall() + archive.user_days(conn, user_id)
+        conn.executemany('''
+            INSERT INTO user_daily (user_id, day, cost, duration, bookings) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, day) DO UPDATE SET cost = cost + excluded.cost,
+                                                    duration = duration + excluded.duration,
+                                                    bookings = bookings + excluded.bookings
+        ''', [(user_id, d['day'], d['cost'] or 0, d['duration'] or 0, d['bookings'])
+              for d in days if d['day'] is not None])
+        conn.execute('''
+            INSERT INTO user_summary (user_id, total_duration, total_cost, bookings) VALUES (?, ?, ?, ?)
+        ''', (user_id, sum(d['duration'] or 0 for d in days), sum(d['cost'] or 0 for d in days),
+              sum(d['bookings'] for d in days)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def get_summary(conn, user_id):
+    """Return ``(summary, daily)`` for a user, warming the cache if needed."""
+    summary = conn.execute("SELECT * FROM user_summary WHERE user_id = ?", (user_id,)).fetchone()
+    if summary is None:
+        warm(conn, user_id)
+        summary = conn.execute("SELECT * FROM user_summary WHERE user_id = ?", (user_id,)).fetchone()
+    daily = conn.execute('''
+        SELECT day AS date, cost AS daily_cost, duration AS daily_duration
+        FROM user_daily
+        WHERE user_id = ? AND bookings > 0
+        ORDER BY day ASC
+    ''', (user_id,)).fetchall()
+    return summary, daily
+
+
+def booking_page(conn, user_id, before=None, limit=PAGE_SIZE):
+    """One page of completed bookings, newest first, keyed on booking id.
+
+    Returns ``(bookings, next_before)``; pass ``next_before`` back in as
+    ``before`` for the following page. It is None on the last page.
+    """
+    rows = conn.execute('''
+        SELECT b.id, b.start_time, b.end_time, b.duration, b.cost, p.name as parking_name, s.spot_uid
+        FROM bookings b
+        JOIN parkings p ON b.parking_id = p.id
+        JOIN spots s ON b.spot_id = s.id
+        WHERE b.user_id = ? AND b.status = 'completed' AND b.id < ?
+        ORDER BY b.id DESC
+        LIMIT ?
+    ''', (user_id, before if before is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+    rows = archive.merge_history(conn, rows, user_id, HISTORY_COLUMNS, limit + 1, before)
+    next_before = rows[limit - 1]['id'] if len(rows) > limit else None
+    return rows[:limit], next_before
+
+
+def overall(user_id):
+    """get_summary() over every shard: ``(totals, daily)``."""
+    parts = shards.fan_out(get_summary, user_id)
+    if len(parts) == 1:
+        return parts[0]
+    totals = {key: sum(summary[key] or 0 for summary, _ in parts)
+              for key in ('total_duration', 'total_cost', 'bookings')}
+    return totals, shards.combine([daily for _, daily in parts], 'date', 'daily_cost', 'daily_duration')
+
+
+def history(user_id, before=None, limit=PAGE_SIZE):
+    """booking_page() over every shard, merged on booking id."""
+    pages = shards.fan_out(booking_page, user_id, before, limit)
+    if len(pages) == 1:
+        return pages[0]
+    rows = shards.merged([rows for rows, _ in pages], 'id', reverse=True)
+    more = len(rows) > limit or any(next_before is not None for _, next_before in pages)
+    return rows[:limit], rows[limit - 1]['id'] if more else None
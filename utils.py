@@ -1,19 +1,17 @@
-import sqlite3
 import datetime
-from data.config import DATABASE
+
+import db
 
 def get_user_by_email(email):
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    conn = db.get_db()
     cur = conn.cursor()
     cur.execute("SELECT * FROM users WHERE email = ?", (email,))
     user = cur.fetchone()
-    conn.close()
     return user
 
 
 def dbcon():
-    return sqlite3.connect('parking.db')
+    return db.get_db('parking.db')
 
 
 
@@ -23,7 +21,6 @@ def get_user_by_name(name):
     q = "SELECT * FROM users WHERE username = ?"
     cur.execute(q, (name,))
     u = cur.fetchone()
-    con.close()
     return u
 
 
@@ -33,7 +30,6 @@ def add_user(name, passw):
     cur = con.cursor()
     cur.execute("INSERT INTO users (username, password) VALUES (?, ?)", (name, passw))
     con.commit()
-    con.close()
 
 
 
@@ -42,7 +38,6 @@ def get_lots_all():
     cur = con.cursor()
     cur.execute("SELECT * FROM parking_lot")
     d = cur.fetchall()
-    con.close()
     return d
 
 
@@ -52,7 +47,6 @@ def get_spot_avail(lotid):
     cur = con.cursor()
     cur.execute("SELECT id FROM parking_spot WHERE lot_id=? AND status='A'", (lotid,))
     spot = cur.fetchone()
-    con.close()
     return spot
 
 
@@ -62,7 +56,6 @@ def mark_spot(spotid, stat):
     cur = con.cursor()
     cur.execute("UPDATE parking_spot SET status=? WHERE id=?", (stat, spotid))
     con.commit()
-    con.close()
 
 
 
@@ -72,7 +65,6 @@ def create_booking(user_id, spot_id, cost):
     now = str(datetime.datetime.now())
     cur.execute("INSERT INTO bookings (spot_id, user_id, parking_time, cost_per_hour) VALUES (?, ?, ?, ?)", (spot_id, user_id, now, cost))
     con.commit()
-    con.close()
 
 
 
@@ -82,4 +74,3 @@ def free_booking(spot_id):
     now = str(datetime.datetime.now())
     cur.execute("UPDATE bookings SET leaving_time = ? WHERE spot_id = ? AND leaving_time IS NULL", (now, spot_id))
     con.commit()
-    con.close()
@@ -0,0 +1,12 @@
+"""Per-lot change counters.
+
+parkings.version is bumped by triggers whenever anything shown about a lot
+changes: its own details, any of its spots, or any booking in it. Anything
+derived from a lot (ETags, cached pages) can key on the version and never
+needs explicit invalidation.
+"""
+
+
+def lot_version(conn, parking_id):
+    row = conn.execute("SELECT version FROM parkings WHERE id = ?", (parking_id,)).fetchone()
+    return row['version'] if row else None